@@ -0,0 +1,108 @@
+"""
+Compares the JSON codecs that are available to Rally on typical bulk responses, bulk lines and metrics documents.
+
+Usage: python3 benchmarks/json_codec.py [--iterations 200] [--bulk-size 5000]
+
+Only codecs that are installed are compared (the standard library's json module is always available).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from esrally.utils import codec
+
+
+def bulk_response(bulk_size, errors=False):
+    # an unfiltered bulk response as returned by Elasticsearch 5.x
+    items = []
+    for i in range(bulk_size):
+        status = 429 if errors and i % 10 == 0 else 201
+        item = {
+            "_index": "logs-181998",
+            "_type": "type",
+            "_id": "AVbmj0b5M4mVOqbDk8a%05d" % i,
+            "_version": 1,
+            "result": "created",
+            "_shards": {"total": 2, "successful": 1, "failed": 0},
+            "created": True,
+            "status": status
+        }
+        if status == 429:
+            item["error"] = {"type": "es_rejected_execution_exception",
+                             "reason": "rejected execution of org.elasticsearch.transport.TransportService on EsThreadPoolExecutor"}
+        items.append({"index": item})
+    return {"took": 123, "errors": errors, "items": items}
+
+
+def filtered_bulk_response(bulk_size):
+    # the response that Rally's bulk runner requests (errors flag and item status only)
+    return {"errors": False, "items": [{"index": {"status": 201}} for _ in range(bulk_size)]}
+
+
+def bulk_lines(bulk_size):
+    lines = []
+    for i in range(bulk_size):
+        lines.append({"index": {"_index": "logs-181998", "_type": "type", "_id": "%10d" % i}})
+        lines.append({"@timestamp": 893964617, "clientip": "40.135.0.0", "request": "GET /images/hm_bg.jpg HTTP/1.0", "status": 200,
+                      "size": 24736})
+    return lines
+
+
+def metrics_documents(count):
+    docs = []
+    for i in range(count):
+        docs.append({
+            "@timestamp": 1470838595000 + i,
+            "relative-time": i * 1000,
+            "trial-timestamp": "20160810T142635Z",
+            "environment": "nightly",
+            "track": "logging",
+            "challenge": "append-no-conflicts",
+            "car": "defaults",
+            "name": "service_time",
+            "value": 12.345 + i / 1000,
+            "unit": "ms",
+            "sample-type": "normal",
+            "meta": {"source_revision": "a1b2c3d", "distribution_version": "5.0.0", "tag_license": "oss"},
+            "operation": "index-append",
+            "operation-type": "index"
+        })
+    return docs
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the JSON codecs available to Rally")
+    parser.add_argument("--iterations", type=int, default=200, help="number of iterations per workload")
+    parser.add_argument("--bulk-size", type=int, default=5000, help="number of items per bulk request")
+    args = parser.parse_args()
+
+    codecs = codec.available_codecs()
+    workloads = []
+    for name, data in [("bulk response (decode)", bulk_response(args.bulk_size)),
+                       ("bulk response with rejections (decode)", bulk_response(args.bulk_size, errors=True)),
+                       ("filtered bulk response (decode)", filtered_bulk_response(args.bulk_size))]:
+        serialized = codecs[-1].dumps(data)
+        workloads.append((name, lambda c, s=serialized: c.loads(s)))
+    lines = bulk_lines(args.bulk_size)
+    workloads.append(("bulk lines (encode)", lambda c: [c.dumps(line) for line in lines]))
+    docs = metrics_documents(args.bulk_size)
+    workloads.append(("metrics documents (encode)", lambda c: [c.dumps(doc) for doc in docs]))
+
+    print("%-40s" % "workload" + "".join("%14s" % ("%s [ms]" % c.name) for c in codecs))
+    for name, workload in workloads:
+        durations = [measure(lambda: workload(c), args.iterations) * 1000 for c in codecs]
+        print("%-40s" % name + "".join("%14.3f" % d for d in durations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Compares the vectorized (numpy-based) and the pure Python throughput calculation of the driver.
+
+Usage: python3 benchmarks/throughput_calculation.py [--sizes 100000,1000000,10000000] [--max-python-size 1000000]
+
+The pure Python variant materializes one Sample object per sample so it is skipped for large sample counts by default.
+"""
+import argparse
+import array
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from esrally import metrics, track
+from esrally.driver import driver
+
+
+def create_samples(size, clients=8, ops_per_second=20000):
+    import numpy as np
+    rnd = np.random.RandomState(42)
+    op = track.Operation("index-append", track.OperationType.Index)
+    samples = driver.SampleBuffer()
+    samples.operations = [op]
+    samples.units = ["docs"]
+    absolute_times = 1470838595 + np.sort(rnd.uniform(0, size / ops_per_second, size))
+    columns = {
+        "client_id": rnd.randint(0, clients, size).astype("q"),
+        "absolute_time": absolute_times,
+        "relative_time": absolute_times - 1470838590,
+        "operation": np.zeros(size, dtype="i"),
+        "sample_type": np.where(np.arange(size) < size // 10, int(metrics.SampleType.Warmup), int(metrics.SampleType.Normal)).astype("b"),
+        "latency_ms": rnd.exponential(20, size),
+        "service_time_ms": rnd.exponential(15, size),
+        "total_ops": np.full(size, 5000.0),
+        "total_ops_unit": np.zeros(size, dtype="i"),
+        "time_period": rnd.uniform(0, 1, size),
+        "curr_iteration": np.arange(size, dtype="q"),
+        "total_iterations": np.full(size, size, dtype="q")
+    }
+    for name, type_code in driver.SampleBuffer.COLUMNS:
+        samples.columns[name] = array.array(type_code, columns[name].astype(type_code).tobytes())
+    return samples
+
+
+def run(samples, vectorized):
+    start = time.perf_counter()
+    calculator = driver.ThroughputCalculator(vectorized=vectorized)
+    calculator.add(samples)
+    throughput = calculator.calculate()
+    averaged = {op: driver.moving_average(records) if vectorized else driver._moving_average(records)
+                for op, records in throughput.items()}
+    return time.perf_counter() - start, averaged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks throughput calculation of Rally's driver")
+    parser.add_argument("--sizes", default="100000,1000000,10000000", help="comma-separated list of sample counts")
+    parser.add_argument("--max-python-size", type=int, default=1000000, help="largest sample count for the pure Python variant")
+    args = parser.parse_args()
+
+    print("%12s %14s %14s %10s" % ("samples", "python [s]", "numpy [s]", "speedup"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        samples = create_samples(size)
+        vectorized_duration, vectorized_result = run(samples, vectorized=True)
+        if size <= args.max_python_size:
+            python_duration, python_result = run(samples, vectorized=False)
+            if python_result != vectorized_result:
+                raise AssertionError("Results differ for [%d] samples" % size)
+            print("%12d %14.3f %14.3f %9.1fx" % (size, python_duration, vectorized_duration, python_duration / vectorized_duration))
+        else:
+            print("%12d %14s %14.3f %10s" % (size, "-", vectorized_duration, "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,90 @@
-import gzip
+import itertools
+import zlib
 import urllib3
 import logging
 import elasticsearch
 import certifi
 
+from esrally import exceptions
+from esrally.utils import codec
+
 logger = logging.getLogger("rally.client")
 
 
+class CompressedBody(bytes):
+    """
+    A request body that has already been compressed. ``raw_size`` is the size of the body in bytes before compression.
+    """
+
+    def __new__(cls, data, raw_size):
+        body = super().__new__(cls, data)
+        body.raw_size = raw_size
+        return body
+
+
+class Compressor:
+    """
+    Compresses request bodies with the configured algorithm and level.
+
+    Supported algorithms are "gzip" and "deflate" (the zlib format) which correspond to the HTTP content codings of the same name.
+    """
+
+    # maps algorithm names to the zlib window bits of the respective format
+    WINDOW_BITS = {
+        "gzip": 16 + zlib.MAX_WBITS,
+        "deflate": zlib.MAX_WBITS
+    }
+    DEFAULT_ALGORITHM = "gzip"
+    DEFAULT_LEVEL = 9
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, level=DEFAULT_LEVEL):
+        if algorithm not in Compressor.WINDOW_BITS:
+            raise exceptions.SystemSetupError("Unknown compression algorithm [%s]. Valid values are %s."
+                                              % (algorithm, sorted(Compressor.WINDOW_BITS.keys())))
+        if not 0 <= level <= 9:
+            raise exceptions.SystemSetupError("Compression level must be between 0 and 9 but was [%s]." % str(level))
+        self.algorithm = algorithm
+        self.level = level
+        self.window_bits = Compressor.WINDOW_BITS[algorithm]
+
+    @property
+    def content_encoding(self):
+        return self.algorithm
+
+    def compress(self, body):
+        """
+        :param body: A request body as ``bytes``. Bodies that have already been compressed are returned as is.
+        :return: The compressed body as ``CompressedBody``.
+        """
+        if isinstance(body, CompressedBody):
+            return body
+        # zlib cannot reset a compression object and copying a primed one per body is not faster than creating a new one. We cannot
+        # use zlib.compress() as it accepts window bits only as of Python 3.11.
+        c = zlib.compressobj(self.level, zlib.DEFLATED, self.window_bits)
+        return CompressedBody(c.compress(body) + c.flush(), len(body))
+
+
+def compressor_for(client_options):
+    """
+    :param client_options: A dict of client options.
+    :return: A ``Compressor`` if request compression is enabled with the client option "compressed" and ``None`` otherwise. The client
+             options "compression_algorithm" and "compression_level" configure the compressor.
+    """
+    if client_options.get("compressed", False):
+        return Compressor(client_options.get("compression_algorithm", Compressor.DEFAULT_ALGORITHM),
+                          client_options.get("compression_level", Compressor.DEFAULT_LEVEL))
+    else:
+        return None
+
+
 class PoolWrap(object):
-    def __init__(self, pool, compressed=False, **kwargs):
+    def __init__(self, pool, compressor=None, **kwargs):
         self.pool = pool
-        self.compressed = compressed
+        self.compressor = compressor
 
     def urlopen(self, method, url, body, retries, headers, **kw):
-        if body is not None and self.compressed:
-            body = gzip.compress(body)
+        if body is not None and self.compressor is not None:
+            body = self.compressor.compress(body)
         return self.pool.urlopen(method, url, body=body, retries=retries, headers=headers, **kw)
 
     def __getattr__(self, attr_name):
@@ -22,12 +92,122 @@ class PoolWrap(object):
 
 
 class ConfigurableHttpConnection(elasticsearch.Urllib3HttpConnection):
-    def __init__(self, compressed=False, **kwargs):
+    def __init__(self, compressed=False, compression_algorithm=Compressor.DEFAULT_ALGORITHM, compression_level=Compressor.DEFAULT_LEVEL,
+                 **kwargs):
         super(ConfigurableHttpConnection, self).__init__(**kwargs)
         if compressed:
+            # Compressor keeps no state between bodies; it only holds the configured algorithm and level
+            compressor = Compressor(compression_algorithm, compression_level)
             self.headers.update(urllib3.make_headers(accept_encoding=True))
-            self.headers.update({"Content-Encoding": "gzip"})
-        self.pool = PoolWrap(self.pool, **kwargs)
+            self.headers.update({"Content-Encoding": compressor.content_encoding})
+        else:
+            compressor = None
+        self.pool = PoolWrap(self.pool, compressor, **kwargs)
+
+
+class CodecSerializer(elasticsearch.JSONSerializer):
+    """
+    Serializes and deserializes JSON with the fastest available JSON codec (see ``esrally.utils.codec``).
+    """
+
+    def loads(self, s):
+        try:
+            return codec.loads(s)
+        except (ValueError, TypeError) as e:
+            raise elasticsearch.SerializationError(s, e)
+
+    def dumps(self, data):
+        # don't serialize strings
+        if isinstance(data, str):
+            return data
+        try:
+            # the client joins serialized bulk lines as strings
+            return codec.dumps(data).decode("utf-8")
+        except (ValueError, TypeError) as e:
+            raise elasticsearch.SerializationError(data, e)
+
+
+class BytesPassThroughSerializer(CodecSerializer):
+    """
+    Sends request bodies that are already serialized (e.g. bulk bodies) as is and serializes everything else as JSON.
+    """
+
+    def dumps(self, data):
+        if isinstance(data, bytes):
+            return data
+        elif isinstance(data, (bytearray, memoryview)):
+            # the client expects request bodies to be either str or bytes
+            return bytes(data)
+        return super().dumps(data)
+
+
+class LeanTransport:
+    """
+    A minimal HTTP transport for the benchmark hot path. It keeps a persistent (keep-alive) connection pool per host, sends requests with a
+    pre-built path and an already serialized body and returns the raw response without deserializing it. Hosts are selected round-robin.
+
+    The pools are shared by all clients of a load generator. Each pool holds at most ``maxsize`` connections (client option, the driver
+    sets it to the number of clients of the load generator) and blocks if all of them are in use so clients wait for a connection to
+    become available instead of opening additional connections that are closed right after the request.
+
+    Contrary to ``elasticsearch.Transport``, it neither sniffs nor retries and does not mark hosts as dead.
+    """
+
+    def __init__(self, hosts, client_options):
+        """
+        :param hosts: A list of dicts with the keys "host" and "port".
+        :param client_options: The same client options as for the Elasticsearch client. Only connection related options are supported.
+        """
+        self.headers = {"content-type": "application/json"}
+        compressor = compressor_for(client_options)
+        if compressor is not None:
+            self.headers.update(urllib3.make_headers(accept_encoding=True))
+            self.headers["content-encoding"] = compressor.content_encoding
+        http_auth = client_options.get("http_auth")
+        if http_auth:
+            # like elasticsearch.Urllib3HttpConnection, accept either "user:password" or a (user, password) pair
+            if isinstance(http_auth, (tuple, list)):
+                http_auth = ":".join(http_auth)
+            self.headers.update(urllib3.make_headers(basic_auth=http_auth))
+
+        pool_options = {
+            "maxsize": client_options.get("maxsize", 10),
+            "block": True,
+            "timeout": urllib3.Timeout(total=client_options.get("timeout", 10)),
+            "retries": False
+        }
+        use_ssl = client_options.get("use_ssl", False)
+        if use_ssl:
+            pool_class = urllib3.HTTPSConnectionPool
+            if client_options.get("verify_certs", False):
+                pool_options["cert_reqs"] = "CERT_REQUIRED"
+                pool_options["ca_certs"] = client_options.get("ca_certs")
+            else:
+                pool_options["cert_reqs"] = "CERT_NONE"
+        else:
+            pool_class = urllib3.HTTPConnectionPool
+        self.pools = [PoolWrap(pool_class(host["host"], host.get("port", 9200), **pool_options), compressor) for host in hosts]
+        self._next_pool = itertools.cycle(self.pools)
+
+    def perform_request(self, method, path, body=None):
+        """
+        :param method: The HTTP method.
+        :param path: The absolute path of the request including the query string (without host).
+        :param body: An already serialized request body as ``bytes``. Optional.
+        :return: A pair of the HTTP status code and the raw response body as ``bytes``.
+        """
+        pool = next(self._next_pool)
+        try:
+            response = pool.urlopen(method, path, body, retries=False, headers=self.headers)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise elasticsearch.ConnectionTimeout("TIMEOUT", str(e), e)
+        except urllib3.exceptions.HTTPError as e:
+            raise elasticsearch.ConnectionError("N/A", str(e), e)
+        return response.status, response.data
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
 
 
 class EsClientFactory:
@@ -35,14 +215,25 @@ class EsClientFactory:
     Abstracts how the Elasticsearch client is created. Intended for testing.
     """
 
-    def __init__(self, hosts, client_options):
+    def __init__(self, hosts, client_options, lean_transport=False):
+        """
+        :param hosts: A list of dicts with the keys "host" and "port".
+        :param client_options: A dict of options that are passed to the Elasticsearch client.
+        :param lean_transport: If ``True``, the client additionally provides a ``LeanTransport`` as attribute ``lean_transport``.
+
+        The client provides the compressor for request bodies as attribute ``compressor`` (``None`` if compression is disabled).
+        """
         logger.info("Creating ES client connected to %s with options [%s]" % (hosts, client_options))
         if self._is_set(client_options, "use_ssl") and self._is_set(client_options, "verify_certs") and "ca_certs" not in client_options:
             client_options["ca_certs"] = certifi.where()
         if self._is_set(client_options, "basic_auth_user") and self._is_set(client_options, "basic_auth_password"):
             # Maybe we should remove these keys from the dict?
             client_options["http_auth"] = (client_options["basic_auth_user"], client_options["basic_auth_password"])
-        self.client = elasticsearch.Elasticsearch(hosts=hosts, connection_class=ConfigurableHttpConnection, **client_options)
+        self.client = elasticsearch.Elasticsearch(hosts=hosts, connection_class=ConfigurableHttpConnection,
+                                                  serializer=BytesPassThroughSerializer(), **client_options)
+        self.client.compressor = compressor_for(client_options)
+        if lean_transport:
+            self.client.lean_transport = LeanTransport(hosts, client_options)
 
     def _is_set(self, client_opts, k):
         try:
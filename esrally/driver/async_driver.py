@@ -0,0 +1,101 @@
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+from esrally.driver import driver
+
+logger = logging.getLogger("rally.driver")
+
+
+def execute_concurrently(es, client_schedules):
+    """
+    Runs the schedules of several clients concurrently on a single asyncio event loop.
+
+    Requests are paced on the event loop. As parameter sources and the Elasticsearch client are blocking, requests are prepared and
+    executed on a thread pool which is shared by all clients (as is the connection pool of the Elasticsearch client). The event loop
+    thread itself never blocks so a slow parameter source or request of one client does not delay the pacing of other clients.
+
+    :param es: Elasticsearch client that is shared by all clients.
+    :param client_schedules: A dict with the client id as key and a list of (schedule, sampler, open_loop, pacer) tuples as value. Each
+                             client executes its schedules in order.
+    """
+    loop = asyncio.new_event_loop()
+    # Threads are only started on demand, i.e. the pool grows to the number of requests that are actually in flight at the same time.
+    # A client prepares at most one request at a time and has at most one request in flight unless it uses open-loop scheduling.
+    max_workers = 0
+    for schedules in client_schedules.values():
+        max_workers += 1 + max(driver.OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS if open_loop else 0 for _, _, open_loop, _ in schedules)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        loop.run_until_complete(_execute_all(loop, pool, es, client_schedules))
+    finally:
+        pool.shutdown(wait=False)
+        loop.close()
+
+
+async def _execute_all(loop, pool, es, client_schedules):
+    await asyncio.gather(*[execute_schedules(loop, pool, schedules, es) for schedules in client_schedules.values()])
+
+
+async def execute_schedules(loop, pool, schedules, es):
+    for schedule, sampler, open_loop, pacer in schedules:
+        await execute_schedule(loop, pool, schedule, es, sampler, open_loop, pacer)
+
+
+async def execute_schedule(loop, pool, schedule, es, sampler, open_loop=False, pacer=None):
+    """
+    Executes tasks according to the schedule for a given operation. This is the asyncio counterpart of ``driver.execute_schedule``.
+
+    :param loop: The event loop on which this schedule is executed.
+    :param pool: The thread pool on which requests are prepared and executed.
+    :param schedule: The schedule for this operation.
+    :param es: Elasticsearch client that will be used to execute the operation.
+    :param sampler: A container to store raw samples.
+    :param open_loop: If True, requests are issued at their scheduled time even if previous requests have not completed yet.
+    :param pacer: Determines when throttled requests are issued. Optional.
+    """
+    if pacer is None:
+        pacer = driver.Pacer()
+    requests = driver.scheduled_requests(schedule, sampler, pacer)
+    in_flight = set()
+    # noinspection PyBroadException
+    try:
+        while True:
+            # parameter sources may read from disk, compress or block on a queue
+            request = await loop.run_in_executor(pool, next, requests, None)
+            if request is None:
+                break
+            if request.throughput_throttled:
+                request.add_schedule_lag(await wait(pacer, request.issue_time))
+            if open_loop:
+                if len(in_flight) >= driver.OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    driver.raise_on_error(done)
+                in_flight.add(loop.run_in_executor(pool, request.execute, es))
+            else:
+                await loop.run_in_executor(pool, request.execute, es)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    except BaseException:
+        logger.exception("Could not execute schedule")
+        raise
+
+
+async def wait(pacer, target):
+    """
+    Waits until ``target`` is reached without blocking the event loop. This is the asyncio counterpart of ``driver.Pacer#wait``.
+
+    :param pacer: The pacer that determines the spin threshold.
+    :param target: A point in time in terms of ``time.perf_counter()``.
+    :return: The schedule lag in seconds.
+    """
+    rest = target - time.perf_counter()
+    if rest > pacer.spin_threshold:
+        await asyncio.sleep(rest - pacer.spin_threshold)
+    now = time.perf_counter()
+    while now < target:
+        # let other clients proceed while spinning
+        await asyncio.sleep(0)
+        now = time.perf_counter()
+    return now - target
@@ -1,16 +1,28 @@
+import array
+import bisect
 import concurrent.futures
 import datetime
-import json
 import logging
+import math
 import queue
+import random
 import socket
+import threading
 import time
+import weakref
 
 import elasticsearch
 import thespian.actors
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional; it only speeds up post-processing of samples
+    np = None
+
 from esrally import exceptions, metrics, track, client, PROGRAM_NAME
 from esrally.driver import runner
-from esrally.utils import convert, console, versions
+from esrally.utils import convert, console, versions, sysstats, histogram, codec
 
 logger = logging.getLogger("rally.driver")
 
@@ -41,17 +53,17 @@ class StartLoadGenerator:
     Starts a load generator.
     """
 
-    def __init__(self, client_id, config, track, tasks):
+    def __init__(self, load_generator_id, config, track, client_allocations):
         """
-        :param client_id: Client id of the load generator.
+        :param load_generator_id: Id of the load generator.
         :param config: Rally internal configuration object.
         :param track: The track to use.
-        :param tasks: Tasks to run.
+        :param client_allocations: A dict with the client id as key and the tasks that this client should run as value.
         """
-        self.client_id = client_id
+        self.load_generator_id = load_generator_id
         self.config = config
         self.track = track
-        self.tasks = tasks
+        self.client_allocations = client_allocations
 
 
 class Drive:
@@ -68,18 +80,66 @@ class UpdateSamples:
     Used to send samples from a load generator node to the master.
     """
 
-    def __init__(self, client_id, samples):
-        self.client_id = client_id
+    def __init__(self, load_generator_id, samples, watermark, delayed_samples=0):
+        """
+        :param load_generator_id: Id of the load generator.
+        :param samples: A ``SampleBuffer`` with all samples gathered since the last update.
+        :param watermark: A timestamp in seconds since epoch. All samples that the load generator will send later are taken after it.
+        :param delayed_samples: The number of samples that have been pending for longer than the load generator's flush interval.
+        """
+        self.load_generator_id = load_generator_id
         self.samples = samples
+        self.watermark = watermark
+        self.delayed_samples = delayed_samples
+
+
+class UpdateLatencyHistograms:
+    """
+    Used to send the latency and service time histograms of all clients of a load generator to the master.
+    """
+
+    def __init__(self, load_generator_id, histograms):
+        self.load_generator_id = load_generator_id
+        self.histograms = histograms
+
+
+class UpdateScheduleLag:
+    """
+    Used to send the schedule lag histograms of all clients of a load generator to the master.
+    """
+
+    def __init__(self, load_generator_id, histograms):
+        self.load_generator_id = load_generator_id
+        self.histograms = histograms
+
+
+class UpdatePrefetchWaits:
+    """
+    Used to send how often clients of a load generator had to wait for prefetched parameters to the master.
+    """
+
+    def __init__(self, load_generator_id, waits):
+        self.load_generator_id = load_generator_id
+        self.waits = waits
+
+
+class UpdateRequestMetrics:
+    """
+    Used to send the additional measurements that runners have reported for the requests of all clients of a load generator to the master.
+    """
+
+    def __init__(self, load_generator_id, metrics):
+        self.load_generator_id = load_generator_id
+        self.metrics = metrics
 
 
 class JoinPointReached:
     """
-    Tells the master that a load generator has reached a join point. Used for coordination across multiple load generators.
+    Tells the master that all clients of a load generator have reached a join point. Used for coordination across multiple load generators.
     """
 
-    def __init__(self, client_id, task):
-        self.client_id = client_id
+    def __init__(self, load_generator_id, task):
+        self.load_generator_id = load_generator_id
         self.client_local_timestamp = time.perf_counter()
         self.task = task
 
@@ -115,7 +175,15 @@ class Driver(thespian.actors.Actor):
         # Elasticsearch client
         self.es = None
         self.metrics_store = None
-        self.raw_samples = []
+        self.raw_samples = SampleBuffer()
+        self.throughput_calculator = ThroughputCalculator()
+        self.throughput = {}
+        self.sample_watermarks = {}
+        self.delayed_samples = 0
+        self.latency_histograms = None
+        self.schedule_lag = ScheduleLagHistograms()
+        self.prefetch_waits = {}
+        self.request_metrics = {}
         self.currently_completed = 0
         self.clients_completed_current_step = {}
         self.current_step = -1
@@ -138,6 +206,14 @@ class Driver(thespian.actors.Actor):
                 self.joinpoint_reached(msg)
             elif isinstance(msg, UpdateSamples):
                 self.update_samples(msg)
+            elif isinstance(msg, UpdateLatencyHistograms):
+                self.latency_histograms.merge(msg.histograms)
+            elif isinstance(msg, UpdateScheduleLag):
+                self.schedule_lag.merge(msg.histograms)
+            elif isinstance(msg, UpdatePrefetchWaits):
+                self.update_prefetch_waits(msg)
+            elif isinstance(msg, UpdateRequestMetrics):
+                self.update_request_metrics(msg)
             elif isinstance(msg, thespian.actors.WakeupMessage):
                 if not self.finished():
                     self.update_progress_message()
@@ -176,6 +252,8 @@ class Driver(thespian.actors.Actor):
         challenge_name = self.config.opts("benchmarks", "challenge")
         selected_car_name = self.config.opts("benchmarks", "car")
         self.metrics_store.open(invocation, track_name, challenge_name, selected_car_name)
+        if latency_recording(self.config) == "histogram":
+            self.latency_histograms = LatencyHistograms(latency_histogram_precision(self.config))
 
         challenge = select_challenge(self.config, current_track)
         es_version = self.config.opts("source", "distribution.version")
@@ -188,17 +266,23 @@ class Driver(thespian.actors.Actor):
         logger.info("Benchmark consists of [%d] steps executed by (at most) [%d] clients as specified by the allocation matrix:\n%s" %
                     (self.number_of_steps, len(self.allocations), self.allocations))
 
-        for client_id in range(allocator.clients):
+        executor = self.config.opts("driver", "load.generator.executor", mandatory=False, default_value="thread")
+        clients_per_load_generator = self.config.opts("driver", "clients.per.load.generator", mandatory=False)
+        assignments = load_generator_assignments(allocator.clients, executor, clients_per_load_generator)
+        logger.info("Running [%d] clients in [%d] load generators with the [%s] executor." %
+                    (allocator.clients, len(assignments), executor))
+        for client_ids in assignments:
             self.drivers.append(self.createActor(LoadGenerator))
-        for client_id, driver in enumerate(self.drivers):
-            self.send(driver, StartLoadGenerator(client_id, self.config, current_track, self.allocations[client_id]))
+        for load_generator_id, driver in enumerate(self.drivers):
+            client_allocations = {client_id: self.allocations[client_id] for client_id in assignments[load_generator_id]}
+            self.send(driver, StartLoadGenerator(load_generator_id, self.config, current_track, client_allocations))
 
         self.update_progress_message()
         self.wakeupAfter(datetime.timedelta(seconds=Driver.WAKEUP_INTERVAL_SECONDS))
 
     def joinpoint_reached(self, msg):
         self.currently_completed += 1
-        self.clients_completed_current_step[msg.client_id] = (msg.client_local_timestamp, time.perf_counter())
+        self.clients_completed_current_step[msg.load_generator_id] = (msg.client_local_timestamp, time.perf_counter())
         logger.debug("[%d/%d] drivers reached join point [%d/%d]." %
                      (self.currently_completed, len(self.drivers), self.current_step + 1, self.number_of_steps))
         if self.currently_completed == len(self.drivers):
@@ -209,6 +293,9 @@ class Driver(thespian.actors.Actor):
             # make a copy and reset early to avoid any race conditions from clients that reach a join point already while we are sending...
             clients_curr_step = self.clients_completed_current_step
             self.clients_completed_current_step = {}
+            # all samples of this step have arrived
+            self.update_throughput(self.throughput_calculator.calculate())
+            self.sample_watermarks = {}
             self.update_progress_message(task_finished=True)
             # clear per step
             self.most_recent_sample_per_client = {}
@@ -228,35 +315,99 @@ class Driver(thespian.actors.Actor):
                 # Assumption: We don't have a lot of clock skew between reaching the join point and sending the next task
                 #             (it doesn't matter too much if we're a few ms off).
                 start_next_task = time.perf_counter() + 5.0
-                for client_id, driver in enumerate(self.drivers):
-                    client_ended_task_at, master_received_msg_at = clients_curr_step[client_id]
+                for load_generator_id, driver in enumerate(self.drivers):
+                    client_ended_task_at, master_received_msg_at = clients_curr_step[load_generator_id]
                     client_start_timestamp = client_ended_task_at + (start_next_task - master_received_msg_at)
-                    logger.info("Scheduling next task for client id [%d] at their timestamp [%f] (master timestamp [%f])" %
-                                (client_id, client_start_timestamp, start_next_task))
+                    logger.info("Scheduling next task for load generator [%d] at their timestamp [%f] (master timestamp [%f])" %
+                                (load_generator_id, client_start_timestamp, start_next_task))
                     self.send(driver, Drive(client_start_timestamp))
 
     def finished(self):
         return self.current_step == self.number_of_steps
 
     def update_samples(self, msg):
-        self.raw_samples += msg.samples
-        if len(msg.samples) > 0:
-            most_recent = msg.samples[-1]
-            self.most_recent_sample_per_client[most_recent.client_id] = most_recent
+        # raw samples are only needed to store latency and service time of each request
+        if self.latency_histograms is None:
+            self.raw_samples.extend(msg.samples)
+        self.delayed_samples += msg.delayed_samples
+        # a load generator may run multiple clients so we need to look at all samples
+        self.most_recent_sample_per_client.update(msg.samples.most_recent_per_client())
+
+        self.throughput_calculator.add(msg.samples)
+        self.sample_watermarks[msg.load_generator_id] = msg.watermark
+        watermark = self.samples_complete_until()
+        if watermark is not None:
+            self.update_throughput(self.throughput_calculator.calculate(until=watermark))
+
+    def update_prefetch_waits(self, msg):
+        for op, (waits, wait_time) in msg.waits.items():
+            total_waits, total_wait_time = self.prefetch_waits.get(op, (0, 0))
+            self.prefetch_waits[op] = (total_waits + waits, total_wait_time + wait_time)
+
+    def update_request_metrics(self, msg):
+        for key, (value, unit) in msg.metrics.items():
+            total, _ = self.request_metrics.get(key, (0, unit))
+            self.request_metrics[key] = (total + value, unit)
+
+    def samples_complete_until(self):
+        """
+        :return: A timestamp (seconds since epoch) before which the master has received all samples of the current step or None if
+        there is at least one load generator that has not sent samples yet.
+        """
+        watermarks = []
+        for load_generator_id in range(len(self.drivers)):
+            # load generators that have reached the join point won't send any more samples in this step
+            if load_generator_id in self.clients_completed_current_step:
+                continue
+            elif load_generator_id in self.sample_watermarks:
+                watermarks.append(self.sample_watermarks[load_generator_id])
+            else:
+                return None
+        return min(watermarks) if watermarks else None
+
+    def update_throughput(self, throughput):
+        for op, records in throughput.items():
+            if op not in self.throughput:
+                self.throughput[op] = []
+            self.throughput[op] += records
+            _, _, _, value, unit = records[-1]
+            logger.info("Current throughput of [%s] is [%.2f %s]." % (op.name, value, unit))
 
     def post_process_samples(self):
-        for sample in self.raw_samples:
-            self.metrics_store.put_value_cluster_level(name="latency", value=sample.latency_ms, unit="ms", operation=sample.operation.name,
-                                                       operation_type=sample.operation.type, sample_type=sample.sample_type,
-                                                       absolute_time=sample.absolute_time, relative_time=sample.relative_time)
-
-            self.metrics_store.put_value_cluster_level(name="service_time", value=sample.service_time_ms, unit="ms",
-                                                       operation=sample.operation.name, operation_type=sample.operation.type,
-                                                       sample_type=sample.sample_type, absolute_time=sample.absolute_time,
-                                                       relative_time=sample.relative_time)
-
-        aggregates = calculate_global_throughput(self.raw_samples)
-        for op, samples in aggregates.items():
+        if self.latency_histograms is not None:
+            for (op, sample_type), (latency, service_time) in self.latency_histograms.histograms.items():
+                self.metrics_store.put_histogram_cluster_level(name="latency_histogram", histogram=latency, unit="ms", operation=op.name,
+                                                               operation_type=op.type, sample_type=sample_type)
+                self.metrics_store.put_histogram_cluster_level(name="service_time_histogram", histogram=service_time, unit="ms",
+                                                               operation=op.name, operation_type=op.type, sample_type=sample_type)
+        else:
+            for sample in self.raw_samples:
+                self.metrics_store.put_value_cluster_level(name="latency", value=sample.latency_ms, unit="ms",
+                                                           operation=sample.operation.name, operation_type=sample.operation.type,
+                                                           sample_type=sample.sample_type, absolute_time=sample.absolute_time,
+                                                           relative_time=sample.relative_time)
+
+                self.metrics_store.put_value_cluster_level(name="service_time", value=sample.service_time_ms, unit="ms",
+                                                           operation=sample.operation.name, operation_type=sample.operation.type,
+                                                           sample_type=sample.sample_type, absolute_time=sample.absolute_time,
+                                                           relative_time=sample.relative_time)
+
+        for (op, sample_type), schedule_lag in self.schedule_lag.histograms.items():
+            self.metrics_store.put_histogram_cluster_level(name="schedule_lag_histogram", histogram=schedule_lag, unit="ms",
+                                                           operation=op.name, operation_type=op.type, sample_type=sample_type)
+
+        for op, (waits, wait_time) in self.prefetch_waits.items():
+            self.metrics_store.put_count_cluster_level(name="prefetch_waits", count=waits, operation=op.name, operation_type=op.type)
+            self.metrics_store.put_value_cluster_level(name="prefetch_wait_time", value=convert.seconds_to_ms(wait_time), unit="ms",
+                                                       operation=op.name, operation_type=op.type)
+
+        for (op, sample_type, name), (value, unit) in self.request_metrics.items():
+            self.metrics_store.put_value_cluster_level(name=name, value=value, unit=unit, operation=op.name, operation_type=op.type,
+                                                       sample_type=sample_type)
+
+        self.metrics_store.put_count_cluster_level(name="delayed_samples", count=self.delayed_samples)
+
+        for op, samples in self.throughput.items():
             for absolute_time, relative_time, sample_type, throughput, throughput_unit in moving_average(samples):
                 self.metrics_store.put_value_cluster_level(name="throughput", value=throughput, unit=throughput_unit,
                                                            operation=op.name, operation_type=op.type, sample_type=sample_type,
@@ -264,7 +415,7 @@ class Driver(thespian.actors.Actor):
 
     def update_progress_message(self, task_finished=False):
         if not self.quiet and self.current_step >= 0:
-            ops = ",".join([op.name for op in self.ops_per_join_point[self.current_step]])
+            ops = ",".join([self.format_operation(op) for op in self.ops_per_join_point[self.current_step]])
 
             if task_finished:
                 total_progress = 1.0
@@ -275,136 +426,362 @@ class Driver(thespian.actors.Actor):
             if task_finished:
                 self.progress_reporter.finish()
 
+    def format_operation(self, op):
+        if op in self.throughput:
+            _, _, _, value, unit = self.throughput[op][-1]
+            return "%s (%d %s)" % (op.name, round(value), unit)
+        else:
+            return op.name
+
 
 class LoadGenerator(thespian.actors.Actor):
     """
-    The actual driver that applies load against the cluster.
+    The actual driver that applies load against the cluster. Each load generator runs one or more clients.
 
     It will also regularly send measurements to the master node so it can consolidate them.
     """
 
-    WAKEUP_INTERVAL_SECONDS = 5
+    # how often the load generator checks whether its clients are done and whether there are samples to send
+    WAKEUP_INTERVAL_SECONDS = 0.5
+    # pending samples are sent at the latest after this interval...
+    SAMPLE_FLUSH_INTERVAL_SECONDS = 5
+    # ... or as soon as at least this many samples are pending
+    SAMPLE_FLUSH_THRESHOLD = 10000
 
     def __init__(self):
         super().__init__()
         self.master = None
-        self.client_id = None
+        self.load_generator_id = None
         self.es = None
         self.config = None
         self.track = None
-        self.tasks = None
+        self.client_allocations = None
         self.current_task = 0
         self.start_timestamp = None
+        self.executor = None
         self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         self.executor_future = None
-        self.sampler = None
+        self.join_point = None
+        self.samplers = []
+        self.last_sample_flush = None
+        self.latency_histograms = None
+        self.schedule_lag = None
+        self.spin_threshold = None
+        self.prefetch_depth = 0
         self.start_driving = False
 
     def receiveMessage(self, msg, sender):
         try:
             if isinstance(msg, StartLoadGenerator):
-                logger.debug("client [%d] is about to start." % msg.client_id)
+                logger.debug("load generator [%d] is about to start." % msg.load_generator_id)
                 self.master = sender
-                self.client_id = msg.client_id
-                self.es = client.EsClientFactory(msg.config.opts("client", "hosts"), msg.config.opts("client", "options")).create()
+                self.load_generator_id = msg.load_generator_id
                 self.config = msg.config
                 self.track = msg.track
-                self.tasks = msg.tasks
+                self.client_allocations = msg.client_allocations
+                self.es = create_client(self.config, len(self.client_allocations))
+                self.executor = executor_for(self.config.opts("driver", "load.generator.executor", mandatory=False, default_value="thread"))
+                if latency_recording(self.config) == "histogram":
+                    self.latency_histograms = LatencyHistograms(latency_histogram_precision(self.config))
+                self.schedule_lag = ScheduleLagHistograms()
+                self.spin_threshold = pacing_spin_threshold(self.config)
+                self.prefetch_depth = prefetch_depth(self.config)
                 self.current_task = 0
                 self.start_timestamp = time.perf_counter()
                 track.load_track_plugins(self.config, runner.register_runner)
                 self.drive()
             elif isinstance(msg, Drive):
-                logger.debug("Client [%d] is continuing its work at task index [%d] on [%f]." %
-                             (self.client_id, self.current_task, msg.client_start_timestamp))
+                logger.debug("load generator [%d] is continuing its work at task index [%d] on [%f]." %
+                             (self.load_generator_id, self.current_task, msg.client_start_timestamp))
                 self.master = sender
                 self.start_driving = True
                 self.wakeupAfter(datetime.timedelta(seconds=time.perf_counter() - msg.client_start_timestamp))
             elif isinstance(msg, thespian.actors.WakeupMessage):
-                logger.debug("client [%d] woke up." % self.client_id)
+                logger.debug("load generator [%d] woke up." % self.load_generator_id)
                 # it would be better if we could send ourselves a message at a specific time, simulate this with a boolean...
                 if self.start_driving:
                     self.start_driving = False
                     self.drive()
                 else:
-                    self.send_samples()
+                    self.maybe_send_samples()
                     if self.executor_future is not None:
                         if self.executor_future.done():
                             e = self.executor_future.exception(timeout=0)
                             if e:
-                                self.send(self.master, BenchmarkFailure("Error in load generator [%d]" % self.client_id, e))
+                                self.send(self.master, BenchmarkFailure("Error in load generator [%d]" % self.load_generator_id, e))
                             else:
                                 self.executor_future = None
-                                self.drive()
+                                self.join_point_reached()
                         else:
                             self.wakeupAfter(datetime.timedelta(seconds=LoadGenerator.WAKEUP_INTERVAL_SECONDS))
+            elif isinstance(msg, thespian.actors.ActorExitRequest):
+                logger.debug("load generator [%s] is exiting." % str(self.load_generator_id))
+                self.close_client()
             else:
-                logger.debug("client [%d] received unknown message [%s] (ignoring)." % (self.client_id, str(msg)))
+                logger.debug("load generator [%d] received unknown message [%s] (ignoring)." % (self.load_generator_id, str(msg)))
         except Exception as e:
-            self.send(self.master, BenchmarkFailure("Fatal error in load generator [%d]" % self.client_id, e))
+            self.send(self.master, BenchmarkFailure("Fatal error in load generator [%d]" % self.load_generator_id, e))
 
-    def drive(self):
-        task = None
-        # skip non-tasks in the task list
-        while task is None:
-            task = self.tasks[self.current_task]
-            self.current_task += 1
+    def close_client(self):
+        # the lean transport keeps persistent connections to the cluster
+        lean_transport = getattr(self.es, "lean_transport", None)
+        if lean_transport is not None:
+            lean_transport.close()
+        self.es = None
 
-        if isinstance(task, JoinPoint):
-            logger.info("client [%d] reached join point [%s]." % (self.client_id, task))
-            # clients that don't execute tasks don't need to care about waiting
-            if self.executor_future is not None:
-                self.executor_future.result()
-            self.send_samples()
-            self.executor_future = None
-            self.sampler = None
-            self.send(self.master, JoinPointReached(self.client_id, task))
-        elif isinstance(task, track.Task):
-            logger.info("Client [%d] is executing [%s]." % (self.client_id, task))
-            self.sampler = Sampler(self.client_id, task.operation, self.start_timestamp)
-            schedule = schedule_for(self.track, task, self.client_id)
-            self.executor_future = self.pool.submit(execute_schedule, schedule, self.es, self.sampler)
+    def drive(self):
+        client_tasks, self.join_point = self.next_step()
+        client_schedules = {}
+        for client_id, tasks in client_tasks.items():
+            schedules = []
+            for task in tasks:
+                logger.info("Client [%d] is executing [%s]." % (client_id, task))
+                sampler = Sampler(client_id, task.operation, self.start_timestamp, self.latency_histograms, self.schedule_lag)
+                self.samplers.append(sampler)
+                pacer = Pacer(self.spin_threshold, task.catch_up, task.catch_up_burst)
+                schedule = schedule_for(self.track, task, client_id, self.prefetch_depth, sampler.add_prefetch_wait, self.es.compressor)
+                schedules.append((schedule, sampler, task.open_loop, pacer))
+            if schedules:
+                client_schedules[client_id] = schedules
+
+        # clients that don't execute tasks don't need to care about waiting
+        if client_schedules:
+            self.last_sample_flush = time.perf_counter()
+            self.executor_future = self.pool.submit(self.executor, self.es, client_schedules)
             self.wakeupAfter(datetime.timedelta(seconds=LoadGenerator.WAKEUP_INTERVAL_SECONDS))
         else:
-            raise exceptions.RallyAssertionError("Unknown task type [%s]" % type(task))
+            self.join_point_reached()
+
+    def next_step(self):
+        """
+        Determines the tasks that each client of this load generator needs to run until the next join point. As the allocation matrix is
+        rectangular, all clients reach the join point at the same index.
+
+        :return: A tuple of a dict (key: client id, value: list of tasks) and the next join point.
+        """
+        client_tasks = {client_id: [] for client_id in self.client_allocations.keys()}
+        while True:
+            join_point = None
+            for client_id, tasks in self.client_allocations.items():
+                task = tasks[self.current_task]
+                if isinstance(task, JoinPoint):
+                    join_point = task
+                elif isinstance(task, track.Task):
+                    client_tasks[client_id].append(task)
+                # skip non-tasks in the task list
+                elif task is not None:
+                    raise exceptions.RallyAssertionError("Unknown task type [%s]" % type(task))
+            self.current_task += 1
+            if join_point is not None:
+                return client_tasks, join_point
+
+    def join_point_reached(self):
+        logger.info("load generator [%d] reached join point [%s]." % (self.load_generator_id, self.join_point))
+        self.send_samples()
+        schedule_lag = self.schedule_lag.drain()
+        if schedule_lag:
+            self.send(self.master, UpdateScheduleLag(self.load_generator_id, schedule_lag))
+        prefetch_waits = {}
+        for sampler in self.samplers:
+            if sampler.prefetch_waits > 0:
+                waits, wait_time = prefetch_waits.get(sampler.operation, (0, 0))
+                prefetch_waits[sampler.operation] = (waits + sampler.prefetch_waits, wait_time + sampler.prefetch_wait_time)
+        if prefetch_waits:
+            self.send(self.master, UpdatePrefetchWaits(self.load_generator_id, prefetch_waits))
+        request_metrics = {}
+        for sampler in self.samplers:
+            for (sample_type, name), (value, unit) in sampler.request_metrics.items():
+                key = (sampler.operation, sample_type, name)
+                total, _ = request_metrics.get(key, (0, unit))
+                request_metrics[key] = (total + value, unit)
+        if request_metrics:
+            self.send(self.master, UpdateRequestMetrics(self.load_generator_id, request_metrics))
+        self.samplers = []
+        if self.latency_histograms is not None:
+            self.send(self.master, UpdateLatencyHistograms(self.load_generator_id, self.latency_histograms.drain()))
+        self.send(self.master, JoinPointReached(self.load_generator_id, self.join_point))
+
+    def maybe_send_samples(self):
+        pending = sum(sampler.pending for sampler in self.samplers)
+        if pending >= LoadGenerator.SAMPLE_FLUSH_THRESHOLD or \
+                time.perf_counter() - self.last_sample_flush >= LoadGenerator.SAMPLE_FLUSH_INTERVAL_SECONDS:
+            self.send_samples()
 
     def send_samples(self):
-        if self.sampler:
-            samples = self.sampler.samples
-            if len(samples) > 0:
-                self.send(self.master, UpdateSamples(self.client_id, samples))
+        self.last_sample_flush = time.perf_counter()
+        # samplers take samples while holding their lock so all samples that are added after draining will be taken after this timestamp
+        watermark = time.time()
+        # samples that are older are delayed beyond what the flush interval guarantees
+        delayed_before = watermark - LoadGenerator.SAMPLE_FLUSH_INTERVAL_SECONDS - LoadGenerator.WAKEUP_INTERVAL_SECONDS
+        samples = SampleBuffer()
+        delayed_samples = 0
+        for sampler in self.samplers:
+            sampler_samples = sampler.samples
+            delayed_samples += sampler_samples.count_before(delayed_before)
+            samples.extend(sampler_samples)
+        if delayed_samples > 0:
+            logger.warn("load generator [%d] sends [%d] delayed samples." % (self.load_generator_id, delayed_samples))
+        # send also if there are no samples so the master knows it is not waiting for samples up to the watermark
+        if self.samplers:
+            self.send(self.master, UpdateSamples(self.load_generator_id, samples, watermark, delayed_samples))
 
 
 class Sampler:
     """
-    Encapsulates management of gathered samples.
+    Encapsulates management of gathered samples. Samples are never dropped: A client appends to the current buffer and the load generator
+    swaps it with an empty one when it drains the sampler (double buffering) so both sides only hold the lock for a constant time.
+
+    The schedule lag of throttled requests is recorded in histograms that are shared by all samplers of a load generator (see
+    ``ScheduleLagHistograms``). If parameters are prefetched, the sampler also
+    counts how often (and how long) the client had to wait for them. Additional measurements that runners report for a request (see
+    ``runner.Runner``) are summed up per sample type and name.
     """
 
-    def __init__(self, client_id, operation, start_timestamp):
+    def __init__(self, client_id, operation, start_timestamp, latency_histograms=None, schedule_lag=None):
         self.client_id = client_id
         self.operation = operation
         self.start_timestamp = start_timestamp
-        self.q = queue.Queue(maxsize=1024)
+        self.latency_histograms = latency_histograms
+        self.schedule_lag = schedule_lag if schedule_lag is not None else ScheduleLagHistograms()
+        self.buffer = SampleBuffer()
+        self.prefetch_waits = 0
+        self.prefetch_wait_time = 0
+        self.request_metrics = {}
+        self.lock = threading.Lock()
+
+    def add_schedule_lag(self, sample_type, schedule_lag_ms):
+        self.schedule_lag.add(self.operation, sample_type, schedule_lag_ms)
+
+    def add_prefetch_wait(self, wait_time):
+        with self.lock:
+            self.prefetch_waits += 1
+            self.prefetch_wait_time += wait_time
+
+    def add_request_metrics(self, sample_type, request_metrics):
+        with self.lock:
+            for name, (value, unit) in request_metrics.items():
+                key = (sample_type, name)
+                total, _ = self.request_metrics.get(key, (0, unit))
+                self.request_metrics[key] = (total + value, unit)
 
     def add(self, sample_type, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, curr_iteration, total_iterations):
-        try:
-            self.q.put_nowait(Sample(self.client_id, time.time(), time.perf_counter() - self.start_timestamp, self.operation,
-                                     sample_type, latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, curr_iteration,
-                                     total_iterations))
-        except queue.Full:
-            logger.warn("Dropping sample for [%s] due to a full sampling queue." % self.operation.name)
+        if self.latency_histograms is not None:
+            self.latency_histograms.add(self.operation, sample_type, latency_ms, service_time_ms)
+        with self.lock:
+            self.buffer.append(self.client_id, time.time(), time.perf_counter() - self.start_timestamp, self.operation, sample_type,
+                               latency_ms, service_time_ms, total_ops, total_ops_unit, time_period, curr_iteration, total_iterations)
+
+    @property
+    def pending(self):
+        """
+        :return: The number of samples that have not been drained yet.
+        """
+        return len(self.buffer)
 
     @property
     def samples(self):
-        samples = []
-        try:
-            while True:
-                samples.append(self.q.get_nowait())
-        except queue.Empty:
-            pass
+        """
+        :return: A ``SampleBuffer`` with all samples since the last call.
+        """
+        with self.lock:
+            samples = self.buffer
+            self.buffer = SampleBuffer()
         return samples
 
 
+class LatencyHistograms:
+    """
+    Records latency and service time in HDR histograms per operation and sample type. Histograms have a fixed memory footprint which is
+    independent of the number of recorded samples. Instances are shared by all clients of a load generator and are thread-safe.
+    """
+
+    # track latencies up to one hour with microsecond resolution
+    HIGHEST_TRACKABLE_VALUE_MS = 60 * 60 * 1000
+    RESOLUTION_MS = 0.001
+
+    def __init__(self, significant_digits=3):
+        self.significant_digits = significant_digits
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _create(self):
+        return histogram.Histogram(LatencyHistograms.HIGHEST_TRACKABLE_VALUE_MS, self.significant_digits, LatencyHistograms.RESOLUTION_MS)
+
+    def _histograms_for(self, operation, sample_type):
+        key = (operation, sample_type)
+        if key not in self.histograms:
+            self.histograms[key] = (self._create(), self._create())
+        return self.histograms[key]
+
+    def add(self, operation, sample_type, latency_ms, service_time_ms):
+        with self.lock:
+            latency, service_time = self._histograms_for(operation, sample_type)
+            latency.record_value(latency_ms)
+            service_time.record_value(service_time_ms)
+
+    def merge(self, histograms):
+        """
+        Merges histograms of another instance (see #drain()) into this one.
+
+        :param histograms: A dict with a tuple (operation, sample type) as key and a tuple (latency, service time) histogram as value.
+        """
+        with self.lock:
+            for (operation, sample_type), (other_latency, other_service_time) in histograms.items():
+                latency, service_time = self._histograms_for(operation, sample_type)
+                latency.add(other_latency)
+                service_time.add(other_service_time)
+
+    def drain(self):
+        """
+        :return: All histograms that have been recorded so far. Afterwards, this instance starts over with empty histograms.
+        """
+        with self.lock:
+            histograms = self.histograms
+            self.histograms = {}
+        return histograms
+
+
+class ScheduleLagHistograms:
+    """
+    Records the schedule lag of throttled requests in one HDR histogram per operation and sample type. Instances are shared by all
+    clients of a load generator (so the number of histograms does not grow with the number of clients) and are thread-safe.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _histogram_for(self, operation, sample_type):
+        key = (operation, sample_type)
+        if key not in self.histograms:
+            self.histograms[key] = histogram.Histogram(LatencyHistograms.HIGHEST_TRACKABLE_VALUE_MS,
+                                                       resolution=LatencyHistograms.RESOLUTION_MS)
+        return self.histograms[key]
+
+    def add(self, operation, sample_type, schedule_lag_ms):
+        with self.lock:
+            self._histogram_for(operation, sample_type).record_value(schedule_lag_ms)
+
+    def merge(self, histograms):
+        """
+        Merges histograms of another instance (see #drain()) into this one.
+
+        :param histograms: A dict with a tuple (operation, sample type) as key and a schedule lag histogram as value.
+        """
+        with self.lock:
+            for (operation, sample_type), other in histograms.items():
+                self._histogram_for(operation, sample_type).add(other)
+
+    def drain(self):
+        """
+        :return: All histograms that have been recorded so far. Afterwards, this instance starts over with empty histograms.
+        """
+        with self.lock:
+            histograms = self.histograms
+            self.histograms = {}
+        return histograms
+
+
 class Sample:
     def __init__(self, client_id, absolute_time, relative_time, operation, sample_type, latency_ms, service_time_ms, total_ops,
                  total_ops_unit, time_period, curr_iteration, total_iterations):
@@ -426,6 +803,175 @@ class Sample:
         return self.curr_iteration / self.total_iterations
 
 
+class SampleBuffer:
+    """
+    Stores samples in columns backed by arrays of primitive values instead of one ``Sample`` object per request. Operations, sample types
+    and units are stored as small integer codes. When pickled (e.g. when it is sent to the master), each column is serialized as raw bytes.
+
+    Iterating over a sample buffer or accessing a single entry creates ``Sample`` instances on the fly.
+    """
+
+    # column name, array type code
+    COLUMNS = [
+        ("client_id", "q"),
+        ("absolute_time", "d"),
+        ("relative_time", "d"),
+        ("operation", "i"),
+        ("sample_type", "b"),
+        ("latency_ms", "d"),
+        ("service_time_ms", "d"),
+        ("total_ops", "d"),
+        ("total_ops_unit", "i"),
+        ("time_period", "d"),
+        ("curr_iteration", "q"),
+        ("total_iterations", "q")
+    ]
+
+    def __init__(self):
+        self.columns = {name: array.array(type_code) for name, type_code in SampleBuffer.COLUMNS}
+        # lookup tables for the integer codes of operations and units
+        self.operations = []
+        self.units = []
+        # index of the most recent sample per client id
+        self.last_index_per_client = {}
+
+    @staticmethod
+    def _code(table, value):
+        try:
+            return table.index(value)
+        except ValueError:
+            table.append(value)
+            return len(table) - 1
+
+    def append(self, client_id, absolute_time, relative_time, operation, sample_type, latency_ms, service_time_ms, total_ops,
+               total_ops_unit, time_period, curr_iteration, total_iterations):
+        c = self.columns
+        self.last_index_per_client[client_id] = len(c["client_id"])
+        c["client_id"].append(client_id)
+        c["absolute_time"].append(absolute_time)
+        c["relative_time"].append(relative_time)
+        c["operation"].append(SampleBuffer._code(self.operations, operation))
+        c["sample_type"].append(sample_type)
+        c["latency_ms"].append(latency_ms)
+        c["service_time_ms"].append(service_time_ms)
+        c["total_ops"].append(total_ops)
+        c["total_ops_unit"].append(SampleBuffer._code(self.units, total_ops_unit))
+        c["time_period"].append(time_period)
+        c["curr_iteration"].append(curr_iteration)
+        c["total_iterations"].append(total_iterations)
+
+    def append_sample(self, sample):
+        self.append(sample.client_id, sample.absolute_time, sample.relative_time, sample.operation, sample.sample_type, sample.latency_ms,
+                    sample.service_time_ms, sample.total_ops, sample.total_ops_unit, sample.time_period, sample.curr_iteration,
+                    sample.total_iterations)
+
+    def extend(self, other):
+        """
+        Appends all samples of another sample buffer to this one.
+        """
+        offset = len(self)
+        for client_id, idx in other.last_index_per_client.items():
+            self.last_index_per_client[client_id] = offset + idx
+        for name, type_code in SampleBuffer.COLUMNS:
+            if name == "operation":
+                self._extend_codes(name, type_code, [SampleBuffer._code(self.operations, op) for op in other.operations], other)
+            elif name == "total_ops_unit":
+                self._extend_codes(name, type_code, [SampleBuffer._code(self.units, unit) for unit in other.units], other)
+            else:
+                self.columns[name].extend(other.columns[name])
+
+    def _extend_codes(self, name, type_code, codes, other):
+        # codes maps each code of the other buffer to the corresponding code of this buffer
+        if codes == list(range(len(codes))):
+            self.columns[name].extend(other.columns[name])
+        elif np is not None:
+            lookup = np.array(codes, dtype=type_code)
+            self.columns[name].frombytes(lookup[np.frombuffer(other.columns[name], dtype=type_code)].tobytes())
+        else:
+            self.columns[name].extend(codes[code] for code in other.columns[name])
+
+    def _index_clients(self):
+        client_ids = self.columns["client_id"]
+        if np is not None and len(client_ids) > 0:
+            reversed_ids = np.frombuffer(client_ids, dtype="q")[::-1]
+            unique_ids, first_in_reversed = np.unique(reversed_ids, return_index=True)
+            last_indices = len(client_ids) - 1 - first_in_reversed
+            self.last_index_per_client = dict(zip(unique_ids.tolist(), last_indices.tolist()))
+        else:
+            self.last_index_per_client = {client_id: idx for idx, client_id in enumerate(client_ids)}
+
+    def split(self, absolute_time):
+        """
+        :param absolute_time: A timestamp in seconds since epoch.
+        :return: A tuple of two sample buffers. The first one contains all samples that have been taken before the provided timestamp,
+        the second one all others.
+        """
+        before = SampleBuffer()
+        after = SampleBuffer()
+        for buffer in [before, after]:
+            buffer.operations = list(self.operations)
+            buffer.units = list(self.units)
+        if np is not None:
+            is_before = np.frombuffer(self.columns["absolute_time"], dtype="d") < absolute_time
+            for name, type_code in SampleBuffer.COLUMNS:
+                values = np.frombuffer(self.columns[name], dtype=type_code)
+                before.columns[name].frombytes(values[is_before].tobytes())
+                after.columns[name].frombytes(values[~is_before].tobytes())
+        else:
+            is_before = [t < absolute_time for t in self.columns["absolute_time"]]
+            for name, _ in SampleBuffer.COLUMNS:
+                for value, b in zip(self.columns[name], is_before):
+                    (before if b else after).columns[name].append(value)
+        before._index_clients()
+        after._index_clients()
+        return before, after
+
+    def count_before(self, absolute_time):
+        """
+        :param absolute_time: A timestamp in seconds since epoch.
+        :return: The number of samples that have been taken before the provided timestamp. Assumes that samples have been appended in
+        chronological order (which holds for the buffer of a single sampler).
+        """
+        return bisect.bisect_left(self.columns["absolute_time"], absolute_time)
+
+    def most_recent_per_client(self):
+        """
+        :return: A dict with the client id as key and the most recent sample of this client as value.
+        """
+        return {client_id: self[idx] for client_id, idx in self.last_index_per_client.items()}
+
+    def __len__(self):
+        return len(self.columns["client_id"])
+
+    def __getitem__(self, idx):
+        c = self.columns
+        return Sample(c["client_id"][idx], c["absolute_time"][idx], c["relative_time"][idx], self.operations[c["operation"][idx]],
+                      metrics.SampleType(c["sample_type"][idx]), c["latency_ms"][idx], c["service_time_ms"][idx], c["total_ops"][idx],
+                      self.units[c["total_ops_unit"][idx]], c["time_period"][idx], c["curr_iteration"][idx], c["total_iterations"][idx])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getstate__(self):
+        return {
+            "columns": {name: column.tobytes() for name, column in self.columns.items()},
+            "operations": self.operations,
+            "units": self.units,
+            "last_index_per_client": self.last_index_per_client
+        }
+
+    def __setstate__(self, state):
+        self.columns = {}
+        for name, type_code in SampleBuffer.COLUMNS:
+            column = array.array(type_code)
+            column.frombytes(state["columns"][name])
+            self.columns[name] = column
+        self.operations = state["operations"]
+        self.units = state["units"]
+        self.last_index_per_client = state["last_index_per_client"]
+
+
 def select_challenge(config, t):
     selected_challenge = config.opts("benchmarks", "challenge")
     for challenge in t.challenges:
@@ -449,7 +995,7 @@ def setup_index(es, t, challenge, es_version, expected_cluster_health):
                 logger.debug(mappings)
                 es.indices.put_mapping(index=index.name,
                                        doc_type=type.name,
-                                       body=json.loads(mappings))
+                                       body=codec.loads(mappings))
     wait_for_status(es, es_version, expected_cluster_health)
 
 
@@ -516,6 +1062,81 @@ def _do_wait(es, es_version, expected_cluster_status):
     raise exceptions.RallyAssertionError(msg)
 
 
+def latency_recording(config):
+    recording = config.opts("driver", "latency.recording", mandatory=False, default_value="raw")
+    if recording not in ["raw", "histogram"]:
+        raise exceptions.SystemSetupError("Unknown latency recording [%s]. Use one of 'raw' or 'histogram'." % recording)
+    return recording
+
+
+# Each significant digit increases the number of counts of a histogram ten-fold (precision 5 needs about 16 MB per histogram).
+MAX_LATENCY_HISTOGRAM_PRECISION = 4
+
+
+def latency_histogram_precision(config):
+    precision = config.opts("driver", "latency.histogram.precision", mandatory=False, default_value=3)
+    if not 1 <= precision <= MAX_LATENCY_HISTOGRAM_PRECISION:
+        raise exceptions.SystemSetupError("Latency histogram precision must be between 1 and %d but was [%s]." %
+                                          (MAX_LATENCY_HISTOGRAM_PRECISION, str(precision)))
+    return precision
+
+
+def load_generator_assignments(number_of_clients, executor, clients_per_load_generator=None, logical_cpu_cores=sysstats.logical_cpu_cores):
+    """
+    Decides which clients are run by which load generator (i.e. process). By default, each client runs in its own load generator with the
+    thread executor whereas the asyncio executor runs all clients within a single load generator.
+
+    Clients are distributed round-robin so clients of the same task are spread across all load generators.
+
+    :param number_of_clients: The total number of clients.
+    :param executor: The name of the executor that load generators use to run their clients.
+    :param clients_per_load_generator: The maximum number of clients per load generator. If "auto", Rally will start roughly one load
+                                       generator per logical CPU core. If None, the default for the given executor is used.
+    :param logical_cpu_cores: A function returning the number of logical CPU cores. This parameter is intended for testing only.
+    :return: A list that contains a list of client ids for each load generator.
+    """
+    if clients_per_load_generator is None:
+        clients_per_load_generator = number_of_clients if executor == "asyncio" else 1
+    elif clients_per_load_generator == "auto":
+        clients_per_load_generator = math.ceil(number_of_clients / logical_cpu_cores())
+    number_of_load_generators = math.ceil(number_of_clients / clients_per_load_generator)
+    assignments = [[] for _ in range(number_of_load_generators)]
+    for client_id in range(number_of_clients):
+        assignments[client_id % number_of_load_generators].append(client_id)
+    return assignments
+
+
+def create_client(config, number_of_clients):
+    """
+    Creates the Elasticsearch client that is shared by all clients of a load generator.
+
+    :param config: Rally internal configuration object.
+    :param number_of_clients: The number of clients that will use this client concurrently.
+    :return: An Elasticsearch client. If the lean transport is enabled, it is available as attribute ``lean_transport``.
+    """
+    client_options = dict(config.opts("client", "options"))
+    # ensure that concurrent clients don't contend for connections
+    if number_of_clients > 1 and "maxsize" not in client_options:
+        client_options["maxsize"] = number_of_clients
+    lean_transport = config.opts("driver", "lean.transport", mandatory=False, default_value=False)
+    return client.EsClientFactory(config.opts("client", "hosts"), client_options, lean_transport).create()
+
+
+def executor_for(name):
+    """
+    :param name: The name of an executor. Either "thread" or "asyncio".
+    :return: A function that runs the schedules of all clients of a load generator concurrently.
+    """
+    if name == "thread":
+        return execute_concurrently
+    elif name == "asyncio":
+        # imported lazily as the asyncio executor requires Python 3.5 or better
+        from esrally.driver import async_driver
+        return async_driver.execute_concurrently
+    else:
+        raise exceptions.SystemSetupError("Unknown load generator executor [%s]. Valid values are 'thread' and 'asyncio'." % name)
+
+
 def calculate_global_throughput(samples, bucket_interval_secs=1):
     """
     Calculates global throughput based on samples gathered from multiple load generators.
@@ -524,67 +1145,201 @@ def calculate_global_throughput(samples, bucket_interval_secs=1):
     :param bucket_interval_secs: The bucket interval for aggregations.
     :return: A global view of throughput samples.
     """
-    samples_per_op = {}
-    # first we group all warmup / measurement samples by operation.
-    for sample in samples:
-        k = sample.operation
-        if k not in samples_per_op:
-            samples_per_op[k] = []
-        samples_per_op[k].append(sample)
-
-    global_throughput = {}
-    # with open("raw_samples.csv", "w") as sample_log:
-    #    print("client_id,absolute_time,relative_time,operation,sample_type,total_ops,time_period", file=sample_log)
-    for k, v in samples_per_op.items():
-        op = k
-        if op not in global_throughput:
-            global_throughput[op] = []
-        # sort all samples by time
-        current_samples = sorted(v, key=lambda s: s.absolute_time)
-
-        total_count = 0
-        interval = 0
-        current_bucket = 0
-        current_sample_type = current_samples[0].sample_type
-        start_time = current_samples[0].absolute_time - current_samples[0].time_period
-        skip_buckets = False
-        last_throughput = 0
-
-        for sample in current_samples:
-            # print("%d,%f,%f,%s,%s,%d,%f" %
-            # (sample.client_id, sample.absolute_time, sample.relative_time, sample.operation, sample.sample_type,
-            #  sample.total_ops, sample.time_period), file=sample_log)
+    calculator = ThroughputCalculator(bucket_interval_secs)
+    calculator.add(samples)
+    return calculator.calculate()
 
+
+class ThroughputCalculator:
+    """
+    Calculates global throughput incrementally while samples from multiple load generators arrive. Samples are processed in chronological
+    order per operation so callers need to tell up to which point in time all samples have arrived (see #calculate()). Only samples after
+    that point in time are kept in memory.
+
+    If numpy is available, the calculation is done with array operations instead of a loop over all samples. Both variants produce
+    identical results.
+    """
+
+    class OperationState:
+        def __init__(self, sample_type, start_time):
+            self.total_count = 0
+            self.interval = 0
+            self.current_bucket = 0
+            self.sample_type = sample_type
+            self.start_time = start_time
+            self.skip_buckets = False
+            self.last_throughput = 0
+
+        def reset(self, sample_type, start_time):
+            self.total_count = 0
+            self.interval = 0
+            self.current_bucket = 0
+            self.sample_type = sample_type
+            self.start_time = start_time
+
+    def __init__(self, bucket_interval_secs=1, vectorized=None):
+        """
+        :param bucket_interval_secs: The bucket interval for aggregations.
+        :param vectorized: Whether to use numpy for the calculation. By default, numpy is used if it is installed.
+        """
+        self.bucket_interval_secs = bucket_interval_secs
+        self.vectorized = np is not None if vectorized is None else vectorized
+        self.unprocessed = SampleBuffer()
+        self.states = {}
+
+    def add(self, samples):
+        """
+        :param samples: Either a ``SampleBuffer`` or any iterable of samples.
+        """
+        if isinstance(samples, SampleBuffer):
+            self.unprocessed.extend(samples)
+        else:
+            for sample in samples:
+                self.unprocessed.append_sample(sample)
+
+    def calculate(self, until=None):
+        """
+        Calculates throughput for all samples that have been taken before ``until``.
+
+        :param until: A timestamp in seconds since epoch. All samples before this timestamp must have been added already. If None,
+                      all samples are processed.
+        :return: A dict with the operation as key and a list of new throughput records as value.
+        """
+        if until is None:
+            ready = self.unprocessed
+            self.unprocessed = SampleBuffer()
+        else:
+            ready, self.unprocessed = self.unprocessed.split(until)
+        if self.vectorized:
+            return self._calculate_vectorized(ready)
+        else:
+            return self._calculate(ready)
+
+    def _calculate(self, samples):
+        samples_per_op = {}
+        # first we group all warmup / measurement samples by operation.
+        for sample in samples:
+            k = sample.operation
+            if k not in samples_per_op:
+                samples_per_op[k] = []
+            samples_per_op[k].append(sample)
+
+        global_throughput = {}
+        for op, samples in samples_per_op.items():
+            global_throughput[op] = []
+            # sort all samples by time
+            samples = sorted(samples, key=lambda s: s.absolute_time)
+            if op not in self.states:
+                self.states[op] = ThroughputCalculator.OperationState(samples[0].sample_type,
+                                                                      samples[0].absolute_time - samples[0].time_period)
+            state = self.states[op]
+            for sample in samples:
+                # once we have seen a new sample type, we stick to it.
+                if state.sample_type < sample.sample_type:
+                    state.reset(sample.sample_type, sample.absolute_time - sample.time_period)
+                    # skip the next few buckets as the system needs time to stabilize again after the sample type has changed
+                    # TODO dm: Redo
+                    # skip_buckets = True
+
+                state.total_count += sample.total_ops
+                state.interval = max(sample.absolute_time - state.start_time, state.interval)
+
+                # avoid division by zero
+                if state.interval > 0 and state.interval >= state.current_bucket:
+                    state.current_bucket = int(state.interval) + self.bucket_interval_secs
+                    throughput = (state.total_count / state.interval)
+                    # skip buckets until throughput catches up. This avoids artifacts introduced by resetting calculation parameters after
+                    # the sample type has changed
+                    if not state.skip_buckets or throughput > state.last_throughput:
+                        state.skip_buckets = False
+                        state.last_throughput = throughput
+                        global_throughput[op].append(
+                            # we calculate throughput per second
+                            (sample.absolute_time, sample.relative_time, state.sample_type, throughput, "%s/s" % sample.total_ops_unit))
+            if not global_throughput[op]:
+                del global_throughput[op]
+        return global_throughput
+
+    def _calculate_vectorized(self, samples):
+        global_throughput = {}
+        if len(samples) == 0:
+            return global_throughput
+        c = {name: np.frombuffer(column, dtype=column.typecode) for name, column in samples.columns.items()}
+        for op_code, op in enumerate(samples.operations):
+            indices = np.flatnonzero(c["operation"] == op_code)
+            if len(indices) == 0:
+                continue
+            # sort all samples by time (stable, like sorted())
+            indices = indices[np.argsort(c["absolute_time"][indices], kind="stable")]
+            absolute_times = c["absolute_time"][indices]
+            relative_times = c["relative_time"][indices]
+            sample_types = c["sample_type"][indices]
+            total_ops = c["total_ops"][indices]
+            time_periods = c["time_period"][indices]
+            units = c["total_ops_unit"][indices]
+
+            if op not in self.states:
+                self.states[op] = ThroughputCalculator.OperationState(metrics.SampleType(int(sample_types[0])),
+                                                                      absolute_times[0] - time_periods[0])
+            state = self.states[op]
             # once we have seen a new sample type, we stick to it.
-            if current_sample_type < sample.sample_type:
-                current_sample_type = sample.sample_type
-                total_count = 0
-                interval = 0
-                current_bucket = 0
-                start_time = sample.absolute_time - sample.time_period
-                # skip the next few buckets as the system needs time to stabilize again after the sample type has changed
-                # TODO dm: Redo
-                # skip_buckets = True
-
-            total_count += sample.total_ops
-            interval = max(sample.absolute_time - start_time, interval)
-
-            # avoid division by zero
-            if interval > 0 and interval >= current_bucket:
-                current_bucket = int(interval) + bucket_interval_secs
-                throughput = (total_count / interval)
-                # skip buckets until throughput catches up. This avoids artifacts introduced by resetting calculation parameters after
-                # the sample type has changed
-                if not skip_buckets or throughput > last_throughput:
-                    skip_buckets = False
-                    last_throughput = throughput
-                    global_throughput[op].append(
-                        # we calculate throughput per second
-                        (sample.absolute_time, sample.relative_time, current_sample_type, throughput, "%s/s" % sample.total_ops_unit))
-    return global_throughput
+            current_sample_types = np.maximum.accumulate(np.maximum(sample_types, int(state.sample_type)))
+            type_changes = np.flatnonzero(np.diff(current_sample_types, prepend=int(state.sample_type)) > 0).tolist()
+            segment_starts = sorted(set([0] + type_changes))
+            segment_ends = segment_starts[1:] + [len(indices)]
+
+            records = []
+            for segment_start, segment_end in zip(segment_starts, segment_ends):
+                if segment_start in type_changes:
+                    state.reset(metrics.SampleType(int(current_sample_types[segment_start])),
+                                absolute_times[segment_start] - time_periods[segment_start])
+                segment = slice(segment_start, segment_end)
+                # prepend the current state to get the same (sequential) floating point operations as the non-vectorized variant
+                total_counts = np.cumsum(np.concatenate(([state.total_count], total_ops[segment])))[1:]
+                intervals = np.maximum.accumulate(np.concatenate(([state.interval], absolute_times[segment] - state.start_time)))[1:]
+
+                # intervals are monotonically increasing so we can find the bucket boundaries with a binary search
+                if state.current_bucket > 0:
+                    idx = int(np.searchsorted(intervals, state.current_bucket, side="left"))
+                else:
+                    # avoid division by zero
+                    idx = int(np.searchsorted(intervals, 0, side="right"))
+                while idx < len(intervals):
+                    interval = float(intervals[idx])
+                    throughput = float(total_counts[idx]) / interval
+                    state.current_bucket = int(interval) + self.bucket_interval_secs
+                    state.last_throughput = throughput
+                    records.append((float(absolute_times[segment_start + idx]), float(relative_times[segment_start + idx]),
+                                    state.sample_type, throughput, "%s/s" % samples.units[units[segment_start + idx]]))
+                    idx = int(np.searchsorted(intervals, state.current_bucket, side="left"))
+                state.total_count = float(total_counts[-1])
+                state.interval = float(intervals[-1])
+            if records:
+                global_throughput[op] = records
+        return global_throughput
 
 
 def moving_average(data, window=3):
+    if np is None or len(data) <= 2 * window:
+        return _moving_average(data, window)
+    n = len(data)
+    values = np.array([record[3] for record in data], dtype=float)
+    # add up shifted views of all values in the same order as the non-vectorized variant to get identical results
+    sums_in_window = np.zeros(n - 2 * window)
+    # also include upper bound
+    for offset in range(2 * window + 1):
+        sums_in_window += values[offset:offset + n - 2 * window]
+    averages = (sums_in_window / (2 * window + 1)).tolist()
+
+    average_data = list(data[:window])
+    for record, average in zip(data[window:n - window], averages):
+        absolute_time, relative_time, sample_type, _, unit = record
+        average_data.append((absolute_time, relative_time, sample_type, average, unit))
+    average_data += data[n - window:]
+    return average_data
+
+
+def _moving_average(data, window=3):
     average_data = []
     for idx, record in enumerate(data):
         if idx < window:
@@ -602,50 +1357,287 @@ def moving_average(data, window=3):
     return average_data
 
 
-def execute_schedule(schedule, es, sampler):
+def execute_concurrently(es, client_schedules):
+    """
+    Runs the schedules of several clients concurrently, using one thread per client.
+
+    :param es: Elasticsearch client that is shared by all clients.
+    :param client_schedules: A dict with the client id as key and a list of (schedule, sampler, open_loop, pacer) tuples as value. Each
+                             client executes its schedules in order.
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(client_schedules))
+    try:
+        futures = [pool.submit(execute_schedules, schedules, es) for schedules in client_schedules.values()]
+        # report errors early instead of waiting for all other clients to finish
+        done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+        for future in done:
+            future.result()
+    finally:
+        pool.shutdown(wait=False)
+
+
+def execute_schedules(schedules, es):
+    """
+    Executes the provided schedules of one client in order.
+
+    :param schedules: A list of (schedule, sampler, open_loop, pacer) tuples.
+    :param es: Elasticsearch client that will be used to execute the operations.
+    """
+    for schedule, sampler, open_loop, pacer in schedules:
+        execute_schedule(schedule, es, sampler, open_loop, pacer)
+
+
+# The maximum number of requests that a single client can have in flight with open-loop scheduling. Once reached, the client waits until
+# a request has completed before it issues the next one. As latency is measured from the scheduled time, this waiting time is included.
+OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS = 64
+
+
+def execute_schedule(schedule, es, sampler, open_loop=False, pacer=None):
     """
     Executes tasks according to the schedule for a given operation.
 
     :param schedule: The schedule for this operation.
     :param es: Elasticsearch client that will be used to execute the operation.
     :param sampler: A container to store raw samples.
+    :param open_loop: If True, requests are issued at their scheduled time even if previous requests have not completed yet.
+    :param pacer: Determines when throttled requests are issued. Optional.
     """
-    relative = None
-    previous_sample_type = None
-    total_start = time.perf_counter()
-    curr_total_it = 1
+    if pacer is None:
+        pacer = Pacer()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS) if open_loop else None
+    in_flight = set()
     # noinspection PyBroadException
     try:
-        for expected_scheduled_time, sample_type_calculator, curr_iteration, total_it_for_task, runner, params in schedule:
-            sample_type = sample_type_calculator(total_start)
-            # restart the relative time when the sample type changes. This way all warmup samples and measurement samples will start at
-            # the relative time zero which simplifies throughput calculation.
-            #
-            # Assumption: We always get the same operation here, otherwise simply resetting one timer will not work!
-            if sample_type != previous_sample_type:
-                relative = time.perf_counter()
-                previous_sample_type = sample_type
-            # expected_scheduled_time is relative to the start of the first iteration
-            absolute_expected_schedule_time = relative + expected_scheduled_time
-            throughput_throttled = expected_scheduled_time > 0
-            if throughput_throttled:
-                rest = absolute_expected_schedule_time - time.perf_counter()
-                if rest > 0:
-                    time.sleep(rest)
-            start = time.perf_counter()
-            with runner:
-                total_ops, total_ops_unit = runner(es, params)
-            stop = time.perf_counter()
-
-            service_time = stop - start
-            # Do not calculate latency separately when we don't throttle throughput. This metric is just confusing then.
-            latency = stop - absolute_expected_schedule_time if throughput_throttled else service_time
-            sampler.add(sample_type, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops, total_ops_unit,
-                        (stop - relative), curr_total_it, total_it_for_task)
-            curr_total_it += 1
+        for request in scheduled_requests(schedule, sampler, pacer):
+            if request.throughput_throttled:
+                request.add_schedule_lag(pacer.wait(request.issue_time))
+            if open_loop:
+                if len(in_flight) >= OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS:
+                    done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    raise_on_error(done)
+                in_flight.add(pool.submit(request.execute, es))
+            else:
+                request.execute(es)
+        for future in in_flight:
+            future.result()
     except BaseException:
         logger.exception("Could not execute schedule")
         raise
+    finally:
+        if pool:
+            pool.shutdown(wait=False)
+
+
+def scheduled_requests(schedule, sampler, pacer):
+    """
+    Determines when the requests of a schedule should be issued. This is shared by all executors which only differ in how they wait for
+    the issue time and how they execute requests.
+
+    :param schedule: The schedule for an operation.
+    :param sampler: A container to store raw samples.
+    :param pacer: Determines when throttled requests are issued.
+    :return: A generator of ``ScheduledRequest``.
+    """
+    relative = None
+    previous_sample_type = None
+    total_start = time.perf_counter()
+    curr_total_it = 1
+    for expected_scheduled_time, sample_type_calculator, curr_iteration, total_it_for_task, runner, params in schedule:
+        sample_type = sample_type_calculator(total_start)
+        # restart the relative time when the sample type changes. This way all warmup samples and measurement samples will start at
+        # the relative time zero which simplifies throughput calculation.
+        #
+        # Assumption: We always get the same operation here, otherwise simply resetting one timer will not work!
+        if sample_type != previous_sample_type:
+            relative = time.perf_counter()
+            previous_sample_type = sample_type
+            pacer.reset()
+        # the schedule yields no arrival time if throughput should not be limited
+        if expected_scheduled_time is not None:
+            # expected_scheduled_time is relative to the start of the first iteration
+            issue_time, absolute_expected_schedule_time = pacer.issue_time(relative + expected_scheduled_time)
+        else:
+            issue_time, absolute_expected_schedule_time = None, None
+        yield ScheduledRequest(runner, params, sampler, sample_type, relative, issue_time, absolute_expected_schedule_time,
+                               curr_total_it, total_it_for_task)
+        curr_total_it += 1
+
+
+class ScheduledRequest:
+    """
+    A single request of a schedule together with the information that is necessary to sample it.
+    """
+
+    def __init__(self, runner, params, sampler, sample_type, relative, issue_time, absolute_expected_schedule_time, curr_iteration,
+                 total_iterations):
+        self.runner = runner
+        self.params = params
+        self.sampler = sampler
+        self.sample_type = sample_type
+        self.relative = relative
+        self.issue_time = issue_time
+        self.absolute_expected_schedule_time = absolute_expected_schedule_time
+        self.curr_iteration = curr_iteration
+        self.total_iterations = total_iterations
+
+    @property
+    def throughput_throttled(self):
+        return self.issue_time is not None
+
+    def add_schedule_lag(self, waited):
+        """
+        :param waited: The time in seconds by which the executor has overshot the issue time while waiting for it.
+        """
+        schedule_lag = waited + (self.issue_time - self.absolute_expected_schedule_time)
+        self.sampler.add_schedule_lag(self.sample_type, convert.seconds_to_ms(schedule_lag))
+
+    def execute(self, es):
+        start = time.perf_counter()
+        with self.runner:
+            result = self.runner(es, self.params)
+        stop = time.perf_counter()
+
+        total_ops, total_ops_unit, request_metrics = unpack_result(result)
+        if request_metrics:
+            self.sampler.add_request_metrics(self.sample_type, request_metrics)
+        service_time = stop - start - wait_time(request_metrics)
+        # Do not calculate latency separately when we don't throttle throughput. This metric is just confusing then.
+        latency = stop - self.absolute_expected_schedule_time if self.throughput_throttled else service_time
+        self.sampler.add(self.sample_type, convert.seconds_to_ms(latency), convert.seconds_to_ms(service_time), total_ops, total_ops_unit,
+                         (stop - self.relative), self.curr_iteration, self.total_iterations)
+
+
+def raise_on_error(futures):
+    """
+    Raises the error of the first failed future (if any).
+
+    :param futures: A collection of completed futures.
+    """
+    for future in futures:
+        future.result()
+
+
+class Pacer:
+    """
+    Issues requests of a throttled schedule at their scheduled point in time. ``time.sleep()`` may oversleep by a considerable amount
+    which limits the achievable precision at high target throughputs. Therefore, the pacer sleeps until shortly before the scheduled time
+    and busy-waits for the remainder (``spin_threshold``).
+
+    If a client falls behind its schedule, the catch-up policy determines how it recovers:
+
+    * ``unbounded``: All overdue requests are issued immediately until the client has caught up with its schedule.
+    * ``token-bucket``: Each overdue request consumes a token from a bucket with ``catch_up_burst`` tokens and each request that is on time
+      puts one token back. If the bucket is empty, the remaining schedule is shifted by the current lag so the client does not issue a
+      burst of overdue requests.
+
+    The catch-up policy only determines when a request is issued. Latency and schedule lag are always measured from the original
+    schedule, otherwise a shifted schedule would hide a stall from all later requests (coordinated omission).
+    """
+
+    DEFAULT_SPIN_THRESHOLD_MS = 2
+    DEFAULT_CATCH_UP_BURST = 10
+
+    def __init__(self, spin_threshold=DEFAULT_SPIN_THRESHOLD_MS / 1000, catch_up="unbounded", catch_up_burst=DEFAULT_CATCH_UP_BURST):
+        """
+        :param spin_threshold: The time in seconds before the scheduled time at which the pacer stops sleeping and starts to busy-wait.
+        :param catch_up: The catch-up policy. One of ``unbounded`` or ``token-bucket``.
+        :param catch_up_burst: The maximum number of overdue requests that are issued in a row for the ``token-bucket`` policy.
+        """
+        if catch_up not in ["unbounded", "token-bucket"]:
+            raise exceptions.SystemSetupError("Unknown catch-up policy [%s]." % catch_up)
+        if spin_threshold < 0:
+            raise exceptions.SystemSetupError("Spin threshold must not be negative but was [%s]." % str(spin_threshold))
+        self.spin_threshold = spin_threshold
+        self.catch_up = catch_up
+        self.catch_up_burst = catch_up_burst
+        self.offset = 0
+        self.tokens = catch_up_burst
+
+    def reset(self):
+        """
+        Starts over with a new schedule.
+        """
+        self.offset = 0
+        self.tokens = self.catch_up_burst
+
+    def issue_time(self, scheduled_time, now=None):
+        """
+        :param scheduled_time: The point in time (in terms of ``time.perf_counter()``) at which the schedule expects the next request.
+        :param now: The current time. Only intended for testing.
+        :return: A tuple of the point in time at which the next request should be issued according to the catch-up policy and the
+        (unshifted) scheduled time from which latency is measured.
+        """
+        target = scheduled_time + self.offset
+        if self.catch_up == "token-bucket":
+            if now is None:
+                now = time.perf_counter()
+            if now <= target:
+                self.tokens = min(self.tokens + 1, self.catch_up_burst)
+            elif self.tokens > 0:
+                self.tokens -= 1
+            else:
+                self.offset += now - target
+                target = now
+        return target, scheduled_time
+
+    def wait(self, target):
+        """
+        Blocks until ``target`` is reached.
+
+        :param target: A point in time in terms of ``time.perf_counter()``.
+        :return: The schedule lag in seconds, i.e. how late after ``target`` this method has returned.
+        """
+        rest = target - time.perf_counter()
+        if rest > self.spin_threshold:
+            time.sleep(rest - self.spin_threshold)
+        now = time.perf_counter()
+        while now < target:
+            # yield the GIL to other clients while spinning
+            time.sleep(0)
+            now = time.perf_counter()
+        return now - target
+
+
+def pacing_spin_threshold(config):
+    """
+    :return: The spin threshold of the pacer in seconds.
+    """
+    spin_threshold_ms = config.opts("driver", "pacing.spin.threshold", mandatory=False, default_value=Pacer.DEFAULT_SPIN_THRESHOLD_MS)
+    if spin_threshold_ms < 0:
+        raise exceptions.SystemSetupError("Pacing spin threshold must not be negative but was [%s]." % str(spin_threshold_ms))
+    return spin_threshold_ms / 1000
+
+
+def prefetch_depth(config):
+    """
+    :return: The number of parameters that partitioned parameter sources prepare in advance.
+    """
+    depth = config.opts("driver", "prefetch.depth", mandatory=False, default_value=0)
+    if depth < 0:
+        raise exceptions.SystemSetupError("Prefetch depth must not be negative but was [%s]." % str(depth))
+    return depth
+
+
+def unpack_result(result):
+    """
+    :param result: The return value of a runner. Either a pair of weight and unit or a triple with additional request metrics.
+    :return: A triple of weight, unit and the request metrics of the request (``None`` if the runner did not report any).
+    """
+    if len(result) == 3:
+        return result
+    else:
+        total_ops, total_ops_unit = result
+        return total_ops, total_ops_unit, None
+
+
+def wait_time(request_metrics):
+    """
+    :param request_metrics: The request metrics of a runner (may be ``None``).
+    :return: The time in seconds that the runner has deliberately waited (see ``runner.WAIT_TIME_METRICS``).
+    """
+    if not request_metrics:
+        return 0
+    return sum(convert.ms_to_seconds(request_metrics[name][0]) for name in runner.WAIT_TIME_METRICS if name in request_metrics)
 
 
 class JoinPoint:
@@ -774,32 +1766,192 @@ class Allocator:
 
 # Runs a concrete schedule on one worker client
 # Needs to determine the runners and concrete iterations per client.
-def schedule_for(current_track, task, client_index):
+def schedule_for(current_track, task, client_index, prefetch=0, prefetch_wait_listener=None, compressor=None):
     """
     Calculates a client's schedule for a given task.
 
     :param current_track: The current track.
     :param task: The task that should be executed.
     :param client_index: The current client index.  Must be in the range [0, `task.clients').
+    :param prefetch: The number of parameters that partitioned parameter sources prepare in advance. 0 disables prefetching.
+    :param prefetch_wait_listener: Called with the wait time in seconds whenever the client had to wait for prefetched parameters.
+    :param compressor: If set, partitioned parameter sources compress pre-serialized request bodies with it before they are requested.
     :return: A generator for the operations the given client needs to perform for this task.
     """
     op = task.operation
     num_clients = task.clients
     target_throughput = task.target_throughput / num_clients if task.target_throughput else None
     runner_for_op = runner.runner_for(op.type)
-    params_for_op = track.operation_parameters(current_track, op).partition(client_index, num_clients)
-
+    param_source = track.operation_parameters(current_track, op)
+    params_for_op = param_source.partition(client_index, num_clients)
+    # parameter sources that are not partitioned return the same parameters for all clients which are cheap to provide
+    if compressor is not None and params_for_op is not param_source:
+        params_for_op = CompressingParamSource(params_for_op, compressor)
+    if prefetch > 0 and params_for_op is not param_source:
+        params_for_op = PrefetchingParamSource(params_for_op, prefetch, prefetch_wait_listener)
+
+    # seed per client so arrival times are reproducible but differ between clients
+    arrivals = Arrivals(target_throughput, task.arrival_process, task.burst_size, seed=client_index)
     if task.warmup_time_period is not None:
         logger.info("Creating time period based schedule for [%s] with a warmup period of [%d] seconds." % (op, task.warmup_time_period))
-        return time_period_based(target_throughput, task.warmup_time_period, runner_for_op, params_for_op)
+        return time_period_based(target_throughput, task.warmup_time_period, runner_for_op, params_for_op, arrivals)
     else:
         logger.info("Creating iteration-count based schedule for [%s] with [%d] warmup iterations and [%d] iterations." %
                     (op, task.warmup_iterations, task.iterations))
         return iteration_count_based(target_throughput, task.warmup_iterations // num_clients, task.iterations // num_clients,
-                                     runner_for_op, params_for_op)
+                                     runner_for_op, params_for_op, arrivals)
 
 
-def time_period_based(target_throughput, warmup_time_period, runner, params):
+class CompressingParamSource:
+    """
+    Wraps a partitioned parameter source and compresses pre-serialized request bodies (e.g. bulk bodies) when the parameters are created.
+    Thus, the client sends them as is and compression is not measured as part of the request. Combined with prefetching, bodies are
+    compressed on the background thread.
+    """
+
+    def __init__(self, delegate, compressor):
+        """
+        :param delegate: The partitioned parameter source.
+        :param compressor: A ``client.Compressor``.
+        """
+        self.delegate = delegate
+        self.compressor = compressor
+
+    def partition(self, partition_index, total_partitions):
+        raise exceptions.RallyError("Cannot partition a CompressingParamSource further")
+
+    def size(self):
+        return self.delegate.size()
+
+    def params(self):
+        params = self.delegate.params()
+        body = params.get("body")
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            params = dict(params)
+            params["body"] = self.compressor.compress(body if isinstance(body, bytes) else bytes(body))
+        return params
+
+
+class PrefetchingParamSource:
+    """
+    Wraps a partitioned parameter source and prepares the next parameters on a background thread while the client waits for the current
+    request. At most ``depth`` parameters are prepared in advance.
+    """
+
+    # how often (in seconds) a blocked background thread checks whether it should stop
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, delegate, depth, wait_listener=None):
+        """
+        :param delegate: The partitioned parameter source.
+        :param depth: The maximum number of parameters that are prepared in advance.
+        :param wait_listener: Called with the wait time in seconds whenever parameters were not ready when they have been requested.
+        """
+        self.delegate = delegate
+        self.queue = queue.Queue(maxsize=depth)
+        self.wait_listener = wait_listener
+        self.thread = None
+        self.error = None
+        # The background thread must not reference this object. Otherwise, it would never be garbage-collected when the client has
+        # finished its schedule (possibly without consuming all parameters) and the thread would never stop.
+        self.stopped = threading.Event()
+        weakref.finalize(self, self.stopped.set)
+
+    @staticmethod
+    def _prefetch(delegate, prefetched, stopped):
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    prefetched.put(item, timeout=PrefetchingParamSource.POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            while put((delegate.params(), None)):
+                pass
+        except BaseException as e:
+            put((None, e))
+
+    def partition(self, partition_index, total_partitions):
+        raise exceptions.RallyError("Cannot partition a PrefetchingParamSource further")
+
+    def size(self):
+        return self.delegate.size()
+
+    def params(self):
+        if self.error is not None:
+            raise self.error
+        # start lazily as the client may run other tasks first
+        if self.thread is None:
+            self.thread = threading.Thread(target=PrefetchingParamSource._prefetch, args=(self.delegate, self.queue, self.stopped),
+                                           name="prefetch", daemon=True)
+            self.thread.start()
+        try:
+            params, error = self.queue.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            params, error = self.queue.get()
+            if self.wait_listener:
+                self.wait_listener(time.perf_counter() - start)
+        if error is not None:
+            self.error = error
+            raise error
+        return params
+
+
+class Arrivals:
+    """
+    Determines when requests should be issued in order to achieve a target throughput. Supported arrival processes are:
+
+    * ``fixed``: Requests are issued in fixed intervals.
+    * ``poisson``: Inter-arrival times are exponentially distributed, i.e. requests arrive as a Poisson process.
+    * ``bursty``: Requests are issued in bursts of ``burst_size`` requests in fixed intervals.
+    """
+
+    def __init__(self, target_throughput, arrival_process="fixed", burst_size=1, seed=None):
+        """
+        :param target_throughput: The desired target throughput in operations / second or None if throughput should not be limited.
+        :param arrival_process: One of ``fixed``, ``poisson`` or ``bursty``.
+        :param burst_size: The number of requests per burst for the ``bursty`` arrival process.
+        :param seed: The seed for the ``poisson`` arrival process.
+        """
+        if arrival_process not in ["fixed", "poisson", "bursty"]:
+            raise exceptions.SystemSetupError("Unknown arrival process [%s]." % arrival_process)
+        self.target_throughput = target_throughput
+        self.arrival_process = arrival_process
+        self.burst_size = burst_size
+        self.seed = seed
+
+    def times(self):
+        """
+        :return: A generator for the points in time (in seconds relative to the start of the schedule) at which requests should be issued.
+                 If throughput should not be limited, it yields ``None`` for every request.
+        """
+        if not self.target_throughput:
+            while True:
+                yield None
+        wait_time = 1 / self.target_throughput
+        if self.arrival_process == "poisson":
+            rnd = random.Random(self.seed)
+            arrival_time = 0
+            while True:
+                yield arrival_time
+                arrival_time += rnd.expovariate(self.target_throughput)
+        elif self.arrival_process == "bursty":
+            i = 0
+            while True:
+                yield wait_time * (i // self.burst_size) * self.burst_size
+                i += 1
+        else:
+            i = 0
+            while True:
+                yield wait_time * i
+                i += 1
+
+
+def time_period_based(target_throughput, warmup_time_period, runner, params, arrivals=None):
     """
     Calculates the necessary schedule for time period based operations.
 
@@ -807,17 +1959,19 @@ def time_period_based(target_throughput, warmup_time_period, runner, params):
     :param warmup_time_period: The time period in seconds that is considered for warmup.
     :param runner: The runner for a given operation.
     :param params: The parameter source for a given operation.
+    :param arrivals: Determines when requests should be issued. Optional. By default, requests are issued in fixed intervals.
     :return: A generator for the corresponding parameters.
     """
-    wait_time = 1 / target_throughput if target_throughput else 0
+    if arrivals is None:
+        arrivals = Arrivals(target_throughput)
     iterations = params.size()
-    for it in range(0, iterations):
-        yield (wait_time * it,
+    for it, arrival_time in zip(range(0, iterations), arrivals.times()):
+        yield (arrival_time,
                lambda start: metrics.SampleType.Warmup if time.perf_counter() - start < warmup_time_period else metrics.SampleType.Normal,
                it, iterations, runner, params.params())
 
 
-def iteration_count_based(target_throughput, warmup_iterations, iterations, runner, params):
+def iteration_count_based(target_throughput, warmup_iterations, iterations, runner, params, arrivals=None):
     """
     Calculates the necessary schedule based on a given number of iterations.
 
@@ -826,14 +1980,24 @@ def iteration_count_based(target_throughput, warmup_iterations, iterations, runn
     :param iterations: The number of measurement iterations to run.
     :param runner: The runner for a given operation.
     :param params: The parameter source for a given operation.
+    :param arrivals: Determines when requests should be issued. Optional. By default, requests are issued in fixed intervals.
     :return: A generator for the corresponding parameters.
     """
-    wait_time = 1 / target_throughput if target_throughput else 0
+    if arrivals is None:
+        arrivals = Arrivals(target_throughput)
     total_iterations = warmup_iterations + iterations
     if total_iterations == 0:
         raise exceptions.RallyAssertionError("Operation must run at least for one iteration.")
-    for i in range(0, warmup_iterations):
-        yield (wait_time * i, lambda start: metrics.SampleType.Warmup, i, total_iterations, runner, params.params())
-
-    for i in range(0, iterations):
-        yield (wait_time * i, lambda start: metrics.SampleType.Normal, i, total_iterations, runner, params.params())
+    # both phases draw from the same arrival process so that measurement does not replay the warmup sequence
+    times = arrivals.times()
+    for i, arrival_time in zip(range(0, warmup_iterations), times):
+        yield (arrival_time, lambda start: metrics.SampleType.Warmup, i, total_iterations, runner, params.params())
+
+    # arrival times are relative to the start of each phase
+    phase_start = None
+    for i, arrival_time in zip(range(0, iterations), times):
+        if arrival_time is not None:
+            if phase_start is None:
+                phase_start = arrival_time
+            arrival_time -= phase_start
+        yield (arrival_time, lambda start: metrics.SampleType.Normal, i, total_iterations, runner, params.params())
@@ -1,9 +1,17 @@
+import collections
+import copy
+import re
+import time
 import types
 import logging
+import urllib.parse
+import zlib
 
 import elasticsearch
+import urllib3
 
-from esrally import exceptions, track
+from esrally import exceptions, track, client
+from esrally.utils import convert, codec
 
 logger = logging.getLogger("rally.driver")
 
@@ -12,8 +20,14 @@ __RUNNERS = {}
 
 
 def runner_for(operation_type):
+    """
+    :param operation_type: The name of an operation type.
+    :return: A new runner instance for the given operation type. Each client gets its own instance so state that a runner keeps in its
+             attributes is not shared between clients that run in the same process. Note that this is a shallow copy of the registered
+             runner, i.e. objects that it references are still shared.
+    """
     try:
-        return __RUNNERS[operation_type]
+        return copy.copy(__RUNNERS[operation_type])
     except KeyError:
         raise exceptions.RallyError("No runner available for operation type [%s]" % operation_type)
 
@@ -45,6 +59,12 @@ class Runner:
                  it should be the actual bulk size. The second component is the "unit" of weight which should be "ops" (short for
                  "operations") by default. If applicable, the unit should always be in plural form. It is used in metrics records
                  for throughput and reports. A value will then be shown as e.g. "111 ops/s".
+
+                 Runners may return a dict of additional request metrics as a third component. It maps a metric name to a pair of
+                 (number, String) with the value and unit of this metric for the current request, e.g. ``{"my_metric": (12.5, "ms")}``.
+                 Rally sums up all values of one metric per operation and sample type and stores the totals in the metrics store.
+                 Time in milliseconds that a runner has deliberately waited (e.g. backing off before a retry) and that is reported
+                 with one of the metric names in ``WAIT_TIME_METRICS`` is not counted as service time.
         """
         raise NotImplementedError("abstract operation")
 
@@ -52,6 +72,10 @@ class Runner:
         return False
 
 
+# Request metrics that measure the time in milliseconds during which a runner deliberately waited instead of issuing requests
+WAIT_TIME_METRICS = ["bulk_retry_time"]
+
+
 class DelegatingRunner(Runner):
     def __init__(self, runnable):
         self.runnable = runnable
@@ -60,32 +84,251 @@ class DelegatingRunner(Runner):
         return self.runnable(*args)
 
 
+def raw_request(es, method, path, params=None, body=None):
+    """
+    Issues a request like ``es.transport.perform_request()`` but does not deserialize the response. This allows runners to skip or defer
+    parsing response bodies they are not interested in.
+
+    If the client provides a lean transport (see ``client.LeanTransport``), the request is sent with it and failed requests are not
+    retried. Otherwise, the request is sent with a connection of the client's transport and, like ``elasticsearch.Transport``, failed
+    requests are retried on another connection and failed connections are marked as dead (which may trigger sniffing).
+
+    :param es: The Elasticsearch client.
+    :param method: The HTTP method.
+    :param path: The absolute path of the request (without host).
+    :param params: A dict of query parameters. Optional.
+    :param body: An already serialized request body (``bytes``). Optional.
+    :return: A pair of the HTTP status code and the raw response body as ``bytes``.
+    """
+    lean_transport = getattr(es, "lean_transport", None)
+    if lean_transport is not None:
+        if params:
+            path = "%s?%s" % (path, urllib.parse.urlencode(params))
+        status, data = lean_transport.perform_request(method, path, body)
+        if not 200 <= status < 300:
+            _raise_error(status, data)
+        return status, data
+
+    transport = es.transport
+    for attempt in range(transport.max_retries + 1):
+        connection = transport.get_connection()
+        try:
+            status, data = _perform_raw_request(connection, method, path, params, body)
+        except elasticsearch.TransportError as e:
+            # same retry conditions as in elasticsearch.Transport#perform_request()
+            if isinstance(e, elasticsearch.ConnectionTimeout):
+                retry = transport.retry_on_timeout
+            elif isinstance(e, elasticsearch.ConnectionError):
+                retry = True
+            else:
+                retry = e.status_code in transport.retry_on_status
+            if not retry:
+                raise
+            transport.mark_dead(connection)
+            if attempt == transport.max_retries:
+                raise
+        else:
+            transport.connection_pool.mark_live(connection)
+            return status, data
+
+
+def _perform_raw_request(connection, method, path, params, body):
+    # Bypass Urllib3HttpConnection#perform_request() as it decodes the whole response to a string that we would need to encode again.
+    url = connection.url_prefix + path
+    if params:
+        url = "%s?%s" % (url, urllib.parse.urlencode(params))
+    try:
+        response = connection.pool.urlopen(method, url, body, retries=False, headers=connection.headers)
+        data = response.data
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise elasticsearch.ConnectionTimeout("TIMEOUT", str(e), e)
+    except urllib3.exceptions.HTTPError as e:
+        raise elasticsearch.ConnectionError("N/A", str(e), e)
+    if not 200 <= response.status < 300:
+        _raise_error(response.status, data)
+    return response.status, data
+
+
+def _raise_error(status, data):
+    error = data.decode("utf-8", errors="replace")
+    raise elasticsearch.exceptions.HTTP_EXCEPTIONS.get(status, elasticsearch.TransportError)(status, error, error)
+
+
 class BulkIndex(Runner):
     """
     Bulk indexes the given documents.
 
-    It expects the parameter hash to contain a key "body" containing all documents for the current bulk request.
+    It expects the parameter hash to contain a key "body" containing all documents for the current bulk request. The body is either a
+    list of alternating action and document lines or an already serialized bulk body (``bytes``). In the latter case, the parameter hash
+    also needs to contain the number of documents in the bulk as "bulk-size".
 
+    Elasticsearch is asked to return only the ``errors`` flag and the failed items so the size of the response depends only on the number
+    of failures. As the failed items do not reveal their position in the bulk, the status of each item is requested in addition if
+    rejected items should be retried. The response items are only parsed if ``errors`` is true. The time spent parsing responses is
+    reported as ``bulk_response_parse_time``.
+
+    Failed items do not abort the benchmark. Items that have been rejected by Elasticsearch (HTTP status 429) are retried up to "retries"
+    times (default: 0) with an exponential backoff that starts at "retry-backoff" seconds. If Elasticsearch rejects the whole bulk request,
+    all of its items count as rejected. All other failed items and rejected items that are left after the last retry count as failed.
+    The runner reports the number of rejected, retried and failed documents as well as the backoff time and counts only successfully
+    indexed documents for throughput. The backoff time is not counted as service time (see ``WAIT_TIME_METRICS``).
+
+    If request compression is enabled, the body is compressed unless it has already been compressed ahead of time. The runner reports the
+    size of the bulk request bodies before (``bulk_raw_bytes``) and after compression (``bulk_wire_bytes``).
     """
+    # Only failed items contain an error so all other items are filtered from the response.
+    FILTER_PATH = "errors,items.*.error"
+    # Keeping the status of each item preserves the position of failed items in the response which is needed to retry them.
+    FILTER_PATH_WITH_POSITIONS = "errors,items.*.status,items.*.error"
+    REJECTED_ERROR_TYPE = "es_rejected_execution_exception"
+    # ``errors`` is always contained in the first few characters of the (filtered) response
+    NO_ERRORS = re.compile(rb'"errors"\s*:\s*false')
+    NO_ERRORS_SEARCH_LENGTH = 64
+    REJECTED_STATUS = 429
+    DEFAULT_RETRY_BACKOFF = 0.1
+
     def __init__(self):
         super().__init__()
 
     def __call__(self, es, params):
-        bulk_params = {}
+        retries = params.get("retries", 0)
+        bulk_params = {"filter_path": BulkIndex.FILTER_PATH_WITH_POSITIONS if retries > 0 else BulkIndex.FILTER_PATH}
         if "pipeline" in params:
             bulk_params["pipeline"] = params["pipeline"]
+        retry_backoff = params.get("retry-backoff", BulkIndex.DEFAULT_RETRY_BACKOFF)
 
-        response = es.bulk(body=params["body"], params=bulk_params)
-        if response["errors"]:
+        body = params["body"]
+        if "bulk-size" in params:
+            bulk_size = params["bulk-size"]
+        else:
+            # at this point, the bulk will always contain a separate meta data line
+            bulk_size = len(body) // 2
+        compressor = getattr(es, "compressor", None)
+        pending_body = self.serialize(es, body)
+        if compressor is not None:
+            pending_body = compressor.compress(pending_body)
+        raw_bytes = pending_body.raw_size if isinstance(pending_body, client.CompressedBody) else len(pending_body)
+        wire_bytes = len(pending_body)
+
+        parse_time = 0
+        retry_time = 0
+        rejected_docs = 0
+        retried_docs = 0
+        failed_docs = 0
+        pending_docs = bulk_size
+        attempt = 0
+        while True:
+            if attempt > 0:
+                backoff_start = time.perf_counter()
+                time.sleep(retry_backoff * 2 ** (attempt - 1))
+                retry_time += time.perf_counter() - backoff_start
+            try:
+                response, response_parse_time = self.bulk(es, bulk_params, pending_body)
+            except elasticsearch.TransportError as e:
+                if e.status_code != BulkIndex.REJECTED_STATUS:
+                    raise
+                logger.warn("Bulk request with [%d] items has been rejected." % pending_docs)
+                rejected, failed = list(range(pending_docs)), []
+            else:
+                parse_time += response_parse_time
+                rejected, failed = BulkIndex.classify(response)
+            rejected_docs += len(rejected)
+            failed_docs += len(failed)
+            if failed:
+                error_types = collections.Counter(error.get("type") if isinstance(error, dict) else error for error in failed)
+                logger.warn("[%d] bulk items failed. Errors by type: %s" % (len(failed), dict(error_types)))
+            if not rejected:
+                break
+            elif attempt == retries:
+                logger.warn("[%d] bulk items have still been rejected after [%d] retries." % (len(rejected), retries))
+                failed_docs += len(rejected)
+                break
+            attempt += 1
+            retried_docs += len(rejected)
+            if len(rejected) < pending_docs:
+                pending_body = BulkIndex.select_items(pending_body, rejected)
+                if compressor is not None:
+                    pending_body = compressor.compress(pending_body)
+                pending_docs = len(rejected)
+            raw_bytes += pending_body.raw_size if isinstance(pending_body, client.CompressedBody) else len(pending_body)
+            wire_bytes += len(pending_body)
+
+        request_metrics = {
+            "bulk_response_parse_time": (convert.seconds_to_ms(parse_time), "ms"),
+            "bulk_rejected_docs": (rejected_docs, "docs"),
+            "bulk_retried_docs": (retried_docs, "docs"),
+            "bulk_failed_docs": (failed_docs, "docs"),
+            "bulk_retry_time": (convert.seconds_to_ms(retry_time), "ms"),
+            "bulk_raw_bytes": (raw_bytes, "byte"),
+            "bulk_wire_bytes": (wire_bytes, "byte")
+        }
+        return bulk_size - failed_docs, "docs", request_metrics
+
+    def bulk(self, es, bulk_params, body):
+        """
+        :return: A pair of the parsed bulk response (``None`` if there were no errors) and the time in seconds it took to parse it.
+        """
+        _, raw_response = raw_request(es, "POST", "/_bulk", params=bulk_params, body=body)
+        parse_start = time.perf_counter()
+        if BulkIndex.NO_ERRORS.search(raw_response, 0, BulkIndex.NO_ERRORS_SEARCH_LENGTH):
+            response = None
+        else:
+            response = codec.loads(raw_response)
+        return response, time.perf_counter() - parse_start
+
+    @staticmethod
+    def classify(response):
+        """
+        :param response: A parsed bulk response or ``None`` if there were no errors.
+        :return: A pair with the positions of all rejected items and the errors of all other failed items. Positions are only meaningful
+                 if the response contains the status of each item (see ``FILTER_PATH_WITH_POSITIONS``).
+        """
+        rejected = []
+        failed = []
+        if response is not None and response["errors"]:
             for idx, item in enumerate(response["items"]):
-                if item["index"]["status"] != 201:
-                    msg = "Could not bulk index. "
-                    msg += "Error in line [%d]\n" % (idx + 1)
-                    msg += "Bulk item: [%s]\n" % item
-                    msg += "Buffer size is [%d]\n" % idx
-                    raise exceptions.DataError(msg)
-        # at this point, the bulk will always contain a separate meta data line
-        return len(params["body"]) // 2, "docs"
+                # the item is keyed by its action, e.g. "index"
+                result = next(iter(item.values()))
+                error = result.get("error")
+                status = result.get("status")
+                if status is None:
+                    # the response contains only failed items
+                    if isinstance(error, dict) and error.get("type") == BulkIndex.REJECTED_ERROR_TYPE:
+                        rejected.append(idx)
+                    else:
+                        failed.append(error)
+                elif status == BulkIndex.REJECTED_STATUS:
+                    rejected.append(idx)
+                elif status >= 300:
+                    failed.append(error)
+        return rejected, failed
+
+    @staticmethod
+    def select_items(body, positions):
+        """
+        :param body: A serialized (and possibly compressed) bulk body where each item consists of an action and a document line.
+        :param positions: The positions of the items to select.
+        :return: A serialized (uncompressed) bulk body that contains only the items at the given positions.
+        """
+        if isinstance(body, client.CompressedBody):
+            # detect the gzip or zlib header automatically
+            body = zlib.decompress(body, 32 + zlib.MAX_WBITS)
+        lines = body.split(b"\n")
+        selected = []
+        for idx in positions:
+            selected.append(lines[2 * idx])
+            selected.append(lines[2 * idx + 1])
+        selected.append(b"")
+        return b"\n".join(selected)
+
+    def serialize(self, es, body):
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            # pre-serialized bodies are sent as is
+            return bytes(body) if not isinstance(body, bytes) else body
+        else:
+            lines = [line if isinstance(line, str) else es.transport.serializer.dumps(line) for line in body]
+            lines.append("")
+            return "\n".join(lines).encode("utf-8")
 
 
 class ForceMerge(Runner):
@@ -132,7 +375,9 @@ class Query(Runner):
     * `index`: The index or indices against which to issue the query.
     * `type`: See `index`
     * `use_request_cache`: True iff the request cache should be used.
-    * `body`: Query body
+    * `body`: Query body. If it has already been serialized (``bytes``), it is sent as is.
+
+    The optional parameter `serialized-body` contains the query body serialized as ``bytes``. If present, it is sent instead of `body`.
 
     If the following parameters are present in addition, a scroll query will be issued:
 
@@ -140,11 +385,19 @@ class Query(Runner):
                pages we will terminate earlier.
     * `items_per_page`: Number of items to retrieve per page.
 
-    """
+    The optional parameter `response_parsing` defines how much of the response is parsed:
 
-    def __init__(self):
-        self.scroll_id = None
-        self.es = None
+    * `full` (default): The whole response is parsed like any client would do.
+    * `minimal`: The response body of a request body search is not parsed at all. For scroll queries, only the scroll id and whether the
+                 current page contains any hits are read from the beginning of the response. If the response does not have the expected
+                 structure, it is parsed completely.
+
+    The size of all responses in bytes is reported as ``search_response_bytes``.
+    """
+    # both the scroll id and the outer "hits" object precede any hits and aggregations in the response
+    HEAD_LENGTH = 64 * 1024
+    SCROLL_ID = re.compile(rb'"_scroll_id"\s*:\s*"([^"]+)"')
+    HITS = re.compile(rb'"hits"\s*:\s*\{\s*"total"\s*:\s*\d+\s*,\s*"max_score"\s*:\s*[^,]+,\s*"hits"\s*:\s*\[\s*(\])?')
 
     def __call__(self, es, params):
         if "pages" in params and "items_per_page" in params:
@@ -153,37 +406,73 @@ class Query(Runner):
             return self.request_body_query(es, params)
 
     def request_body_query(self, es, params):
-        es.search(index=params["index"], doc_type=params["type"], request_cache=params["use_request_cache"], body=params["body"])
-        return 1, "ops"
+        _, response = raw_request(es, "GET", Query.search_path(params["index"], params["type"]),
+                                  params={"request_cache": Query.flag(params["use_request_cache"])}, body=Query.serialize(params))
+        if params.get("response_parsing", "full") == "full":
+            codec.loads(response)
+        return 1, "ops", {"search_response_bytes": (len(response), "byte")}
+
+    @staticmethod
+    def search_path(index, doc_type):
+        if doc_type:
+            return "/%s/%s/_search" % (urllib.parse.quote(index, ",*"), urllib.parse.quote(doc_type, ",*"))
+        else:
+            return "/%s/_search" % urllib.parse.quote(index, ",*")
 
-    def scroll_query(self, es, params):
-        self.es = es
-        r = es.search(
-            index=params["index"],
-            doc_type=params["type"],
-            body=params["body"],
-            sort="_doc",
-            scroll="10s",
-            size=params["items_per_page"],
-            request_cache=params["use_request_cache"])
-        self.scroll_id = r["_scroll_id"]
-        total_pages = params["pages"]
-        # Note that starting with ES 2.0, the initial call to search() returns already the first result page
-        # so we have to retrieve one page less
-        for page in range(total_pages - 1):
-            hit_count = len(r["hits"]["hits"])
-            if hit_count == 0:
-                # We're done prematurely. Even if we are on page index zero, we still made one call.
-                return page + 1, "ops"
-            r = es.scroll(scroll_id=self.scroll_id, scroll="10s")
-        return total_pages, "ops"
+    @staticmethod
+    def serialize(params):
+        serialized_body = params.get("serialized-body")
+        if serialized_body is not None:
+            return serialized_body
+        body = params["body"]
+        return body if body is None or isinstance(body, bytes) else codec.dumps(body)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.scroll_id and self.es:
-            self.es.clear_scroll(scroll_id=self.scroll_id)
-            self.scroll_id = None
-            self.es = None
-        return False
+    @staticmethod
+    def flag(value):
+        return "true" if value else "false"
+
+    def scroll_query(self, es, params):
+        minimal = params.get("response_parsing", "full") == "minimal"
+        response_bytes = 0
+        # Keep all scroll state local to this call. With open-loop scheduling, a client may run several scroll queries concurrently.
+        scroll_id = None
+        try:
+            _, response = raw_request(es, "GET", Query.search_path(params["index"], params["type"]),
+                                      params={"sort": "_doc", "scroll": "10s", "size": params["items_per_page"],
+                                              "request_cache": Query.flag(params["use_request_cache"])},
+                                      body=Query.serialize(params))
+            response_bytes += len(response)
+            scroll_id, has_hits = Query.read_page(response, minimal)
+            total_pages = params["pages"]
+            # Note that starting with ES 2.0, the initial call to search() returns already the first result page
+            # so we have to retrieve one page less
+            for page in range(total_pages - 1):
+                if not has_hits:
+                    # We're done prematurely. Even if we are on page index zero, we still made one call.
+                    return page + 1, "ops", {"search_response_bytes": (response_bytes, "byte")}
+                _, response = raw_request(es, "GET", "/_search/scroll", params={"scroll": "10s"}, body=scroll_id.encode("utf-8"))
+                response_bytes += len(response)
+                scroll_id, has_hits = Query.read_page(response, minimal)
+            return total_pages, "ops", {"search_response_bytes": (response_bytes, "byte")}
+        finally:
+            if scroll_id:
+                es.clear_scroll(scroll_id=scroll_id)
+
+    @staticmethod
+    def read_page(response, minimal):
+        """
+        :param response: The raw response of a scroll query.
+        :param minimal: Whether to read only the beginning of the response if possible.
+        :return: A pair of the scroll id and whether the page contains any hits.
+        """
+        if minimal:
+            scroll_id = Query.SCROLL_ID.search(response, 0, Query.HEAD_LENGTH)
+            hits = Query.HITS.search(response, 0, Query.HEAD_LENGTH)
+            if scroll_id and hits:
+                # the hits array is closed immediately if it is empty
+                return scroll_id.group(1).decode("utf-8"), hits.group(1) is None
+        r = codec.loads(response)
+        return r["_scroll_id"], len(r["hits"]["hits"]) > 0
 
 
 register_runner(track.OperationType.Index.name, BulkIndex())
@@ -10,8 +10,8 @@ import elasticsearch
 import elasticsearch.helpers
 import tabulate
 
-from esrally import time, exceptions
-from esrally.utils import console
+from esrally import time, exceptions, client
+from esrally.utils import console, histogram
 
 logger = logging.getLogger("rally.metrics")
 
@@ -77,7 +77,8 @@ class EsClientFactory:
             auth = None
         logger.info("Creating connection to metrics store at %s:%s" % (host, port))
         self._client = elasticsearch.Elasticsearch(hosts=[{"host": host, "port": port}],
-                                                   use_ssl=secure, http_auth=auth, verify_certs=True, ca_certs=certifi.where())
+                                                   use_ssl=secure, http_auth=auth, verify_certs=True, ca_certs=certifi.where(),
+                                                   serializer=client.CodecSerializer())
 
     def create(self):
         return EsClient(self._client)
@@ -312,7 +313,28 @@ class MetricsStore:
         """
         self._put(MetaInfoScope.node, node_name, name, value, unit, operation, operation_type, sample_type, absolute_time, relative_time)
 
-    def _put(self, level, level_key, name, value, unit, operation, operation_type, sample_type, absolute_time=None, relative_time=None):
+    def put_histogram_cluster_level(self, name, histogram, unit, operation=None, operation_type=None, sample_type=SampleType.Normal,
+                                    absolute_time=None, relative_time=None):
+        """
+        Adds a snapshot of a cluster level histogram. In contrast to value metrics, a histogram record summarizes many measurements and
+        is only retrievable with #get_histogram().
+
+        :param name: The name of the metric.
+        :param histogram: A ``esrally.utils.histogram.Histogram`` instance.
+        :param unit: The unit of the recorded values (e.g. ms).
+        :param operation The operation name to which this histogram applies. Optional. Defaults to None.
+        :param operation_type The operation type to which this histogram applies. Optional. Defaults to None.
+        :param sample_type Whether this histogram contains warmup or normal measurement samples. Defaults to SampleType.Normal.
+        :param absolute_time The absolute timestamp in seconds since epoch when this metric record is stored. Defaults to None. The metrics
+               store will derive the timestamp automatically.
+        :param relative_time The relative timestamp in seconds since the start of the benchmark when this metric record is stored.
+               Defaults to None. The metrics store will derive the timestamp automatically.
+        """
+        self._put(MetaInfoScope.cluster, None, name, None, unit, operation, operation_type, sample_type, absolute_time, relative_time,
+                  histogram=histogram)
+
+    def _put(self, level, level_key, name, value, unit, operation, operation_type, sample_type, absolute_time=None, relative_time=None,
+             histogram=None):
         if level == MetaInfoScope.cluster:
             meta = self._meta_info[MetaInfoScope.cluster]
         elif level == MetaInfoScope.node:
@@ -339,6 +361,9 @@ class MetricsStore:
             "sample-type": sample_type.name.lower(),
             "meta": meta
         }
+        if histogram is not None:
+            del doc["value"]
+            doc["histogram"] = histogram.to_snapshot()
         if operation:
             doc["operation"] = operation
         if operation_type:
@@ -392,6 +417,25 @@ class MetricsStore:
         """
         return self._get(name, operation, operation_type, sample_type, lambda doc: doc["value"])
 
+    def get_histogram(self, name, operation=None, operation_type=None, sample_type=None):
+        """
+        Gets the histogram for the given metric name. If multiple histogram snapshots match, they are merged.
+
+        :param name: The metric name to query.
+        :param operation The operation name to query. Optional.
+        :param operation_type The operation type to query. Optional.
+        :param sample_type The sample type to query. Optional. By default, all samples are considered.
+        :return: A ``esrally.utils.histogram.Histogram`` or None if there is no histogram for this metric.
+        """
+        merged = None
+        for snapshot in self._get(name, operation, operation_type, sample_type, lambda doc: doc["histogram"]):
+            h = histogram.Histogram.from_snapshot(snapshot)
+            if merged is None:
+                merged = h
+            else:
+                merged.add(h)
+        return merged
+
     def get_unit(self, name, operation=None, operation_type=None):
         """
         Gets the unit for the given metric name.
@@ -512,7 +556,7 @@ class EsMetricsStore(MetricsStore):
 
     def _get(self, name, operation, operation_type, sample_type, mapper):
         query = {
-            "query": self._query_by_name(name, operation, operation_type)
+            "query": self._query_by_name(name, operation, operation_type, sample_type)
         }
         logger.debug("Issuing get against index=[%s], doc_type=[%s], query=[%s]" % (self._index, EsMetricsStore.METRICS_DOC_TYPE, query))
         result = self._client.search(index=self._index, doc_type=EsMetricsStore.METRICS_DOC_TYPE, body=query)
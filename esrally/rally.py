@@ -182,6 +182,11 @@ def parse_args():
             raise argparse.ArgumentTypeError("must be positive but was %s" % value)
         return value
 
+    def positive_number_or_auto(v):
+        if v == "auto":
+            return v
+        return positive_number(v)
+
     # try to preload configurable defaults, but this does not work together with `--configuration-name` (which is undocumented anyway)
     cfg = config.Config()
     if cfg.config_present():
@@ -322,6 +327,64 @@ def parse_args():
             type=positive_number,
             help="number of rounds that the benchmark should run (default: 1).",
             default=1)
+        p.add_argument(
+            "--load-generator-executor",
+            help="define how load generators run their clients. 'thread' runs each client in a dedicated process, 'asyncio' runs "
+                 "all clients concurrently on an event loop in one process (default: thread).",
+            choices=["thread", "asyncio"],
+            default="thread")
+        p.add_argument(
+            "--clients-per-load-generator",
+            type=positive_number_or_auto,
+            help="define how many clients run in one load generator process. 'auto' starts roughly one load generator per logical "
+                 "CPU core (default: 1 for the thread executor, all clients for the asyncio executor).",
+            default=None)
+        p.add_argument(
+            "--latency-recording",
+            help="define how latency and service time are recorded. 'raw' stores every sample, 'histogram' records samples in "
+                 "fixed-size histograms per operation (default: raw).",
+            choices=["raw", "histogram"],
+            default="raw")
+        p.add_argument(
+            "--latency-histogram-precision",
+            type=int,
+            help="number of significant decimal digits of latency histograms (default: 3).",
+            choices=range(1, 5),
+            default=3)
+        p.add_argument(
+            "--offset-table-granularity",
+            type=positive_number,
+            help="store the file offset of every n-th line of document corpora to seek quickly to the start of each client's "
+                 "documents. 1 stores the offset of every line (default: 1000).",
+            default=1000)
+        p.add_argument(
+            "--stream-from-archive",
+            help="read documents directly from the compressed document archive instead of decompressing it first (default: false).",
+            default=False,
+            action="store_true")
+        p.add_argument(
+            "--bulk-cache",
+            help="store bulk request bodies on disk and reuse them in subsequent benchmarks with the same parameters (default: false).",
+            default=False,
+            action="store_true")
+        p.add_argument(
+            "--pacing-spin-threshold",
+            type=float,
+            help="time in milliseconds before the scheduled time of a throttled request at which clients stop sleeping and busy-wait "
+                 "instead (default: 2).",
+            default=2)
+        p.add_argument(
+            "--prefetch-depth",
+            type=int,
+            help="number of request parameters (e.g. bulk bodies) that each client prepares in advance on a background thread. "
+                 "0 disables prefetching (default: 0).",
+            default=0)
+        p.add_argument(
+            "--lean-transport",
+            help="send requests of the built-in runners with a minimal HTTP transport instead of the Elasticsearch client "
+                 "(default: false).",
+            default=False,
+            action="store_true")
 
     for p in [parser, list_parser, race_parser]:
         p.add_argument(
@@ -558,6 +621,16 @@ def main():
     cfg.add(config.Scope.applicationOverride, "benchmarks", "car", args.car)
     cfg.add(config.Scope.applicationOverride, "benchmarks", "cluster.health", args.cluster_health)
     cfg.add(config.Scope.applicationOverride, "benchmarks", "rounds", args.rounds)
+    cfg.add(config.Scope.applicationOverride, "driver", "load.generator.executor", args.load_generator_executor)
+    cfg.add(config.Scope.applicationOverride, "driver", "clients.per.load.generator", args.clients_per_load_generator)
+    cfg.add(config.Scope.applicationOverride, "driver", "latency.recording", args.latency_recording)
+    cfg.add(config.Scope.applicationOverride, "driver", "latency.histogram.precision", args.latency_histogram_precision)
+    cfg.add(config.Scope.applicationOverride, "driver", "pacing.spin.threshold", args.pacing_spin_threshold)
+    cfg.add(config.Scope.applicationOverride, "driver", "prefetch.depth", args.prefetch_depth)
+    cfg.add(config.Scope.applicationOverride, "driver", "lean.transport", args.lean_transport)
+    cfg.add(config.Scope.applicationOverride, "benchmarks", "offset.table.granularity", args.offset_table_granularity)
+    cfg.add(config.Scope.applicationOverride, "benchmarks", "corpora.stream.from.archive", args.stream_from_archive)
+    cfg.add(config.Scope.applicationOverride, "benchmarks", "bulk.cache", args.bulk_cache)
     cfg.add(config.Scope.applicationOverride, "provisioning", "datapaths", csv_to_list(args.data_paths))
     cfg.add(config.Scope.applicationOverride, "provisioning", "install.preserve", convert.to_bool(args.preserve_install))
     cfg.add(config.Scope.applicationOverride, "launcher", "external.target.hosts", convert_hosts(csv_to_list(args.target_hosts)))
@@ -47,6 +47,7 @@ class Stats:
                 self.op_metrics[op]["throughput"] = self.summary_stats(store, "throughput", op)
                 self.op_metrics[op]["latency"] = self.single_latency(store, op)
                 self.op_metrics[op]["service_time"] = self.single_latency(store, op, metric_name="service_time")
+                self.op_metrics[op]["schedule_lag"] = self.single_latency(store, op, metric_name="schedule_lag")
 
         self.total_time = self.sum(store, "indexing_total_time")
         self.merge_time = self.sum(store, "merges_total_time")
@@ -129,6 +130,10 @@ class Stats:
 
     def single_latency(self, store, operation, metric_name="latency"):
         sample_type = metrics.SampleType.Normal
+        # load generators either record latencies in histograms or store raw samples
+        histogram = store.get_histogram("%s_histogram" % metric_name, operation=operation, sample_type=sample_type)
+        if histogram is not None and histogram.total_count > 0:
+            return histogram.values_at_percentiles(self.percentiles_for_sample_size(histogram.total_count))
         sample_size = store.get_count(metric_name, operation=operation, sample_type=sample_type)
         if sample_size > 0:
             return store.get_percentiles(metric_name,
@@ -194,6 +199,7 @@ class SummaryReporter:
                         metrics_table += self.report_throughput(stats, task.operation)
                         metrics_table += self.report_latency(stats, task.operation)
                         metrics_table += self.report_service_time(stats, task.operation)
+                        metrics_table += self.report_schedule_lag(stats, task.operation)
 
                 meta_info_table += self.report_meta_info()
 
@@ -260,6 +266,13 @@ class SummaryReporter:
             lines.append(["%sth percentile service time" % percentile, operation.name, value, "ms"])
         return lines
 
+    def report_schedule_lag(self, stats, operation):
+        lines = []
+        schedule_lag = stats.op_metrics[operation.name]["schedule_lag"]
+        for percentile, value in schedule_lag.items():
+            lines.append(["%sth percentile schedule lag" % percentile, operation.name, value, "ms"])
+        return lines
+
     def report_total_times(self, stats):
         total_times = []
         unit = "min"
@@ -12,7 +12,7 @@ import jsonschema
 import tabulate
 from esrally import exceptions, time, PROGRAM_NAME
 from esrally.track import params, track
-from esrally.utils import io, convert, net, git, versions, console
+from esrally.utils import io, convert, net, git, versions, console, codec
 
 logger = logging.getLogger("rally.track")
 
@@ -160,14 +160,37 @@ def prepare_track(track, cfg):
                                            (basename, extracted_bytes, expected_size_in_bytes))
         return basename, decompressed
 
+    def prepare_archive_for_streaming(data_set_path, expected_size_in_bytes):
+        uncompressed_bytes, blocks = io.prepare_block_index(data_set_path)
+        if uncompressed_bytes != expected_size_in_bytes:
+            raise exceptions.DataError("[%s] is corrupt. It contains [%d] uncompressed bytes but [%d] bytes are expected." %
+                                       (data_set_path, uncompressed_bytes, expected_size_in_bytes))
+        if blocks == 1:
+            console.warn("[%s] consists of a single block. Each client needs to decompress all documents before its own ones. Recompress "
+                         "it with a parallel compression tool like pbzip2 or bgzip to speed this up." % data_set_path, logger=logger)
+
+    offset_table_granularity = cfg.opts("benchmarks", "offset.table.granularity", mandatory=False,
+                                        default_value=io.DEFAULT_OFFSET_TABLE_GRANULARITY)
+    stream_from_archive = cfg.opts("benchmarks", "corpora.stream.from.archive", mandatory=False, default_value=False)
+    bulk_cache = cfg.opts("benchmarks", "bulk.cache", mandatory=False, default_value=False)
     for index in track.indices:
         for type in index.types:
             if type.document_archive:
                 data_url = "%s/%s" % (track.source_root_url, os.path.basename(type.document_archive))
                 download(cfg, data_url, type.document_archive, type.compressed_size_in_bytes)
-                decompressed_file_path, was_decompressed = decompress(type.document_archive, type.uncompressed_size_in_bytes)
-                # just rebuild the file every time for the time being. Later on, we might check the data file fingerprint to avoid it
-                io.prepare_file_offset_table(decompressed_file_path)
+                if stream_from_archive and io.is_streamable(type.document_archive):
+                    prepare_archive_for_streaming(type.document_archive, type.uncompressed_size_in_bytes)
+                    type.read_from_archive = True
+                    corpus_path = type.document_archive
+                else:
+                    if stream_from_archive:
+                        logger.warn("Cannot read documents directly from [%s]. Decompressing it instead." % type.document_archive)
+                    corpus_path, was_decompressed = decompress(type.document_archive, type.uncompressed_size_in_bytes)
+                    # just rebuild the file every time for the time being. Later on, we might check the data file fingerprint to avoid it
+                    io.prepare_file_offset_table(corpus_path, offset_table_granularity)
+                if bulk_cache:
+                    type.document_checksum = io.checksum(corpus_path)
+                    type.bulk_cache_dir = os.path.join(os.path.dirname(corpus_path), "bulk-cache")
 
 
 class TrackRepository:
@@ -265,7 +288,7 @@ class TrackFileReader:
     def __init__(self, cfg):
         self.cfg = cfg
         track_schema_file = "%s/resources/track-schema.json" % (self.cfg.opts("system", "rally.root"))
-        self.track_schema = json.loads(open(track_schema_file).read())
+        self.track_schema = codec.loads(open(track_schema_file).read())
         self.read_track = TrackSpecificationReader()
 
     def read(self, track_name, track_spec_file, mapping_dir, data_dir):
@@ -283,7 +306,7 @@ class TrackFileReader:
         try:
             rendered = render_template_from_file(track_spec_file)
             logger.info("Final rendered track for '%s': %s" % (track_spec_file, rendered))
-            track_spec = json.loads(rendered)
+            track_spec = codec.loads(rendered)
         except (json.JSONDecodeError, jinja2.exceptions.TemplateError) as e:
             logger.exception("Could not load [%s]." % track_spec_file)
             raise TrackSyntaxError("Could not load '%s'" % track_spec_file, e)
@@ -430,13 +453,24 @@ class TrackSpecificationReader:
         if op_name not in ops:
             self._error("'schedule' for challenge '%s' contains a non-existing operation '%s'. "
                         "Please add an operation '%s' to the 'operations' block." % (challenge_name, op_name, op_name))
+        target_throughput = self._r(task_spec, "target-throughput", error_ctx=op_name, mandatory=False)
+        arrival_process = self._r(task_spec, "arrival-process", error_ctx=op_name, mandatory=False, default_value="fixed")
+        open_loop = self._r(task_spec, "open-loop", error_ctx=op_name, mandatory=False, default_value=False)
+        if not target_throughput and (arrival_process != "fixed" or open_loop):
+            self._error("Operation '%s' in challenge '%s' defines an arrival process or open-loop scheduling but no 'target-throughput'."
+                        % (op_name, challenge_name))
         return track.Task(operation=ops[op_name],
                           warmup_iterations=self._r(task_spec, "warmup-iterations", error_ctx=op_name, mandatory=False,
                                                     default_value=default_warmup_iterations),
                           warmup_time_period=self._r(task_spec, "warmup-time-period", error_ctx=op_name, mandatory=False),
                           iterations=self._r(task_spec, "iterations", error_ctx=op_name, mandatory=False, default_value=default_iterations),
                           clients=self._r(task_spec, "clients", error_ctx=op_name, mandatory=False, default_value=1),
-                          target_throughput=self._r(task_spec, "target-throughput", error_ctx=op_name, mandatory=False))
+                          target_throughput=target_throughput,
+                          arrival_process=arrival_process,
+                          burst_size=self._r(task_spec, "burst-size", error_ctx=op_name, mandatory=False, default_value=1),
+                          open_loop=open_loop,
+                          catch_up=self._r(task_spec, "catch-up", error_ctx=op_name, mandatory=False, default_value="unbounded"),
+                          catch_up_burst=self._r(task_spec, "catch-up-burst", error_ctx=op_name, mandatory=False, default_value=10))
 
     def parse_operations(self, ops_specs):
         # key = name, value = operation
@@ -1,12 +1,18 @@
+import bisect
+import hashlib
 import logging
+import mmap
+import os
 import random
+import re
+import struct
 import time
 import types
 from enum import Enum
 
 from esrally import exceptions
 from esrally.track import track
-from esrally.utils import io
+from esrally.utils import io, codec
 
 logger = logging.getLogger("rally.track")
 
@@ -127,6 +133,7 @@ class SearchParamSource(ParamSource):
         query_body = params.get("body", None)
         pages = params.get("pages", None)
         items_per_page = params.get("results-per-page", None)
+        response_parsing = params.get("response-parsing", "full")
 
         self.query_params = {
             "index": index_name,
@@ -137,12 +144,22 @@ class SearchParamSource(ParamSource):
 
         if not index_name:
             raise exceptions.InvalidSyntax("'index' is mandatory")
+        if response_parsing not in ["full", "minimal"]:
+            raise exceptions.InvalidSyntax("Unknown response parsing [%s]. Valid values are 'full' and 'minimal'." % response_parsing)
+        self.query_params["response_parsing"] = response_parsing
 
         if pages:
             self.query_params["pages"] = pages
         if items_per_page:
             self.query_params["items_per_page"] = items_per_page
 
+    def partition(self, partition_index, total_partitions):
+        # The query is the same for every request. Serialize it once so the client does not need to serialize it for each request.
+        body = self.query_params["body"]
+        if body is not None and not isinstance(body, bytes):
+            self.query_params["serialized-body"] = codec.dumps(body)
+        return self
+
     def params(self):
         return self.query_params
 
@@ -176,6 +193,7 @@ class BulkIndexParamSource(ParamSource):
         else:
             raise exceptions.InvalidSyntax("Unknown index id conflict type [%s]." % id_conflicts)
         self.pipeline = params.get("pipeline", None)
+        self.seed = params.get("seed", None)
         try:
             self.bulk_size = int(params["bulk-size"])
             if self.bulk_size <= 0:
@@ -184,10 +202,24 @@ class BulkIndexParamSource(ParamSource):
             raise exceptions.InvalidSyntax("Mandatory parameter 'bulk-size' is missing")
         except ValueError:
             raise exceptions.InvalidSyntax("'bulk-size' must be numeric")
+        try:
+            self.retries = int(params.get("retries", 0))
+            if self.retries < 0:
+                raise exceptions.InvalidSyntax("'retries' must be non-negative but was %d" % self.retries)
+        except ValueError:
+            raise exceptions.InvalidSyntax("'retries' must be numeric")
+        try:
+            self.retry_backoff = params.get("retry-backoff", None)
+            if self.retry_backoff is not None:
+                self.retry_backoff = float(self.retry_backoff)
+                if self.retry_backoff < 0:
+                    raise exceptions.InvalidSyntax("'retry-backoff' must be non-negative but was %f" % self.retry_backoff)
+        except ValueError:
+            raise exceptions.InvalidSyntax("'retry-backoff' must be numeric")
 
     def partition(self, partition_index, total_partitions):
         return PartitionBulkIndexParamSource(self.indices, partition_index, total_partitions, self.bulk_size, self.id_conflicts,
-                                             self.pipeline)
+                                             self.pipeline, self.seed, self.retries, self.retry_backoff)
 
     def params(self):
         raise exceptions.RallyError("Do not use a BulkIndexParamSource without partitioning")
@@ -197,7 +229,8 @@ class BulkIndexParamSource(ParamSource):
 
 
 class PartitionBulkIndexParamSource(ParamSource):
-    def __init__(self, indices, partition_index, total_partitions, bulk_size, id_conflicts=None, pipeline=None):
+    def __init__(self, indices, partition_index, total_partitions, bulk_size, id_conflicts=None, pipeline=None, seed=None, retries=0,
+                 retry_backoff=None):
         """
 
         :param indices: Specification of affected indices.
@@ -206,6 +239,10 @@ class PartitionBulkIndexParamSource(ParamSource):
         :param bulk_size: The size of bulk index operations (number of documents per bulk).
         :param id_conflicts: The type of id conflicts.
         :param pipeline: The name of the ingest pipeline to run.
+        :param seed: The seed for simulating id conflicts. If not specified, id conflicts differ between benchmarks.
+        :param retries: How often rejected bulk items are retried.
+        :param retry_backoff: The time in seconds to wait before the first retry of rejected bulk items. If not specified, the runner's
+                              default applies.
         """
         super().__init__(indices, {})
         self.partition_index = partition_index
@@ -213,7 +250,11 @@ class PartitionBulkIndexParamSource(ParamSource):
         self.bulk_size = bulk_size
         self.id_conflicts = id_conflicts
         self.pipeline = pipeline
-        self.internal_params = bulk_data_based(total_partitions, partition_index, indices, bulk_size, id_conflicts, pipeline)
+        self.seed = seed
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.internal_params = bulk_data_based(total_partitions, partition_index, indices, bulk_size, id_conflicts, pipeline, seed,
+                                               retries, retry_backoff)
 
     def partition(self, partition_index, total_partitions):
         raise exceptions.RallyError("Cannot partition a PartitionBulkIndexParamSource further")
@@ -239,18 +280,54 @@ class PartitionBulkIndexParamSource(ParamSource):
         return bulks
 
 
-def build_conflicting_ids(conflicts, docs_to_index, offset):
+def build_conflicting_ids(conflicts, docs_to_index, offset, rnd=random):
     if conflicts is None or conflicts == IndexIdConflict.NoConflicts:
         return None
     logger.info("building ids with id conflicts of type [%s]" % conflicts)
-    all_ids = [0] * docs_to_index
-    for i in range(docs_to_index):
-        # always consider the offset as each client will index its own range and we don't want uncontrolled conflicts across clients
-        if conflicts == IndexIdConflict.SequentialConflicts:
-            all_ids[i] = "%10d" % (offset + i)
-        else:  # RandomConflicts
-            all_ids[i] = "%10d" % random.randint(offset, offset + docs_to_index)
-    return all_ids
+    # always consider the offset as each client will index its own range and we don't want uncontrolled conflicts across clients
+    if conflicts == IndexIdConflict.SequentialConflicts:
+        return ConflictingIds(docs_to_index, offset)
+    else:  # RandomConflicts
+        return ConflictingIds(docs_to_index, offset, seed=rnd.getrandbits(64))
+
+
+class ConflictingIds:
+    """
+    The document ids that a client uses to simulate id conflicts. Ids are calculated on access instead of being kept in memory:
+
+    * Without a seed, the id at position ``i`` is ``offset + i`` (sequential conflicts).
+    * With a seed, the id at position ``i`` is drawn uniformly from ``[offset, offset + docs_to_index]`` by hashing the seed and ``i``.
+      Thus, the ids are random but the same position always produces the same id (random conflicts).
+
+    Ids are formatted as strings with a width of 10 characters.
+    """
+
+    MASK_64 = (1 << 64) - 1
+
+    def __init__(self, docs_to_index, offset, seed=None):
+        self.docs_to_index = docs_to_index
+        self.offset = offset
+        self.seed = seed
+
+    def __len__(self):
+        return self.docs_to_index
+
+    def __getitem__(self, i):
+        if i < 0 or i >= self.docs_to_index:
+            raise IndexError("id index [%d] out of range" % i)
+        if self.seed is None:
+            doc_id = self.offset + i
+        else:
+            doc_id = self.offset + ConflictingIds._mix(self.seed + i) % (self.docs_to_index + 1)
+        return "%10d" % doc_id
+
+    @staticmethod
+    def _mix(x):
+        # the finalizer of the SplitMix64 pseudo-random number generator which maps consecutive integers to well-distributed ones
+        x = (x + 0x9E3779B97F4A7C15) & ConflictingIds.MASK_64
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & ConflictingIds.MASK_64
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & ConflictingIds.MASK_64
+        return x ^ (x >> 31)
 
 
 def chain(*iterables):
@@ -267,9 +344,30 @@ def chain(*iterables):
                 yield element
 
 
-def create_default_reader(index, type, offset, num_docs, bulk_size, id_conflicts):
-    return IndexDataReader(type.document_file, num_docs,
-                           build_conflicting_ids(id_conflicts, num_docs, offset), index.name, type.name, bulk_size, offset)
+def create_default_reader(index, type, offset, num_docs, bulk_size, id_conflicts, seed=None):
+    # each client draws its own sequence of random numbers
+    rnd = random if seed is None else random.Random(seed + offset)
+    if type.read_from_archive:
+        data_file, file_source = type.document_archive, CompressedSource
+    else:
+        data_file, file_source = type.document_file, MmapSource
+    reader = IndexDataReader(data_file, num_docs,
+                             build_conflicting_ids(id_conflicts, num_docs, offset, rnd), index.name, type.name, bulk_size, offset,
+                             file_source=file_source, rnd=rnd)
+    if type.bulk_cache_dir is None:
+        return reader
+    # bulks are only reproducible without id conflicts or with a fixed seed
+    if id_conflicts not in [None, IndexIdConflict.NoConflicts] and seed is None:
+        logger.info("Not caching bulks for [%s/%s] as id conflicts are simulated without a seed." % (index, type))
+        return reader
+    cache_file = bulk_cache_path(type.bulk_cache_dir, type.document_checksum, index.name, type.name, bulk_size, offset, num_docs,
+                                 id_conflicts, seed)
+    if BulkCacheReader.is_valid(cache_file):
+        logger.info("Reading bulks for [%s/%s] from [%s]." % (index, type, cache_file))
+        return BulkCacheReader(cache_file)
+    else:
+        logger.info("Caching bulks for [%s/%s] in [%s]." % (index, type, cache_file))
+        return BulkCacheWriter(cache_file, reader, num_docs)
 
 
 def bounds(total_docs, client_index, num_clients):
@@ -293,7 +391,8 @@ def bounds(total_docs, client_index, num_clients):
     return offset, docs_per_client
 
 
-def bulk_data_based(num_clients, client_index, indices, bulk_size, id_conflicts, pipeline, create_reader=create_default_reader):
+def bulk_data_based(num_clients, client_index, indices, bulk_size, id_conflicts, pipeline, seed=None, retries=0, retry_backoff=None,
+                    create_reader=create_default_reader):
     """
     Calculates the necessary schedule for bulk operations.
 
@@ -303,6 +402,9 @@ def bulk_data_based(num_clients, client_index, indices, bulk_size, id_conflicts,
     :param bulk_size: The size of bulk index operations (number of documents per bulk).
     :param id_conflicts: The type of id conflicts to simulate.
     :param pipeline: Name of the ingest pipeline to use. May be None.
+    :param seed: The seed for simulating id conflicts. May be None.
+    :param retries: How often rejected bulk items are retried.
+    :param retry_backoff: The time in seconds to wait before the first retry of rejected bulk items. May be None.
     :param create_reader: A function to create the index reader. By default a file based index reader will be created. This parameter is
                           intended for testing only.
     :return: A generator for the bulk operations of the given client.
@@ -315,14 +417,19 @@ def bulk_data_based(num_clients, client_index, indices, bulk_size, id_conflicts,
             if num_docs > 0:
                 logger.info("Client [%d] will index [%d] docs starting from offset [%d] for [%s/%s]" %
                             (client_index, num_docs, offset, index, type))
-                readers.append(create_reader(index, type, offset, num_docs, bulk_size, id_conflicts))
+                readers.append(create_reader(index, type, offset, num_docs, bulk_size, id_conflicts, seed))
             else:
                 logger.info("Client [%d] skips [%s/%s] (no documents to read)." % (client_index, index, type))
     reader = chain(*readers)
-    for bulk in reader:
-        params = {"body": bulk}
+    for docs_in_bulk, bulk in reader:
+        # the body is already serialized, "bulk-size" is the number of documents it contains
+        params = {"body": bulk, "bulk-size": docs_in_bulk}
         if pipeline:
             params["pipeline"] = pipeline
+        if retries > 0:
+            params["retries"] = retries
+            if retry_backoff is not None:
+                params["retry-backoff"] = retry_backoff
         yield params
 
 
@@ -345,12 +452,237 @@ class FileSource:
         self.f = None
 
 
+class MmapSource:
+    """
+    A file source that maps the file into memory. ``readline()`` returns a ``memoryview`` of the mapped file for each line, i.e. lines are
+    neither copied nor decoded. ``read_lines()`` returns a single ``memoryview`` spanning multiple lines. Line boundaries are looked up
+    directly in the mapped file so no part of it is copied.
+    """
+
+    @staticmethod
+    def open(file_name, mode):
+        return MmapSource(file_name, mode)
+
+    def __init__(self, file_name, mode):
+        if "b" not in mode:
+            raise exceptions.RallyAssertionError("MmapSource supports only binary mode but mode was [%s]" % mode)
+        self.f = open(file_name, mode)
+        self.position = 0
+        # mapping an empty file is not allowed
+        if os.fstat(self.f.fileno()).st_size > 0:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            # hint the OS to read ahead aggressively (Python 3.8+)
+            if hasattr(self.mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                self.mm.madvise(mmap.MADV_SEQUENTIAL)
+            self.view = memoryview(self.mm)
+        else:
+            self.mm = None
+            self.view = memoryview(b"")
+
+    def seek(self, offset):
+        self.position = offset
+
+    def _end_of_line(self, position):
+        end = self.mm.find(b"\n", position)
+        # the last line may not be terminated
+        return len(self.view) if end == -1 else end + 1
+
+    def readline(self):
+        if self.position >= len(self.view):
+            return self.view[0:0]
+        end = self._end_of_line(self.position)
+        line = self.view[self.position:end]
+        self.position = end
+        return line
+
+    def read_lines(self, number_of_lines):
+        """
+        Reads up to ``number_of_lines`` lines.
+
+        :param number_of_lines: The maximum number of lines to read.
+        :return: A tuple of the number of lines that have been read and a ``memoryview`` spanning these lines.
+        """
+        start = self.position
+        size = len(self.view)
+        end = start
+        lines = 0
+        while lines < number_of_lines and end < size:
+            end = self._end_of_line(end)
+            lines += 1
+        self.position = end
+        return lines, self.view[start:end]
+
+    def close(self):
+        self.view.release()
+        self.view = None
+        if self.mm:
+            self.mm.close()
+            self.mm = None
+        self.f.close()
+        self.f = None
+
+
+class CompressedSource:
+    """
+    A file source that reads lines directly from a bz2 or gzip archive without decompressing it to disk first. It relies on the block
+    index that is created by ``io.prepare_block_index()`` to start decompressing at the block that precedes the requested position.
+    """
+
+    # initial guess of the line length in bytes which determines how much data we inspect to find line boundaries
+    INITIAL_LINE_LENGTH_ESTIMATE = 512
+
+    @staticmethod
+    def open(file_name, mode):
+        return CompressedSource(file_name, mode)
+
+    def __init__(self, file_name, mode):
+        if "b" not in mode:
+            raise exceptions.RallyAssertionError("CompressedSource supports only binary mode but mode was [%s]" % mode)
+        self.blocks = io.read_block_index(file_name)
+        if self.blocks is None:
+            raise exceptions.DataError("No valid block index found for [%s]." % file_name)
+        self.f = open(file_name, mode)
+        self.decompressor = io.MultiMemberDecompressor(file_name)
+        self.buffer = b""
+        self.position = 0
+        self.line_length_estimate = CompressedSource.INITIAL_LINE_LENGTH_ESTIMATE
+
+    def _start_at_block(self, block):
+        compressed_offset, _, _ = block
+        self.f.seek(compressed_offset)
+        self.decompressor.reset()
+        self.buffer = b""
+        self.position = 0
+
+    def seek(self, offset):
+        """
+        Moves to the provided offset in the uncompressed data.
+        """
+        uncompressed_offsets = [block[1] for block in self.blocks]
+        block = self.blocks[max(bisect.bisect_right(uncompressed_offsets, offset) - 1, 0)]
+        self._start_at_block(block)
+        remaining = offset - block[1]
+        while remaining > 0:
+            if len(self.buffer) >= remaining:
+                self.position = remaining
+                break
+            remaining -= len(self.buffer)
+            self.buffer = b""
+            if not self._fill():
+                break
+
+    def skip_lines(self, number_of_lines):
+        """
+        Moves to the start of the provided line (starting at line zero).
+        """
+        # the last block that starts before the newline that terminates the line preceding the target line
+        newlines_before = [block[2] for block in self.blocks]
+        block = self.blocks[max(bisect.bisect_left(newlines_before, number_of_lines) - 1, 0)]
+        self._start_at_block(block)
+        remaining_lines = number_of_lines - block[2]
+        if remaining_lines > 0:
+            self.read_lines(remaining_lines)
+
+    def _fill(self):
+        """
+        Appends the next decompressed chunk to the buffer and drops everything that has been consumed already.
+
+        :return: False iff the end of the archive has been reached.
+        """
+        while True:
+            data = self.f.read(io.ARCHIVE_CHUNK_SIZE)
+            if not data:
+                return False
+            decompressed = b"".join(d for d, _ in self.decompressor.decompress(data))
+            if decompressed:
+                self.buffer = self.buffer[self.position:] + decompressed
+                self.position = 0
+                return True
+
+    def readline(self):
+        while True:
+            end = self.buffer.find(b"\n", self.position)
+            if end != -1:
+                line = self.buffer[self.position:end + 1]
+                self.position = end + 1
+                return line
+            if not self._fill():
+                # the last line may not be terminated
+                line = self.buffer[self.position:]
+                self.position = len(self.buffer)
+                return line
+
+    def _end_of_lines(self, number_of_lines):
+        """
+        :return: The position after the end of the ``number_of_lines``th line in the buffer or -1 if the buffer contains fewer lines.
+        """
+        start = self.position
+        size = len(self.buffer)
+        window = self.line_length_estimate * number_of_lines
+        while True:
+            end = min(start + window, size)
+            newlines = self.buffer.count(b"\n", start, end)
+            if newlines >= number_of_lines:
+                break
+            if end == size:
+                return -1
+            window *= 2
+        # move backwards to the end of the last requested line
+        for _ in range(newlines - number_of_lines + 1):
+            end = self.buffer.rfind(b"\n", start, end)
+        return end + 1
+
+    def read_lines(self, number_of_lines):
+        """
+        Reads up to ``number_of_lines`` lines.
+
+        :param number_of_lines: The maximum number of lines to read.
+        :return: A tuple of the number of lines that have been read and a ``bytes`` object spanning these lines.
+        """
+        parts = []
+        lines = 0
+        while lines < number_of_lines:
+            end = self._end_of_lines(number_of_lines - lines)
+            if end != -1:
+                parts.append(self.buffer[self.position:end])
+                self.position = end
+                lines = number_of_lines
+                break
+            # consume the entire buffer; it may end with the beginning of a line that continues in the next chunk
+            lines += self.buffer.count(b"\n", self.position)
+            parts.append(self.buffer[self.position:])
+            self.position = len(self.buffer)
+            if not self._fill():
+                break
+        data = b"".join(parts)
+        # we have reached the end of the archive and the last line may not be terminated
+        if lines < number_of_lines and data and not data.endswith(b"\n"):
+            lines += 1
+        if lines > 0:
+            # leave some headroom to avoid enlarging the window
+            self.line_length_estimate = max(int(len(data) / lines * 1.1), 1)
+        return lines, data
+
+    def close(self):
+        self.f.close()
+        self.f = None
+        self.buffer = None
+
+
 class IndexDataReader:
     """
-    Reads an index file in bulks into an array and also adds the necessary meta-data line before each document.
+    Reads an index file in bulks and also adds the necessary meta-data line before each document. Each bulk is returned as a tuple of the
+    number of documents and a ready-to-send bulk body (``bytes``) so the Elasticsearch client does not need to serialize it again.
+
+    Lines can be either ``bytes`` or ``memoryview`` objects (see ``MmapSource``). In the latter case, documents are not copied before the
+    bulk body is assembled. Documents are sent as they are stored in the data file, i.e. surrounding whitespace (including a carriage
+    return before the newline) is not stripped.
     """
 
-    def __init__(self, data_file, docs_to_index, conflicting_ids, index_name, type_name, bulk_size, offset=0, file_source=FileSource):
+    NEWLINE = re.compile(b"\n")
+
+    def __init__(self, data_file, docs_to_index, conflicting_ids, index_name, type_name, bulk_size, offset=0, file_source=FileSource,
+                 rnd=random):
         self.data_file = data_file
         self.docs_to_index = docs_to_index
         self.conflicting_ids = conflicting_ids
@@ -361,10 +693,13 @@ class IndexDataReader:
         self.current_bulk = 0
         self.offset = offset
         self.file_source = file_source
+        self.rnd = rnd
         self.f = None
+        # without id conflicts, the meta-data line is the same for all documents
+        self.action_metadata_line = ('{"index": {"_index": "%s", "_type": "%s"}}\n' % (index_name, type_name)).encode("utf-8")
 
     def __enter__(self):
-        self.f = self.file_source.open(self.data_file, 'rt')
+        self.f = self.file_source.open(self.data_file, 'rb')
         # skip offset number of lines
         logger.info("Skipping %d lines in [%s]." % (self.offset, self.data_file))
         start = time.perf_counter()
@@ -378,7 +713,7 @@ class IndexDataReader:
 
     def __next__(self):
         """
-        Returns lines for one bulk request.
+        Returns a tuple of the number of documents and the body for one bulk request.
         """
         buffer = []
         try:
@@ -388,32 +723,139 @@ class IndexDataReader:
                 raise StopIteration()
 
             this_bulk_size = min(self.bulk_size, docs_left)
+            if self.conflicting_ids is None and hasattr(self.f, "read_lines"):
+                docs_indexed, lines = self.f.read_lines(this_bulk_size)
+                self.current_bulk += 1
+                return docs_indexed, self.bulk_body(lines)
             while docs_indexed < this_bulk_size:
                 line = self.f.readline()
                 if len(line) == 0:
                     break
-                line = line.strip()
                 if self.conflicting_ids is not None:
                     # 25% of the time we replace a doc:
-                    if self.id_up_to > 0 and random.randint(0, 3) == 3:
-                        doc_id = self.conflicting_ids[random.randint(0, self.id_up_to - 1)]
+                    if self.id_up_to > 0 and self.rnd.randint(0, 3) == 3:
+                        doc_id = self.conflicting_ids[self.rnd.randint(0, self.id_up_to - 1)]
                     else:
                         doc_id = self.conflicting_ids[self.id_up_to]
                         self.id_up_to += 1
-                    cmd = '{"index": {"_index": "%s", "_type": "%s", "_id": "%s"}}' % (self.index_name, self.type_name, doc_id)
+                    cmd = ('{"index": {"_index": "%s", "_type": "%s", "_id": "%s"}}\n' %
+                           (self.index_name, self.type_name, doc_id)).encode("utf-8")
                 else:
-                    cmd = '{"index": {"_index": "%s", "_type": "%s"}}' % (self.index_name, self.type_name)
+                    cmd = self.action_metadata_line
 
                 buffer.append(cmd)
                 buffer.append(line)
+                # the bulk API requires each line to be terminated by a newline, also the last one
+                if line[-1:] != b"\n":
+                    buffer.append(b"\n")
 
                 docs_indexed += 1
 
             self.current_bulk += 1
-            return buffer
+            return docs_indexed, b"".join(buffer)
         except IOError:
             logger.exception("Could not read [%s]" % self.data_file)
 
+    def bulk_body(self, lines):
+        """
+        Creates a bulk body from a block of consecutive documents by inserting the (same) meta-data line before each document. Documents
+        are copied exactly once, when the bulk body is assembled.
+        """
+        # slicing a memoryview is free
+        lines = memoryview(lines)
+        action = self.action_metadata_line
+        parts = []
+        start = 0
+        for newline in IndexDataReader.NEWLINE.finditer(lines):
+            end = newline.end()
+            parts.append(action)
+            parts.append(lines[start:end])
+            start = end
+        if start < len(lines):
+            # the last line is not terminated
+            parts.append(action)
+            parts.append(lines[start:])
+            parts.append(b"\n")
+        return b"".join(parts)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.f:
+            self.f.close()
+            self.f = None
+        return False
+
+
+# Binary bulk cache index: A header (magic bytes, number of bulks) followed by one entry per bulk. Each entry consists of the size of the
+# bulk body in bytes and the number of documents in it. All numbers are unsigned 64 bit little-endian integers. The bulk bodies are
+# stored back to back in a separate file.
+BULK_CACHE_MAGIC = b"RLYBULK1"
+BULK_CACHE_HEADER = struct.Struct("<8sQ")
+BULK_CACHE_ENTRY = struct.Struct("<QQ")
+
+
+def bulk_cache_path(cache_dir, document_checksum, index_name, type_name, bulk_size, offset, num_docs, id_conflicts, seed):
+    """
+    :return: The path to the file with cached bulk bodies for the provided parameters. The corresponding index has the extension
+             ``.index``.
+    """
+    key = "%s/%s/%s/%d/%d/%d/%s/%s" % (document_checksum, index_name, type_name, bulk_size, offset, num_docs, id_conflicts, seed)
+    return os.path.join(cache_dir, "%s.bulks" % hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+
+def _read_bulk_cache_index(cache_file):
+    """
+    :return: A list of (size in bytes, number of documents) tuples per bulk or ``None`` if there is no valid index for this cache file.
+    """
+    index_file = "%s.index" % cache_file
+    if not os.path.exists(index_file) or not os.path.exists(cache_file):
+        return None
+    with open(index_file, mode="rb") as f:
+        header = f.read(BULK_CACHE_HEADER.size)
+        if len(header) < BULK_CACHE_HEADER.size:
+            return None
+        magic, number_of_bulks = BULK_CACHE_HEADER.unpack(header)
+        entries = f.read()
+    if magic != BULK_CACHE_MAGIC or len(entries) != number_of_bulks * BULK_CACHE_ENTRY.size:
+        return None
+    bulks = list(BULK_CACHE_ENTRY.iter_unpack(entries))
+    if sum(size for size, _ in bulks) != os.path.getsize(cache_file):
+        return None
+    return bulks
+
+
+class BulkCacheReader:
+    """
+    Reads bulk bodies that have been stored by ``BulkCacheWriter`` in a previous benchmark. Bulks are returned in the same format as by
+    ``IndexDataReader``.
+    """
+
+    @staticmethod
+    def is_valid(cache_file):
+        return _read_bulk_cache_index(cache_file) is not None
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.bulks = None
+        self.current_bulk = 0
+        self.f = None
+
+    def __enter__(self):
+        self.bulks = _read_bulk_cache_index(self.cache_file)
+        if self.bulks is None:
+            raise exceptions.DataError("Bulk cache [%s] is corrupt." % self.cache_file)
+        self.f = open(self.cache_file, mode="rb")
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.f is None or self.current_bulk >= len(self.bulks):
+            raise StopIteration()
+        size, docs_in_bulk = self.bulks[self.current_bulk]
+        self.current_bulk += 1
+        return docs_in_bulk, self.f.read(size)
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.f:
             self.f.close()
@@ -421,5 +863,65 @@ class IndexDataReader:
         return False
 
 
+class BulkCacheWriter:
+    """
+    Wraps another reader and stores all bulk bodies that it returns so they can be read by ``BulkCacheReader`` in subsequent benchmarks.
+    The cache is stored as soon as the bulk with the last document has been read. Schedules do not ask for another bulk after the last
+    one so we cannot rely on the wrapped reader being exhausted.
+    """
+
+    def __init__(self, cache_file, reader, docs_to_index):
+        self.cache_file = cache_file
+        self.reader = reader
+        self.docs_to_index = docs_to_index
+        # multiple clients may write to the cache directory concurrently
+        self.tmp_cache_file = "%s.%d.tmp" % (cache_file, os.getpid())
+        self.bulks = []
+        self.docs_read = 0
+        self.stored = False
+        self.f = None
+
+    def __enter__(self):
+        io.ensure_dir(os.path.dirname(self.cache_file))
+        self.f = open(self.tmp_cache_file, mode="wb")
+        self.reader.__enter__()
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        docs_in_bulk, bulk = next(self.reader)
+        if not self.stored:
+            self.f.write(bulk)
+            self.bulks.append((len(bulk), docs_in_bulk))
+            self.docs_read += docs_in_bulk
+            if self.docs_read >= self.docs_to_index:
+                self.store()
+        return docs_in_bulk, bulk
+
+    def store(self):
+        self.f.close()
+        self.f = None
+        tmp_index_file = "%s.index" % self.tmp_cache_file
+        with open(tmp_index_file, mode="wb") as index:
+            index.write(BULK_CACHE_HEADER.pack(BULK_CACHE_MAGIC, len(self.bulks)))
+            for bulk in self.bulks:
+                index.write(BULK_CACHE_ENTRY.pack(*bulk))
+        # the cache is only considered valid once the index exists so it has to be moved last
+        os.replace(self.tmp_cache_file, self.cache_file)
+        os.replace(tmp_index_file, "%s.index" % self.cache_file)
+        self.stored = True
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.reader.__exit__(exc_type, exc_val, exc_tb)
+        if not self.stored:
+            self.f.close()
+            self.f = None
+            logger.info("Discarding incomplete bulk cache [%s]." % self.tmp_cache_file)
+            os.remove(self.tmp_cache_file)
+        return False
+
+
 register_param_source_for_operation(track.OperationType.Index, BulkIndexParamSource)
 register_param_source_for_operation(track.OperationType.Search, SearchParamSource)
@@ -38,7 +38,7 @@ class Type:
 
     def __init__(self, name, mapping_file, document_file=None, document_archive=None, number_of_documents=0,
                  compressed_size_in_bytes=0,
-                 uncompressed_size_in_bytes=0):
+                 uncompressed_size_in_bytes=0, read_from_archive=False, document_checksum=None, bulk_cache_dir=None):
         """
 
         Creates a new type. Mappings are mandatory but the document_archive (and associated properties) are optional.
@@ -55,6 +55,9 @@ class Type:
          user reporting. Only needed if a document_archive is given.
         :param uncompressed_size_in_bytes: The size in bytes of the benchmark document after decompressing it. Only needed if a
         document_archive is given.
+        :param read_from_archive: Whether documents are read directly from the document_archive instead of the decompressed document_file.
+        :param document_checksum: The checksum of the benchmark document. Only needed if a bulk_cache_dir is given.
+        :param bulk_cache_dir: The directory in which bulk bodies are cached across benchmarks. Optional (no caching by default).
         """
         self.name = name
         self.mapping_file = mapping_file
@@ -63,6 +66,9 @@ class Type:
         self.number_of_documents = number_of_documents
         self.compressed_size_in_bytes = compressed_size_in_bytes
         self.uncompressed_size_in_bytes = uncompressed_size_in_bytes
+        self.read_from_archive = read_from_archive
+        self.document_checksum = document_checksum
+        self.bulk_cache_dir = bulk_cache_dir
 
     def has_valid_document_data(self):
         return self.document_file is not None and \
@@ -178,13 +184,19 @@ class Parallel:
 
 
 class Task:
-    def __init__(self, operation, warmup_iterations=0, warmup_time_period=None, iterations=1, clients=1, target_throughput=None):
+    def __init__(self, operation, warmup_iterations=0, warmup_time_period=None, iterations=1, clients=1, target_throughput=None,
+                 arrival_process="fixed", burst_size=1, open_loop=False, catch_up="unbounded", catch_up_burst=10):
         self.operation = operation
         self.warmup_iterations = warmup_iterations
         self.warmup_time_period = warmup_time_period
         self.iterations = iterations
         self.clients = clients
         self.target_throughput = target_throughput
+        self.arrival_process = arrival_process
+        self.burst_size = burst_size
+        self.open_loop = open_loop
+        self.catch_up = catch_up
+        self.catch_up_burst = catch_up_burst
 
     def __iter__(self):
         return iter([self])
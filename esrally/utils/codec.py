@@ -0,0 +1,107 @@
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; we fall back to the json module of the standard library
+    orjson = None
+
+
+def _default(data):
+    # the same types that the Elasticsearch client supports on top of plain JSON
+    if isinstance(data, (datetime.date, datetime.datetime)):
+        return data.isoformat()
+    elif isinstance(data, decimal.Decimal):
+        return float(data)
+    elif isinstance(data, uuid.UUID):
+        return str(data)
+    raise TypeError("Unable to serialize %r (type: %s)" % (data, type(data)))
+
+
+class StdlibCodec:
+    """
+    Encodes and decodes JSON with the json module of the standard library.
+    """
+    name = "json"
+
+    def dumps(self, data):
+        """
+        :param data: The object to encode.
+        :return: The compact JSON representation of ``data`` as UTF-8 encoded ``bytes``.
+        """
+        return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, s):
+        """
+        :param s: A JSON document as ``str`` or ``bytes``.
+        :return: The decoded object.
+        """
+        return json.loads(s)
+
+
+class OrjsonCodec:
+    """
+    Encodes and decodes JSON with orjson. The output is equivalent to the output of ``StdlibCodec`` although it may differ in the
+    representation of some floating point numbers (e.g. ``1e16`` instead of ``1e+16``).
+
+    orjson only supports integers in the range of a signed or unsigned 64 bit integer. Documents with larger integers are encoded by
+    ``StdlibCodec``. On decoding, orjson returns such integers as floats; Elasticsearch does not produce them in its responses so we do
+    not pay for detecting them on every document. Documents that orjson rejects (e.g. because a number is out of range) are decoded by
+    ``StdlibCodec``.
+    """
+    name = "orjson"
+
+    def __init__(self):
+        self.fallback = StdlibCodec()
+
+    def dumps(self, data):
+        try:
+            return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bit. Let the standard library decide (it raises a TypeError for unsupported types as well).
+            return self.fallback.dumps(data)
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the standard library. Let the standard library decide.
+            return self.fallback.loads(s)
+
+
+def available_codecs():
+    """
+    :return: All codecs that can be used in this environment, fastest first.
+    """
+    codecs = []
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    codecs.append(StdlibCodec())
+    return codecs
+
+
+# the fastest available codec is used throughout Rally
+codec = available_codecs()[0]
+
+
+def dumps(data):
+    """
+    Encodes ``data`` with the fastest available codec.
+
+    :param data: The object to encode.
+    :return: The compact JSON representation of ``data`` as UTF-8 encoded ``bytes``.
+    """
+    return codec.dumps(data)
+
+
+def loads(s):
+    """
+    Decodes ``s`` with the fastest available codec.
+
+    :param s: A JSON document as ``str`` or ``bytes``.
+    :return: The decoded object.
+    """
+    return codec.loads(s)
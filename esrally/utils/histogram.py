@@ -0,0 +1,196 @@
+import array
+import collections
+import math
+
+
+class Histogram:
+    """
+    A histogram with a fixed memory footprint that records values with a configurable number of significant decimal digits. The bucket
+    layout follows HdrHistogram (http://hdrhistogram.org/): Buckets cover power-of-two ranges and each bucket is divided into linear
+    sub-buckets so the relative error of any recorded value is bounded by the number of significant digits.
+
+    Values are recorded as multiples of ``resolution`` (e.g. a resolution of 0.001 for values in milliseconds records microseconds).
+    Values above ``highest_trackable_value`` are recorded in the highest bucket but exact minimum, maximum and sum are always kept.
+
+    The number of counts grows by a factor of ten with each significant digit. Merging and percentile lookups only visit the range of
+    counts between the lowest and the highest recorded value so their cost depends on the spread of recorded values, not on the size of
+    the histogram.
+    """
+
+    def __init__(self, highest_trackable_value, significant_digits=3, resolution=1):
+        """
+        Creates a new, empty histogram.
+
+        :param highest_trackable_value: The highest value that should be tracked with the requested precision.
+        :param significant_digits: The number of significant decimal digits to keep for each value. Has to be between 1 and 5.
+        :param resolution: The smallest value that can be discerned from zero. Defaults to 1.
+        """
+        if significant_digits < 1 or significant_digits > 5:
+            raise ValueError("Significant digits must be between 1 and 5 but was [%s]" % str(significant_digits))
+        if resolution <= 0:
+            raise ValueError("Resolution must be positive but was [%s]" % str(resolution))
+        if highest_trackable_value < 2 * resolution:
+            raise ValueError("Highest trackable value must be at least twice the resolution but was [%s]" % str(highest_trackable_value))
+        self.highest_trackable_value = highest_trackable_value
+        self.significant_digits = significant_digits
+        self.resolution = resolution
+
+        largest_value_with_single_unit_resolution = 2 * 10 ** significant_digits
+        self._sub_bucket_count_magnitude = int(math.ceil(math.log(largest_value_with_single_unit_resolution, 2)))
+        self._sub_bucket_half_count_magnitude = self._sub_bucket_count_magnitude - 1
+        self._sub_bucket_count = 1 << self._sub_bucket_count_magnitude
+        self._sub_bucket_half_count = self._sub_bucket_count // 2
+        self._sub_bucket_mask = self._sub_bucket_count - 1
+
+        self._highest_unit = self._to_units(highest_trackable_value)
+        bucket_count = 1
+        smallest_untrackable_value = self._sub_bucket_count
+        while smallest_untrackable_value <= self._highest_unit:
+            smallest_untrackable_value <<= 1
+            bucket_count += 1
+        self._counts = array.array("q", [0]) * ((bucket_count + 1) * self._sub_bucket_half_count)
+        # the range of indices with non-zero counts (both inclusive)
+        self._min_index = None
+        self._max_index = None
+
+        self.total_count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+
+    def _to_units(self, value):
+        return int(round(value / self.resolution))
+
+    def _counts_index(self, units):
+        bucket_index = (units | self._sub_bucket_mask).bit_length() - self._sub_bucket_count_magnitude
+        sub_bucket_index = units >> bucket_index
+        return ((bucket_index + 1) << self._sub_bucket_half_count_magnitude) + (sub_bucket_index - self._sub_bucket_half_count)
+
+    def _highest_equivalent_units(self, index):
+        bucket_index = (index >> self._sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self._sub_bucket_half_count - 1)) + self._sub_bucket_half_count
+        if bucket_index < 0:
+            sub_bucket_index -= self._sub_bucket_half_count
+            bucket_index = 0
+        return (sub_bucket_index << bucket_index) + (1 << bucket_index) - 1
+
+    def record_value(self, value, count=1):
+        """
+        Records a value ``count`` times.
+
+        :param value: A non-negative value.
+        :param count: How often this value should be recorded. Defaults to 1.
+        """
+        units = min(max(self._to_units(value), 0), self._highest_unit)
+        index = self._counts_index(units)
+        self._counts[index] += count
+        self._track_index(index, index)
+        self.total_count += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def _track_index(self, min_index, max_index):
+        if self._min_index is None or min_index < self._min_index:
+            self._min_index = min_index
+        if self._max_index is None or max_index > self._max_index:
+            self._max_index = max_index
+
+    def _non_zero_counts(self):
+        """
+        :return: An iterator over all pairs of index and count with a non-zero count in ascending order of the index.
+        """
+        if self._min_index is None:
+            return
+        for index, count in enumerate(self._counts[self._min_index:self._max_index + 1], start=self._min_index):
+            if count:
+                yield index, count
+
+    def add(self, other):
+        """
+        Merges all values of another histogram into this one. Both histograms need to have the same layout.
+
+        :param other: A histogram with the same highest trackable value, significant digits and resolution.
+        """
+        if (self.highest_trackable_value, self.significant_digits, self.resolution) != \
+                (other.highest_trackable_value, other.significant_digits, other.resolution):
+            raise ValueError("Cannot merge histograms with a different layout.")
+        for index, count in other._non_zero_counts():
+            self._counts[index] += count
+        if other._min_index is not None:
+            self._track_index(other._min_index, other._max_index)
+        self.total_count += other.total_count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    @property
+    def mean(self):
+        return self.sum / self.total_count if self.total_count > 0 else None
+
+    def value_at_percentile(self, percentile):
+        return self.values_at_percentiles([percentile])[percentile]
+
+    def values_at_percentiles(self, percentiles):
+        """
+        Determines values at the provided percentiles with a single pass over the histogram.
+
+        :param percentiles: A list of percentiles between [0, 100].
+        :return: An ordered dictionary of the determined percentile values in ascending order. Key is the percentile, value is the
+        highest value that is equivalent (within the histogram's precision) to the value at this percentile. If the histogram is empty,
+        the dictionary is empty.
+        """
+        result = collections.OrderedDict()
+        if self.total_count == 0:
+            return result
+        targets = sorted((max(int(math.ceil(float(p) / 100.0 * self.total_count)), 1), p) for p in percentiles)
+        running_count = 0
+        target_index = 0
+        for index, count in self._non_zero_counts():
+            running_count += count
+            while target_index < len(targets) and running_count >= targets[target_index][0]:
+                if targets[target_index][0] == self.total_count:
+                    # the largest recorded value is known exactly
+                    value = self.max
+                else:
+                    # never report anything outside of the actually recorded range
+                    value = min(max(self._highest_equivalent_units(index) * self.resolution, self.min), self.max)
+                result[targets[target_index][1]] = value
+                target_index += 1
+            if target_index == len(targets):
+                break
+        return result
+
+    def to_snapshot(self):
+        """
+        :return: A sparse, JSON serializable representation of this histogram.
+        """
+        return {
+            "highest-trackable-value": self.highest_trackable_value,
+            "significant-digits": self.significant_digits,
+            "resolution": self.resolution,
+            "total-count": self.total_count,
+            "min": self.min,
+            "max": self.max,
+            "sum": self.sum,
+            "counts": [[index, count] for index, count in self._non_zero_counts()]
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Recreates a histogram from a snapshot that has been created with #to_snapshot().
+        """
+        h = cls(snapshot["highest-trackable-value"], snapshot["significant-digits"], snapshot["resolution"])
+        for index, count in snapshot["counts"]:
+            h._counts[index] = count
+            h._track_index(index, index)
+        h.total_count = snapshot["total-count"]
+        h.min = snapshot["min"]
+        h.max = snapshot["max"]
+        h.sum = snapshot["sum"]
+        return h
@@ -1,15 +1,31 @@
 import os
+import array
+import collections
+import concurrent.futures
 import errno
+import hashlib
+import itertools
 import re
+import shutil
+import struct
 import subprocess
+import sys
+import tempfile
 import bz2
 import gzip
 import zipfile
 import tarfile
 import logging
+import zlib
 
 from esrally.utils import console
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional; it only speeds up the creation of file offset tables
+    np = None
+
 logger = logging.getLogger("rally.utils.io")
 
 
@@ -68,18 +84,158 @@ def decompress(zip_name, target_directory):
     filename, extension = splitext(zip_name)
     if extension == ".zip":
         _do_decompress(target_directory, zipfile.ZipFile(zip_name))
-    elif extension == ".bz2":
-        with open(filename, 'wb') as new_file, bz2.BZ2File(zip_name, 'rb') as file:
-            for data in iter(lambda: file.read(100 * 1024), b''):
-                new_file.write(data)
-    elif extension == ".gz":
-        _do_decompress(target_directory, gzip.open(zip_name))
+    elif extension in [".bz2", ".gz"]:
+        _decompress_file(zip_name, filename)
     elif extension in [".tar", ".tar.gz", ".tgz", ".tar.bz2"]:
         _do_decompress(target_directory, tarfile.open(zip_name))
     else:
         raise RuntimeError("Unsupported file extension [%s]. Cannot decompress [%s]" % (extension, zip_name))
 
 
+# archives are split into ranges of at least this many compressed bytes that are decompressed in parallel
+DECOMPRESSION_RANGE_SIZE = 8 * 1024 * 1024
+# each bz2 stream starts with a header ("BZh" and the block size) which is immediately followed by the magic number of the first block
+BZ2_STREAM_START = re.compile(rb"BZh[1-9]1AY&SY")
+# a BGZF member is a gzip member with an extra field that contains the subfield "BC" with the total member size minus one
+BGZF_HEADER = struct.Struct("<4s6xH2sHH")
+
+
+def _decompress_file(archive_path, target_path, max_workers=None, range_size=DECOMPRESSION_RANGE_SIZE):
+    """
+    Decompresses a bz2 or gzip archive which contains a single file. If the archive consists of multiple members (as created by parallel
+    compression tools like ``pbzip2`` or ``bgzip``), ranges of members are decompressed in parallel by worker processes.
+
+    :param archive_path: The path to a bz2 or gzip archive.
+    :param target_path: The path of the decompressed file.
+    :param max_workers: The maximum number of worker processes. Defaults to the number of CPU cores.
+    :param range_size: The minimum number of compressed bytes that are processed by a single worker.
+    """
+    ranges = _member_ranges(archive_path, range_size)
+    if len(ranges) > 1:
+        logger.info("Decompressing [%d] ranges of [%s] in parallel." % (len(ranges), archive_path))
+        if _decompress_in_parallel(archive_path, target_path, ranges, max_workers):
+            return
+        logger.warn("Could not decompress [%s] in parallel. Falling back to sequential decompression." % archive_path)
+    compressed_file_type = bz2.BZ2File if splitext(archive_path)[1] == ".bz2" else gzip.GzipFile
+    # both implementations support archives with multiple members
+    with open(target_path, "wb") as new_file, compressed_file_type(archive_path, "rb") as file:
+        for data in iter(lambda: file.read(ARCHIVE_CHUNK_SIZE), b""):
+            new_file.write(data)
+
+
+def _member_ranges(archive_path, range_size):
+    """
+    :return: A list of (start, end) tuples of byte ranges in the archive that start and end at a member boundary.
+    """
+    archive_size = os.path.getsize(archive_path)
+    starts = []
+    for offset in _member_offsets(archive_path, archive_size):
+        if not starts or offset - starts[-1] >= range_size:
+            starts.append(offset)
+    return list(zip(starts, starts[1:] + [archive_size]))
+
+
+def _member_offsets(archive_path, archive_size):
+    """
+    Determines the start of members without decompressing the archive. Results are not guaranteed to be exact: For bz2 archives, the byte
+    sequence that starts a stream might also appear within compressed data. For gzip archives, only BGZF members can be determined. In
+    any case, the first member starts at offset zero.
+    """
+    if splitext(archive_path)[1] == ".bz2":
+        return _bz2_member_offsets(archive_path)
+    else:
+        return _bgzf_member_offsets(archive_path, archive_size)
+
+
+def _bz2_member_offsets(archive_path):
+    offsets = [0]
+    # a match needs to start before the last (pattern length - 1) bytes of a chunk; otherwise it will be found in the next one
+    overlap = len(BZ2_STREAM_START.pattern) - 1
+    with open(archive_path, mode="rb") as archive:
+        position = 0
+        tail = b""
+        for chunk in iter(lambda: archive.read(ARCHIVE_CHUNK_SIZE), b""):
+            data = tail + chunk
+            data_offset = position - len(tail)
+            offsets.extend(data_offset + m.start() for m in BZ2_STREAM_START.finditer(data) if data_offset + m.start() > 0)
+            tail = data[-overlap:]
+            position += len(chunk)
+    return offsets
+
+
+def _bgzf_member_offsets(archive_path, archive_size):
+    offsets = [0]
+    with open(archive_path, mode="rb") as archive:
+        position = 0
+        while True:
+            archive.seek(position)
+            header = archive.read(BGZF_HEADER.size)
+            if len(header) < BGZF_HEADER.size:
+                break
+            magic, extra_length, subfield_id, subfield_length, member_size = BGZF_HEADER.unpack(header)
+            if magic != b"\x1f\x8b\x08\x04" or extra_length != 6 or subfield_id != b"BC" or subfield_length != 2:
+                # not a BGZF member; decompress the rest of the archive at once
+                break
+            position += member_size + 1
+            if position >= archive_size:
+                break
+            offsets.append(position)
+    return offsets
+
+
+def _decompress_range(archive_path, start, end, part_path):
+    """
+    Decompresses the members in the provided byte range of the archive to a separate file. Data are written as they are decompressed so
+    memory usage does not depend on the size of the range.
+
+    :return: True iff the range consists of complete members and could be decompressed.
+    """
+    decompressor = MultiMemberDecompressor(archive_path)
+    member_ended = True
+    try:
+        with open(part_path, "wb") as part:
+            for _, chunk in _chunks(archive_path, start, end, ARCHIVE_CHUNK_SIZE):
+                for decompressed, remaining in decompressor.decompress(chunk):
+                    part.write(decompressed)
+                    member_ended = remaining is not None
+    except (OSError, EOFError, zlib.error):
+        logger.exception("Could not decompress range [%d, %d) of [%s]." % (start, end, archive_path))
+        return False
+    return member_ended
+
+
+def _decompress_in_parallel(archive_path, target_path, ranges, max_workers):
+    """
+    Worker processes decompress each range to a temporary part file next to the target file. Parts are appended to the target file in
+    order and deleted afterwards so decompressed data are never held in memory.
+
+    :return: True iff all ranges could be decompressed.
+    """
+    # limit the number of pending parts as each of them occupies disk space until it is appended
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+    pending = collections.deque()
+    part_dir = tempfile.mkdtemp(prefix=".%s-parts-" % os.path.basename(target_path), dir=os.path.dirname(os.path.abspath(target_path)))
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        with open(target_path, "wb") as target:
+            for idx, r in enumerate(ranges):
+                part_path = os.path.join(part_dir, "%d.part" % idx)
+                pending.append((pool.submit(_decompress_range, archive_path, r[0], r[1], part_path), part_path))
+                while len(pending) >= max_pending or (pending and idx == len(ranges) - 1):
+                    future, part_path = pending.popleft()
+                    if not future.result():
+                        return False
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, target, ARCHIVE_CHUNK_SIZE)
+                    os.remove(part_path)
+        return True
+    finally:
+        for future, _ in pending:
+            future.cancel()
+        pool.shutdown()
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+
 def _do_decompress(target_directory, compressed_file):
     try:
         compressed_file.extractall(path=target_directory)
@@ -116,30 +272,359 @@ def splitext(file_name):
         return os.path.splitext(file_name)
 
 
-def prepare_file_offset_table(data_file_path):
+# Binary file offset table: A header (magic bytes, granularity, number of lines) followed by the byte offset of every
+# <granularity>th line (i.e. of the lines 0, granularity, 2 * granularity, ...). All numbers are unsigned 64 bit little-endian integers.
+OFFSET_TABLE_MAGIC = b"RLYOFST1"
+OFFSET_TABLE_HEADER = struct.Struct("<8sQQ")
+OFFSET_TABLE_ENTRY = struct.Struct("<Q")
+DEFAULT_OFFSET_TABLE_GRANULARITY = 1000
+
+
+def offset_table_path(data_file_path):
+    return "%s.offsets" % data_file_path
+
+
+def _read_offset_table_header(offset_table):
+    header = offset_table.read(OFFSET_TABLE_HEADER.size)
+    if len(header) < OFFSET_TABLE_HEADER.size:
+        return None
+    magic, granularity, number_of_lines = OFFSET_TABLE_HEADER.unpack(header)
+    if magic != OFFSET_TABLE_MAGIC or granularity == 0:
+        return None
+    return granularity, number_of_lines
+
+
+# the file offset table is built in parallel for byte ranges of at most this size...
+OFFSET_TABLE_RANGE_SIZE = 256 * 1024 * 1024
+# ... which are read in chunks of this size
+OFFSET_TABLE_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def prepare_file_offset_table(data_file_path, granularity=DEFAULT_OFFSET_TABLE_GRANULARITY, max_workers=None,
+                              range_size=OFFSET_TABLE_RANGE_SIZE):
     """
-    Creates a file that contains a mapping from line numbers to file offsets for the provided path. This file is used internally by
-    #skip_lines(data_file_path, data_file) to speed up line skipping.
+    Creates a binary file that contains the file offset of every ``granularity``th line in the provided file. This file is used
+    internally by #skip_lines(data_file_path, data_file, number_of_lines_to_skip) to seek to any line quickly.
+
+    Large files are split into byte ranges which are scanned in parallel by worker processes in two passes: The first pass counts
+    newlines per range which determines the number of the first line in each range. The second pass determines the offsets of the
+    relevant lines within each range.
 
     :param data_file_path: The path to a text file that is readable by this process.
+    :param granularity: Store the offset of every ``granularity``th line. 1 stores the offset of every line. Smaller values speed up
+                        seeking at the expense of a larger offset table (8 bytes per entry).
+    :param max_workers: The maximum number of worker processes. Defaults to the number of CPU cores.
+    :param range_size: The size in bytes of the ranges that are processed by a single worker.
     """
-    offset_file_path = "%s.offset" % data_file_path
+    if granularity < 1:
+        raise ValueError("Granularity must be at least 1 but was [%s]" % str(granularity))
+    offset_file_path = offset_table_path(data_file_path)
     # recreate only if necessary as this can be time-consuming
-    if not os.path.exists(offset_file_path) or os.path.getmtime(offset_file_path) < os.path.getmtime(data_file_path):
-        console.info("Preparing file offset table for [%s] ... " % data_file_path, end="", flush=True, logger=logger)
-        line_number = 0
-        with open(offset_file_path, mode="w") as offset_file:
-            with open(data_file_path, mode="rt") as data_file:
-                while True:
-                    line = data_file.readline()
-                    if len(line) == 0:
-                        break
-                    line_number += 1
-                    if line_number % 50000 == 0:
-                        print("%d;%d" % (line_number, data_file.tell()), file=offset_file)
-        console.println("[OK]")
+    if os.path.exists(offset_file_path) and os.path.getmtime(offset_file_path) >= os.path.getmtime(data_file_path):
+        with open(offset_file_path, mode="rb") as offset_file:
+            header = _read_offset_table_header(offset_file)
+        if header is not None and header[0] == granularity:
+            logger.info("Skipping creation of file offset table at [%s] as it is still valid." % offset_file_path)
+            return
+
+    file_size = os.path.getsize(data_file_path)
+    ranges = [(start, min(start + range_size, file_size)) for start in range(0, file_size, range_size)]
+    message = "Preparing file offset table for [%s]" % data_file_path
+    logger.info("%s with [%d] byte ranges." % (message, len(ranges)))
+    progress = console.progress()
+    # each range is processed twice
+    total_steps = 2 * len(ranges)
+    steps_done = 0
+
+    def report_progress():
+        progress.print(message, "[%3d%% done]" % (round(100 * steps_done / total_steps) if total_steps > 0 else 100))
+
+    report_progress()
+    # don't bother to start processes for small files
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) if len(ranges) > 1 else None
+    # limit the number of pending ranges as the offsets of each of them are held in memory until they are written
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+    try:
+        newlines = []
+        for count in _map_ordered(pool, _count_newlines, [(data_file_path, start, end) for start, end in ranges], max_pending):
+            newlines.append(count)
+            steps_done += 1
+            report_progress()
+
+        newlines_before = 0
+        line_offset_tasks = []
+        for (start, end), count in zip(ranges, newlines):
+            line_offset_tasks.append((data_file_path, start, end, newlines_before, granularity, file_size))
+            newlines_before += count
+        # the last line may not be terminated by a newline
+        number_of_lines = newlines_before + (1 if file_size > 0 and not _ends_with_newline(data_file_path, file_size) else 0)
+
+        with open(offset_file_path, mode="wb") as offset_file:
+            offset_file.write(OFFSET_TABLE_HEADER.pack(OFFSET_TABLE_MAGIC, granularity, number_of_lines))
+            if number_of_lines > 0:
+                # the first line always starts at offset zero
+                offset_file.write(OFFSET_TABLE_ENTRY.pack(0))
+            for offsets in _map_ordered(pool, _line_offsets, line_offset_tasks, max_pending):
+                offset_file.write(offsets)
+                steps_done += 1
+                report_progress()
+    except BaseException:
+        # never leave a partially written offset table behind
+        if os.path.exists(offset_file_path):
+            os.remove(offset_file_path)
+        raise
+    finally:
+        if pool:
+            pool.shutdown()
+        progress.finish()
+
+
+def _map_ordered(pool, fn, args, max_pending):
+    """
+    Applies ``fn`` to each argument tuple in ``args`` (in parallel if a pool is provided) and returns the results in order. At most
+    ``max_pending`` results are computed ahead of the caller so results of large files are never held in memory all at once.
+    """
+    if pool is None:
+        for a in args:
+            yield fn(*a)
+    else:
+        pending = collections.deque()
+        try:
+            for a in args:
+                pending.append(pool.submit(fn, *a))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _ends_with_newline(data_file_path, file_size):
+    with open(data_file_path, mode="rb") as data_file:
+        data_file.seek(file_size - 1)
+        return data_file.read(1) == b"\n"
+
+
+def _chunks(data_file_path, start, end, chunk_size=OFFSET_TABLE_CHUNK_SIZE):
+    """
+    :return: A generator of (offset, chunk) tuples that cover the byte range [start, end) of the provided file.
+    """
+    with open(data_file_path, mode="rb") as data_file:
+        data_file.seek(start)
+        position = start
+        while position < end:
+            chunk = data_file.read(min(end - position, chunk_size))
+            if not chunk:
+                break
+            yield position, chunk
+            position += len(chunk)
+
+
+def _count_newlines(data_file_path, start, end):
+    return sum(chunk.count(b"\n") for _, chunk in _chunks(data_file_path, start, end))
+
+
+def _line_offsets(data_file_path, start, end, newlines_before, granularity, file_size):
+    """
+    Determines the offsets of all lines that start after a newline in the byte range [start, end) and whose line number is a multiple
+    of ``granularity``.
+
+    :return: The offsets as unsigned 64 bit little-endian integers.
+    """
+    offsets = array.array("Q")
+    # the number of the line that starts after the next newline
+    next_line = newlines_before + 1
+    for chunk_offset, chunk in _chunks(data_file_path, start, end):
+        # index of the first newline in this chunk that is followed by a relevant line
+        first = -next_line % granularity
+        if np is not None:
+            newline_positions = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n"))
+            line_starts = newline_positions[first::granularity] + (chunk_offset + 1)
+            # a newline at the very end of the file does not start another line
+            offsets.frombytes(line_starts[line_starts < file_size].astype(np.uint64).tobytes())
+            next_line += len(newline_positions)
+        else:
+            # the line after the i-th newline starts at the accumulated length of all previous lines plus i + 1 newlines
+            line_lengths = list(itertools.accumulate(map(len, chunk.split(b"\n")[:-1])))
+            for i in range(first, len(line_lengths), granularity):
+                line_start = chunk_offset + line_lengths[i] + i + 1
+                if line_start < file_size:
+                    offsets.append(line_start)
+            next_line += len(line_lengths)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def is_streamable(archive_path):
+    """
+    :return: True iff documents can be read directly from the provided archive, i.e. without decompressing it first.
+    """
+    return splitext(archive_path)[1] in [".bz2", ".gz"]
+
+
+def _decompressor_factory(archive_path):
+    extension = splitext(archive_path)[1]
+    if extension == ".bz2":
+        return bz2.BZ2Decompressor
+    elif extension == ".gz":
+        # expect a gzip header and trailer
+        return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
     else:
-        logger.info("Skipping creation of file offset table at [%s] as it is still valid." % offset_file_path)
+        raise RuntimeError("Unsupported file extension [%s]. Cannot stream from [%s]" % (extension, archive_path))
+
+
+class MultiMemberDecompressor:
+    """
+    Incrementally decompresses a bz2 or gzip archive that consists of one or more concatenated members (as created for example by
+    ``pbzip2`` or ``bgzip``). Each member can be decompressed independently of all previous members.
+    """
+
+    def __init__(self, archive_path):
+        self.new_decompressor = _decompressor_factory(archive_path)
+        self.decompressor = None
+        self.reset()
+
+    def reset(self):
+        """
+        Discards all pending state. The next chunk that is passed to #decompress(data) has to start at a member boundary.
+        """
+        self.decompressor = self.new_decompressor()
+
+    def decompress(self, data):
+        """
+        Decompresses the next chunk of the archive.
+
+        :param data: The next chunk of compressed data.
+        :return: A generator of tuples (decompressed data, remaining) per member that has been processed. ``remaining`` is the number of
+                 bytes of ``data`` that follow the end of the member or ``None`` if the member does not end within ``data``.
+        """
+        while True:
+            decompressed = self.decompressor.decompress(data)
+            if self.decompressor.eof:
+                data = self.decompressor.unused_data
+                self.decompressor = self.new_decompressor()
+                yield decompressed, len(data)
+                if not data:
+                    break
+            else:
+                yield decompressed, None
+                break
+
+
+# Binary block index: A header (magic bytes, number of blocks, uncompressed size, number of lines) followed by one entry per block. Each
+# entry consists of the offset of the block in the archive, its offset in the uncompressed data and the number of newlines before it.
+# A block starts at a member boundary of the archive. All numbers are unsigned 64 bit little-endian integers.
+BLOCK_INDEX_MAGIC = b"RLYBLKS1"
+BLOCK_INDEX_HEADER = struct.Struct("<8sQQQ")
+BLOCK_INDEX_ENTRY = struct.Struct("<QQQ")
+# the minimum number of uncompressed bytes between two blocks. Small members (like the 64kB members that bgzip creates) are merged.
+BLOCK_INDEX_MIN_BLOCK_SIZE = 4 * 1024 * 1024
+# the archive is read in chunks of this size
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+
+def block_index_path(archive_path):
+    return "%s.blocks" % archive_path
+
+
+def _read_block_index_header(block_index):
+    header = block_index.read(BLOCK_INDEX_HEADER.size)
+    if len(header) < BLOCK_INDEX_HEADER.size:
+        return None
+    magic, number_of_blocks, uncompressed_size, number_of_lines = BLOCK_INDEX_HEADER.unpack(header)
+    if magic != BLOCK_INDEX_MAGIC or number_of_blocks == 0:
+        return None
+    return number_of_blocks, uncompressed_size, number_of_lines
+
+
+def read_block_index(archive_path):
+    """
+    Reads the block index that has been created with #prepare_block_index(archive_path).
+
+    :param archive_path: The path to a bz2 or gzip archive.
+    :return: A list of tuples (compressed offset, uncompressed offset, newlines before) ordered by offset or ``None`` if there is no
+             valid block index for this archive.
+    """
+    index_path = block_index_path(archive_path)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, mode="rb") as block_index:
+        header = _read_block_index_header(block_index)
+        if header is None:
+            return None
+        number_of_blocks = header[0]
+        entries = block_index.read(number_of_blocks * BLOCK_INDEX_ENTRY.size)
+    if len(entries) != number_of_blocks * BLOCK_INDEX_ENTRY.size:
+        return None
+    return list(BLOCK_INDEX_ENTRY.iter_unpack(entries))
+
+
+def prepare_block_index(archive_path, min_block_size=BLOCK_INDEX_MIN_BLOCK_SIZE):
+    """
+    Creates a binary file that contains the start of each member of the provided archive, both in the archive itself and in the
+    uncompressed data. This allows to start decompressing at (almost) any line without decompressing the archive first. Creating the
+    index requires a single pass over the entire archive.
+
+    Archives that consist of a single member (which is the case for archives created by plain ``bzip2`` or ``gzip``) can be read but have
+    only one block, i.e. readers always need to start decompressing at the beginning of the archive.
+
+    :param archive_path: The path to a bz2 or gzip archive.
+    :param min_block_size: The minimum number of uncompressed bytes per block.
+    :return: A tuple of the uncompressed size in bytes and the number of blocks.
+    """
+    index_path = block_index_path(archive_path)
+    # recreate only if necessary as this requires decompressing the entire archive
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(archive_path):
+        with open(index_path, mode="rb") as block_index:
+            header = _read_block_index_header(block_index)
+        if header is not None:
+            logger.info("Skipping creation of block index at [%s] as it is still valid." % index_path)
+            return header[1], header[0]
+
+    archive_size = os.path.getsize(archive_path)
+    message = "Preparing block index for [%s]" % archive_path
+    logger.info(message)
+    progress = console.progress()
+    decompressor = MultiMemberDecompressor(archive_path)
+    blocks = [(0, 0, 0)]
+    position = 0
+    uncompressed_size = 0
+    newlines = 0
+    last_byte = b""
+    member_ended = True
+    try:
+        with open(archive_path, mode="rb") as archive:
+            for data in iter(lambda: archive.read(ARCHIVE_CHUNK_SIZE), b""):
+                position += len(data)
+                for decompressed, remaining in decompressor.decompress(data):
+                    if decompressed:
+                        uncompressed_size += len(decompressed)
+                        newlines += decompressed.count(b"\n")
+                        last_byte = decompressed[-1:]
+                    member_ended = remaining is not None
+                    member_start = position - remaining if member_ended else None
+                    if member_ended and member_start < archive_size and uncompressed_size - blocks[-1][1] >= min_block_size:
+                        blocks.append((member_start, uncompressed_size, newlines))
+                progress.print(message, "[%3d%% done]" % round(100 * position / archive_size))
+        if not member_ended:
+            raise RuntimeError("Archive [%s] is truncated." % archive_path)
+        # the last line may not be terminated by a newline
+        number_of_lines = newlines + (1 if last_byte not in [b"", b"\n"] else 0)
+        with open(index_path, mode="wb") as block_index:
+            block_index.write(BLOCK_INDEX_HEADER.pack(BLOCK_INDEX_MAGIC, len(blocks), uncompressed_size, number_of_lines))
+            for block in blocks:
+                block_index.write(BLOCK_INDEX_ENTRY.pack(*block))
+    except BaseException:
+        # never leave a partially written block index behind
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        raise
+    finally:
+        progress.finish()
+    return uncompressed_size, len(blocks)
 
 
 def skip_lines(data_file_path, data_file, number_of_lines_to_skip):
@@ -148,27 +633,63 @@ def skip_lines(data_file_path, data_file, number_of_lines_to_skip):
 
     :param data_file_path: The full path to the data file.
     :param data_file: The data file. It is assumed that this file is already open for reading and its file pointer is at position zero.
+                      If it provides a method ``skip_lines(number_of_lines)``, skipping is delegated to it.
     :param number_of_lines_to_skip: A non-negative number of lines that should be skipped.
     """
-    offset_file_path = "%s.offset" % data_file_path
+    if hasattr(data_file, "skip_lines"):
+        data_file.skip_lines(number_of_lines_to_skip)
+        return
+    offset_file_path = offset_table_path(data_file_path)
     offset = 0
     remaining_lines = number_of_lines_to_skip
     # can we fast forward?
-    if os.path.exists(offset_file_path):
-        with open(offset_file_path) as offsets:
-            for line in offsets:
-                line_number, offset_in_bytes = [int(i) for i in line.strip().split(";")]
-                if line_number <= number_of_lines_to_skip:
-                    offset = offset_in_bytes
-                    remaining_lines = number_of_lines_to_skip - line_number
-                else:
-                    break
+    if number_of_lines_to_skip > 0 and os.path.exists(offset_file_path):
+        with open(offset_file_path, mode="rb") as offsets:
+            header = _read_offset_table_header(offsets)
+            if header is not None:
+                granularity, number_of_lines = header
+                # the entry of the closest line at or before the target line
+                entry = min(number_of_lines_to_skip, max(number_of_lines - 1, 0)) // granularity
+                offsets.seek(OFFSET_TABLE_HEADER.size + entry * OFFSET_TABLE_ENTRY.size)
+                raw_offset = offsets.read(OFFSET_TABLE_ENTRY.size)
+                if len(raw_offset) == OFFSET_TABLE_ENTRY.size:
+                    offset = OFFSET_TABLE_ENTRY.unpack(raw_offset)[0]
+                    remaining_lines = number_of_lines_to_skip - entry * granularity
+            else:
+                logger.warn("Ignoring invalid file offset table [%s]." % offset_file_path)
     # fast forward to the last known file offset
     data_file.seek(offset)
     # forward the last remaining lines if needed
     if remaining_lines > 0:
-        for line in range(remaining_lines):
-            data_file.readline()
+        if hasattr(data_file, "read_lines"):
+            data_file.read_lines(remaining_lines)
+        else:
+            for line in range(remaining_lines):
+                data_file.readline()
+
+
+def checksum(file_path):
+    """
+    Calculates the SHA-1 checksum of the provided file. As this is time-consuming for large files, the checksum is stored next to the
+    file with the extension ``.sha1`` and only recalculated if the file has changed since.
+
+    :param file_path: The path to a file that is readable by this process.
+    :return: The checksum as hex string.
+    """
+    checksum_path = "%s.sha1" % file_path
+    if os.path.exists(checksum_path) and os.path.getmtime(checksum_path) >= os.path.getmtime(file_path):
+        with open(checksum_path, mode="rt") as checksum_file:
+            stored_checksum = checksum_file.read().strip()
+        if re.fullmatch("[0-9a-f]{40}", stored_checksum):
+            return stored_checksum
+    sha1 = hashlib.sha1()
+    with open(file_path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(OFFSET_TABLE_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    file_checksum = sha1.hexdigest()
+    with open(checksum_path, mode="wt") as checksum_file:
+        checksum_file.write(file_checksum)
+    return file_checksum
 
 
 def get_size(start_path="."):
@@ -0,0 +1,127 @@
+import gzip
+import http.server
+import threading
+import zlib
+from unittest import TestCase
+
+import elasticsearch
+
+from esrally import client, exceptions
+
+
+class CompressorTests(TestCase):
+    def test_compresses_with_gzip(self):
+        body = client.Compressor("gzip", level=1).compress(b'{"index": {}}\n' * 100)
+        self.assertEqual(1400, body.raw_size)
+        self.assertEqual(b'{"index": {}}\n' * 100, gzip.decompress(body))
+
+    def test_compresses_with_gzip_at_default_level(self):
+        raw = b'{"index": {}}\n{"title": "compressed"}\n' * 1000
+        body = client.Compressor().compress(raw)
+        self.assertLess(len(body), len(raw))
+        self.assertEqual(raw, gzip.decompress(body))
+
+    def test_compresses_with_deflate(self):
+        body = client.Compressor("deflate").compress(b'{"index": {}}\n')
+        self.assertEqual(b'{"index": {}}\n', zlib.decompress(body))
+
+    def test_does_not_compress_twice(self):
+        compressor = client.Compressor()
+        body = compressor.compress(b'{"index": {}}\n')
+        self.assertIs(body, compressor.compress(body))
+
+    def test_rejects_invalid_settings(self):
+        with self.assertRaisesRegex(exceptions.SystemSetupError, r"Unknown compression algorithm \[zstd\]"):
+            client.Compressor("zstd")
+        with self.assertRaisesRegex(exceptions.SystemSetupError, r"Compression level must be between 0 and 9 but was \[10\]"):
+            client.Compressor(level=10)
+
+    def test_creates_compressor_from_client_options(self):
+        self.assertIsNone(client.compressor_for({}))
+        compressor = client.compressor_for({"compressed": True, "compression_algorithm": "deflate", "compression_level": 3})
+        self.assertEqual("deflate", compressor.content_encoding)
+        self.assertEqual(3, compressor.level)
+
+    def test_connection_compresses_requests(self):
+        connection = client.ConfigurableHttpConnection(compressed=True, compression_level=1)
+        self.assertEqual("gzip", connection.headers["Content-Encoding"])
+        self.assertEqual(1, connection.pool.compressor.level)
+
+
+class SerializerTests(TestCase):
+    def test_serializes_with_codec(self):
+        serializer = client.BytesPassThroughSerializer()
+        self.assertEqual('{"index":{"_id":"1"}}', serializer.dumps({"index": {"_id": "1"}}))
+        self.assertEqual('{"index": {}}', serializer.dumps('{"index": {}}'))
+        self.assertEqual(b'{"index": {}}', serializer.dumps(bytearray(b'{"index": {}}')))
+        self.assertEqual({"errors": False}, serializer.loads('{"errors": false}'))
+
+    def test_raises_serialization_error(self):
+        serializer = client.CodecSerializer()
+        with self.assertRaises(elasticsearch.SerializationError):
+            serializer.dumps({"value": object()})
+        with self.assertRaises(elasticsearch.SerializationError):
+            serializer.loads("{")
+
+
+class LeanTransportTests(TestCase):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["content-length"]))
+            if self.headers.get("content-encoding") == "gzip":
+                body = gzip.decompress(body)
+            self.server.requests.append((self.path, body, self.client_address[1]))
+            response = b'{"path": "%s"}' % self.path.encode("utf-8")
+            self.send_response(201)
+            self.send_header("content-length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            pass
+
+    def setUp(self):
+        self.server = http.server.HTTPServer(("127.0.0.1", 0), LeanTransportTests.Handler)
+        self.server.requests = []
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+        self.hosts = [{"host": "127.0.0.1", "port": self.server.server_port}]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+
+    def test_returns_raw_response_and_keeps_connection_alive(self):
+        transport = client.LeanTransport(self.hosts, {})
+        for i in range(3):
+            status, data = transport.perform_request("POST", "/_bulk?refresh=%d" % i, b"{}\n")
+            self.assertEqual(201, status)
+            self.assertEqual(b'{"path": "/_bulk?refresh=%d"}' % i, data)
+        transport.close()
+
+        self.assertEqual(["/_bulk?refresh=0", "/_bulk?refresh=1", "/_bulk?refresh=2"], [path for path, _, _ in self.server.requests])
+        # all requests have been sent over the same connection
+        self.assertEqual(1, len({port for _, _, port in self.server.requests}))
+
+    def test_compresses_request_bodies(self):
+        transport = client.LeanTransport(self.hosts, {"compressed": True})
+        transport.perform_request("POST", "/_bulk", b'{"index": {}}\n')
+        transport.close()
+
+        self.assertEqual(b'{"index": {}}\n', self.server.requests[0][1])
+
+    def test_accepts_http_auth_as_string_or_pair(self):
+        for http_auth in ["rally:secret", ("rally", "secret"), ["rally", "secret"]]:
+            transport = client.LeanTransport(self.hosts, {"http_auth": http_auth})
+            self.assertEqual("Basic cmFsbHk6c2VjcmV0", transport.headers["authorization"])
+            transport.close()
+
+    def test_pools_block_at_max_size(self):
+        transport = client.LeanTransport(self.hosts, {"maxsize": 16})
+        pool = transport.pools[0].pool
+        self.assertEqual(16, pool.pool.maxsize)
+        self.assertTrue(pool.block)
+        transport.close()
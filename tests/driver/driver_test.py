@@ -1,7 +1,17 @@
+import gzip
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+import unittest
 from unittest import TestCase
 
-from esrally import metrics, track
-from esrally.driver import driver
+import thespian.actors
+
+from esrally import client, config, exceptions, metrics, track
+from esrally.driver import driver, runner
 from esrally.track import params
 
 
@@ -234,6 +244,25 @@ class SchedulerTests(ScheduleTestCase):
         ]
         self.assert_schedule(expected_schedule, schedule)
 
+    def test_unthrottled_task_has_no_arrival_times(self):
+        task = track.Task(track.Operation("search", track.OperationType.Search.name, param_source="driver-test-param-source"),
+                          warmup_iterations=1, iterations=2, clients=1)
+        schedule = driver.schedule_for(self.test_track, task, 0)
+
+        self.assertEqual([None, None, None], [invocation_time for invocation_time, _, _, _, _, _ in schedule])
+
+    def test_poisson_arrivals_continue_across_phases(self):
+        task = track.Task(track.Operation("search", track.OperationType.Search.name, param_source="driver-test-param-source"),
+                          warmup_iterations=5, iterations=5, clients=1, target_throughput=10, arrival_process="poisson")
+        invocation_times = [invocation_time for invocation_time, _, _, _, _, _ in driver.schedule_for(self.test_track, task, 0)]
+        warmup, measurement = invocation_times[:5], invocation_times[5:]
+
+        self.assertEqual(0, warmup[0])
+        self.assertEqual(0, measurement[0])
+        self.assertEqual(measurement, sorted(measurement))
+        # measurement does not replay the inter-arrival times of the warmup phase
+        self.assertNotEqual([b - a for a, b in zip(warmup, warmup[1:])], [b - a for a, b in zip(measurement, measurement[1:])])
+
     def test_schedule_for_warmup_time_based(self):
         task = track.Task(track.Operation("time-based", track.OperationType.Index.name, params={"body": ["a"], "size": 11},
                                           param_source="driver-test-param-source"),
@@ -254,3 +283,757 @@ class SchedulerTests(ScheduleTestCase):
             (9.0, metrics.SampleType.Normal, 9, 11, "runner", {"body": ["a"], "size": 11}),
             (10.0, metrics.SampleType.Normal, 10, 11, "runner", {"body": ["a"], "size": 11}),
         ], list(invocations))
+
+
+class LoadGeneratorAssignmentTests(TestCase):
+    def test_one_client_per_load_generator_with_thread_executor(self):
+        self.assertEqual([[0], [1], [2]], driver.load_generator_assignments(3, "thread"))
+
+    def test_all_clients_in_one_load_generator_with_asyncio_executor(self):
+        self.assertEqual([[0, 1, 2]], driver.load_generator_assignments(3, "asyncio"))
+
+    def test_packs_clients_round_robin(self):
+        self.assertEqual([[0, 3, 6], [1, 4], [2, 5]], driver.load_generator_assignments(7, "thread", clients_per_load_generator=3))
+        self.assertEqual([[0, 2], [1, 3]], driver.load_generator_assignments(4, "asyncio", clients_per_load_generator=2))
+
+    def test_packs_clients_per_logical_cpu_core(self):
+        self.assertEqual([[0, 4, 8], [1, 5, 9], [2, 6], [3, 7]],
+                         driver.load_generator_assignments(10, "thread", clients_per_load_generator="auto", logical_cpu_cores=lambda: 4))
+        # never start more load generators than there are clients
+        self.assertEqual([[0], [1]],
+                         driver.load_generator_assignments(2, "thread", clients_per_load_generator="auto", logical_cpu_cores=lambda: 8))
+
+
+class LoadGeneratorShutdownTests(TestCase):
+    class LeanTransport:
+        def __init__(self):
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    class Client:
+        def __init__(self, lean_transport):
+            self.lean_transport = lean_transport
+
+    def test_closes_lean_transport_on_exit(self):
+        lean_transport = LoadGeneratorShutdownTests.LeanTransport()
+        load_generator = driver.LoadGenerator()
+        load_generator.es = LoadGeneratorShutdownTests.Client(lean_transport)
+
+        load_generator.receiveMessage(thespian.actors.ActorExitRequest(), None)
+
+        self.assertTrue(lean_transport.closed)
+        self.assertIsNone(load_generator.es)
+
+    def test_exits_without_client(self):
+        load_generator = driver.LoadGenerator()
+        load_generator.receiveMessage(thespian.actors.ActorExitRequest(), None)
+        self.assertIsNone(load_generator.es)
+
+
+class ExecutorTests(TestCase):
+    class CountingRunner:
+        def __init__(self):
+            self.calls = 0
+
+        def __enter__(self):
+            return self
+
+        def __call__(self, es, params):
+            self.calls += 1
+            return params["weight"], "docs"
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            return False
+
+    def client_schedules(self, runner, number_of_clients, iterations, open_loop=False):
+        op = track.Operation("index", track.OperationType.Index)
+        client_schedules = {}
+        for client_id in range(number_of_clients):
+            schedule = driver.iteration_count_based(None, 0, iterations, runner, DriverTestParamSource(params={"weight": 10}))
+            client_schedules[client_id] = [(schedule, driver.Sampler(client_id, op, 0), open_loop, driver.Pacer())]
+        return client_schedules
+
+    def assert_executes_all_schedules(self, executor):
+        runner = ExecutorTests.CountingRunner()
+        client_schedules = self.client_schedules(runner, number_of_clients=4, iterations=5)
+
+        executor(None, client_schedules)
+
+        self.assertEqual(20, runner.calls)
+        for client_id, schedules in client_schedules.items():
+            samples = schedules[0][1].samples
+            self.assertEqual(5, len(samples))
+            for sample in samples:
+                self.assertEqual(client_id, sample.client_id)
+                self.assertEqual(10, sample.total_ops)
+                self.assertEqual("docs", sample.total_ops_unit)
+
+    def test_thread_executor_runs_all_schedules(self):
+        self.assert_executes_all_schedules(driver.executor_for("thread"))
+
+    def test_asyncio_executor_runs_all_schedules(self):
+        self.assert_executes_all_schedules(driver.executor_for("asyncio"))
+
+    def assert_sums_request_metrics(self, executor):
+        def measuring_runner(es, params):
+            return 1, "ops", {"parse_time": (0.5, "ms")}
+
+        client_schedules = self.client_schedules(runner.DelegatingRunner(measuring_runner), number_of_clients=2, iterations=4)
+
+        executor(None, client_schedules)
+
+        for schedules in client_schedules.values():
+            sampler = schedules[0][1]
+            self.assertEqual({(metrics.SampleType.Normal, "parse_time"): (2.0, "ms")}, sampler.request_metrics)
+            self.assertEqual(4, len(sampler.samples))
+
+    def test_thread_executor_sums_request_metrics(self):
+        self.assert_sums_request_metrics(driver.executor_for("thread"))
+
+    def test_asyncio_executor_sums_request_metrics(self):
+        self.assert_sums_request_metrics(driver.executor_for("asyncio"))
+
+
+    class SlowParamSource(DriverTestParamSource):
+        def __init__(self, params=None):
+            super().__init__(params=params)
+            self.calls = 0
+
+        def params(self):
+            self.calls += 1
+            # e.g. reading and compressing a large bulk body while other clients are already running
+            if self.calls > 1:
+                time.sleep(0.3)
+            return super().params()
+
+    def test_asyncio_executor_prepares_requests_off_the_event_loop(self):
+        runner = ExecutorTests.CountingRunner()
+        op = track.Operation("index", track.OperationType.Index)
+        slow_sampler = driver.Sampler(0, op, 0)
+        paced_sampler = driver.Sampler(1, op, 0)
+        slow_schedule = driver.iteration_count_based(None, 0, 2, runner, ExecutorTests.SlowParamSource(params={"weight": 1}))
+        # one request every 10ms
+        paced_schedule = driver.iteration_count_based(100, 0, 20, runner, DriverTestParamSource(params={"weight": 1}))
+
+        driver.executor_for("asyncio")(None, {
+            0: [(slow_schedule, slow_sampler, False, driver.Pacer())],
+            1: [(paced_schedule, paced_sampler, False, driver.Pacer())]
+        })
+
+        self.assertEqual(22, runner.calls)
+        # the slow parameter source of the other client does not delay this client
+        schedule_lag = paced_sampler.schedule_lag.histograms[(op, metrics.SampleType.Normal)]
+        self.assertEqual(20, schedule_lag.total_count)
+        self.assertLess(schedule_lag.max, 100)
+
+class LatencyHistogramsTests(TestCase):
+    def test_records_per_operation_and_sample_type(self):
+        index = track.Operation("index", track.OperationType.Index)
+        search = track.Operation("search", track.OperationType.Search)
+        latency_histograms = driver.LatencyHistograms(significant_digits=3)
+        latency_histograms.add(index, metrics.SampleType.Warmup, 100.0, 90.0)
+        latency_histograms.add(index, metrics.SampleType.Normal, 10.0, 9.0)
+        latency_histograms.add(index, metrics.SampleType.Normal, 20.0, 19.0)
+        latency_histograms.add(search, metrics.SampleType.Normal, 5.0, 4.0)
+
+        histograms = latency_histograms.drain()
+
+        self.assertEqual(3, len(histograms))
+        latency, service_time = histograms[(index, metrics.SampleType.Normal)]
+        self.assertEqual(2, latency.total_count)
+        self.assertEqual(20.0, latency.max)
+        self.assertEqual(19.0, service_time.max)
+        # drain resets the histograms
+        self.assertEqual({}, latency_histograms.drain())
+
+    def test_merges_histograms_of_load_generators(self):
+        op = track.Operation("index", track.OperationType.Index)
+        master = driver.LatencyHistograms()
+        for latency_ms in [10.0, 30.0]:
+            load_generator = driver.LatencyHistograms()
+            load_generator.add(op, metrics.SampleType.Normal, latency_ms, latency_ms / 2)
+            master.merge(load_generator.drain())
+
+        latency, service_time = master.histograms[(op, metrics.SampleType.Normal)]
+        self.assertEqual(2, latency.total_count)
+        self.assertEqual(10.0, latency.min)
+        self.assertEqual(30.0, latency.max)
+        self.assertEqual(15.0, service_time.max)
+
+    def test_samplers_share_schedule_lag_histograms(self):
+        op = track.Operation("index", track.OperationType.Index)
+        schedule_lag = driver.ScheduleLagHistograms()
+        for client_id in range(100):
+            driver.Sampler(client_id, op, 0, schedule_lag=schedule_lag).add_schedule_lag(metrics.SampleType.Normal, client_id)
+
+        self.assertEqual([(op, metrics.SampleType.Normal)], list(schedule_lag.histograms.keys()))
+        master = driver.ScheduleLagHistograms()
+        master.merge(schedule_lag.drain())
+        master.merge({})
+        self.assertEqual({}, schedule_lag.histograms)
+        lag = master.histograms[(op, metrics.SampleType.Normal)]
+        self.assertEqual(100, lag.total_count)
+        self.assertEqual(99, lag.max)
+
+    def test_caps_histogram_precision(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "driver", "latency.histogram.precision", 4)
+        self.assertEqual(4, driver.latency_histogram_precision(cfg))
+        cfg.add(config.Scope.application, "driver", "latency.histogram.precision", 5)
+        with self.assertRaisesRegex(exceptions.SystemSetupError, r"must be between 1 and 4 but was \[5\]"):
+            driver.latency_histogram_precision(cfg)
+
+    def test_sampler_records_into_histograms(self):
+        op = track.Operation("index", track.OperationType.Index)
+        latency_histograms = driver.LatencyHistograms()
+        sampler = driver.Sampler(0, op, 0, latency_histograms)
+        sampler.add(metrics.SampleType.Normal, 12.5, 10.0, 1, "ops", 0.0125, 0, 1)
+
+        latency, service_time = latency_histograms.histograms[(op, metrics.SampleType.Normal)]
+        self.assertEqual(1, latency.total_count)
+        self.assertEqual(12.5, latency.value_at_percentile(100))
+        self.assertEqual(1, len(sampler.samples))
+
+
+class SampleBufferTests(TestCase):
+    def test_append_and_read_samples(self):
+        op = track.Operation("index", track.OperationType.Index)
+        buffer = driver.SampleBuffer()
+        buffer.append(0, 1470838595, 21, op, metrics.SampleType.Warmup, 10.5, 9.5, 5000, "docs", 1, 1, 9)
+        buffer.append(1, 1470838596, 22, op, metrics.SampleType.Normal, 11.5, 10.5, 5000, "docs", 2, 2, 9)
+
+        self.assertEqual(2, len(buffer))
+        # operations and units are stored only once
+        self.assertEqual([op], buffer.operations)
+        self.assertEqual(["docs"], buffer.units)
+
+        sample = buffer[1]
+        self.assertEqual(1, sample.client_id)
+        self.assertEqual(1470838596, sample.absolute_time)
+        self.assertEqual(op, sample.operation)
+        self.assertEqual(metrics.SampleType.Normal, sample.sample_type)
+        self.assertEqual(11.5, sample.latency_ms)
+        self.assertEqual(10.5, sample.service_time_ms)
+        self.assertEqual(5000, sample.total_ops)
+        self.assertEqual("docs", sample.total_ops_unit)
+        self.assertEqual(2 / 9, sample.percent_completed)
+        self.assertEqual([0, 1], [s.client_id for s in buffer])
+
+    def test_extend_remaps_codes(self):
+        index = track.Operation("index", track.OperationType.Index)
+        search = track.Operation("search", track.OperationType.Search)
+        b1 = driver.SampleBuffer()
+        b1.append(0, 1, 1, index, metrics.SampleType.Normal, 1, 1, 1000, "docs", 1, 1, 2)
+        b2 = driver.SampleBuffer()
+        b2.append(1, 2, 2, search, metrics.SampleType.Normal, 1, 1, 1, "ops", 1, 1, 2)
+        b2.append(1, 3, 3, index, metrics.SampleType.Normal, 1, 1, 1000, "docs", 1, 2, 2)
+
+        b1.extend(b2)
+
+        self.assertEqual(3, len(b1))
+        self.assertEqual([index, search, index], [s.operation for s in b1])
+        self.assertEqual(["docs", "ops", "docs"], [s.total_ops_unit for s in b1])
+        most_recent = b1.most_recent_per_client()
+        self.assertEqual(1, most_recent[0].curr_iteration)
+        self.assertEqual(2, most_recent[1].curr_iteration)
+
+    def test_extend_remaps_codes_without_numpy(self):
+        np = driver.np
+        driver.np = None
+        try:
+            self.test_extend_remaps_codes()
+        finally:
+            driver.np = np
+
+    def test_split_keeps_most_recent_sample_per_client(self):
+        op = track.Operation("index", track.OperationType.Index)
+        buffer = driver.SampleBuffer()
+        for i in range(10):
+            buffer.append(i % 3, i, i, op, metrics.SampleType.Normal, 1, 1, 1000, "docs", 1, i, 10)
+
+        before, after = buffer.split(5)
+
+        self.assertEqual({0: 3, 1: 4, 2: 2}, {client_id: s.curr_iteration for client_id, s in before.most_recent_per_client().items()})
+        self.assertEqual({0: 9, 1: 7, 2: 8}, {client_id: s.curr_iteration for client_id, s in after.most_recent_per_client().items()})
+        restored = pickle.loads(pickle.dumps(after))
+        self.assertEqual({0: 9, 1: 7, 2: 8}, {client_id: s.curr_iteration for client_id, s in restored.most_recent_per_client().items()})
+
+    def test_pickles_columns_as_bytes(self):
+        op = track.Operation("index", track.OperationType.Index)
+        buffer = driver.SampleBuffer()
+        for i in range(100):
+            buffer.append(i % 4, 1470838595 + i, i, op, metrics.SampleType.Normal, i * 0.5, i * 0.25, 5000, "docs", 1, i, 100)
+
+        state = buffer.__getstate__()
+        for column in state["columns"].values():
+            self.assertIsInstance(column, bytes)
+
+        restored = pickle.loads(pickle.dumps(buffer))
+        self.assertEqual(100, len(restored))
+        self.assertEqual([s.latency_ms for s in buffer], [s.latency_ms for s in restored])
+        self.assertEqual(op, restored[99].operation)
+
+    def test_calculate_throughput_from_buffer(self):
+        op = track.Operation("index", track.OperationType.Index)
+        buffer = driver.SampleBuffer()
+        for i in range(6):
+            buffer.append(0, 1470838595 + i, 21 + i, op, metrics.SampleType.Normal, -1, -1, 5000, "docs", i + 1, 1, 9)
+
+        throughput = driver.calculate_global_throughput(buffer)[op]
+
+        self.assertEqual(6, len(throughput))
+        self.assertEqual((1470838595, 21, metrics.SampleType.Normal, 5000, "docs/s"), throughput[0])
+
+
+class SamplerTests(TestCase):
+    def test_never_drops_samples(self):
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(0, op, 0)
+        for i in range(5000):
+            sampler.add(metrics.SampleType.Normal, 1.0, 1.0, 1, "ops", 0.001, i, 5000)
+
+        self.assertEqual(5000, sampler.pending)
+        samples = sampler.samples
+        self.assertEqual(5000, len(samples))
+        self.assertEqual(4999, samples[4999].curr_iteration)
+        # draining swaps buffers
+        self.assertEqual(0, sampler.pending)
+        self.assertEqual(0, len(sampler.samples))
+
+    def test_counts_samples_taken_before_timestamp(self):
+        op = track.Operation("index", track.OperationType.Index)
+        buffer = driver.SampleBuffer()
+        for absolute_time in [10, 11, 12, 13]:
+            buffer.append(0, absolute_time, 0, op, metrics.SampleType.Normal, 1, 1, 1, "ops", 1, 0, 1)
+
+        self.assertEqual(0, buffer.count_before(10))
+        self.assertEqual(2, buffer.count_before(11.5))
+        self.assertEqual(4, buffer.count_before(20))
+
+
+class ThroughputCalculatorTests(TestCase):
+    def samples(self, op):
+        samples = []
+        for i in range(20):
+            samples.append(driver.Sample(0, 1470838595 + i, 21 + i, op, metrics.SampleType.Normal, -1, -1, 5000, "docs", i + 1, i, 40))
+            samples.append(driver.Sample(1, 1470838595.5 + i, 21.5 + i, op, metrics.SampleType.Normal, -1, -1, 2500, "docs", i + 1.5, i,
+                                         40))
+        return samples
+
+    def test_incremental_calculation_matches_batch_calculation(self):
+        op = track.Operation("index", track.OperationType.Index)
+        samples = self.samples(op)
+        expected = driver.calculate_global_throughput(samples)[op]
+
+        calculator = driver.ThroughputCalculator()
+        actual = []
+        # client 1 reports its samples later than client 0
+        client_0 = [s for s in samples if s.client_id == 0]
+        client_1 = [s for s in samples if s.client_id == 1]
+        for chunk in range(4):
+            calculator.add(client_0[chunk * 5:(chunk + 1) * 5])
+            calculator.add(client_1[chunk * 5:(chunk + 1) * 5])
+            # all samples before this timestamp have arrived
+            actual += calculator.calculate(until=1470838595 + (chunk + 1) * 5).get(op, [])
+            self.assertLessEqual(len(calculator.unprocessed), 1)
+        actual += calculator.calculate().get(op, [])
+
+        self.assertEqual(expected, actual)
+
+    def test_keeps_samples_after_watermark(self):
+        op = track.Operation("index", track.OperationType.Index)
+        calculator = driver.ThroughputCalculator()
+        calculator.add(self.samples(op))
+
+        calculator.calculate(until=1470838600)
+
+        self.assertEqual(30, len(calculator.unprocessed))
+        self.assertTrue(all(s.absolute_time >= 1470838600 for s in calculator.unprocessed))
+
+    @unittest.skipIf(driver.np is None, "numpy not installed")
+    def test_vectorized_calculation_matches_python_calculation(self):
+        index = track.Operation("index", track.OperationType.Index)
+        search = track.Operation("search", track.OperationType.Search)
+        rnd = random.Random(17)
+        samples = []
+        for i in range(2000):
+            op = index if rnd.random() < 0.7 else search
+            absolute_time = 1470838595 + i * 0.01 + rnd.random()
+            sample_type = metrics.SampleType.Warmup if i < 500 else metrics.SampleType.Normal
+            samples.append(driver.Sample(rnd.randint(0, 7), absolute_time, absolute_time - 1470838590, op, sample_type, 1, 1,
+                                         rnd.choice([1, 500, 5000]), "docs" if op == index else "ops", rnd.random(), i, 2000))
+
+        def calculate(vectorized):
+            calculator = driver.ThroughputCalculator(vectorized=vectorized)
+            result = {}
+            for chunk in range(4):
+                calculator.add(samples[chunk * 500:(chunk + 1) * 500])
+                for op, records in calculator.calculate(until=1470838595 + (chunk + 1) * 5).items():
+                    result.setdefault(op, []).extend(records)
+            for op, records in calculator.calculate().items():
+                result.setdefault(op, []).extend(records)
+            return result
+
+        expected = calculate(vectorized=False)
+        actual = calculate(vectorized=True)
+
+        self.assertEqual({index, search}, set(actual.keys()))
+        for op in [index, search]:
+            self.assertEqual(expected[op], actual[op])
+            self.assertEqual(driver._moving_average(expected[op]), driver.moving_average(expected[op]))
+
+
+class ArrivalsTests(TestCase):
+    def take(self, n, arrivals):
+        return [t for _, t in zip(range(n), arrivals.times())]
+
+    def test_unthrottled(self):
+        self.assertEqual([None, None, None], self.take(3, driver.Arrivals(None)))
+        self.assertEqual([None, None, None], self.take(3, driver.Arrivals(None, "poisson")))
+
+    def test_fixed(self):
+        self.assertEqual([0.0, 0.1, 0.2, 0.30000000000000004], self.take(4, driver.Arrivals(10)))
+
+    def test_bursty(self):
+        self.assertEqual([0.0, 0.0, 0.0, 0.30000000000000004, 0.30000000000000004, 0.30000000000000004, 0.6000000000000001],
+                         self.take(7, driver.Arrivals(10, "bursty", burst_size=3)))
+
+    def test_poisson(self):
+        arrival_times = self.take(10000, driver.Arrivals(100, "poisson", seed=7))
+        self.assertEqual(0, arrival_times[0])
+        self.assertEqual(arrival_times, sorted(arrival_times))
+        # 10000 requests at 100 ops/s take roughly 100 seconds
+        self.assertAlmostEqual(100, arrival_times[-1], delta=5)
+        # reproducible with the same seed
+        self.assertEqual(arrival_times, self.take(10000, driver.Arrivals(100, "poisson", seed=7)))
+        self.assertNotEqual(arrival_times, self.take(10000, driver.Arrivals(100, "poisson", seed=8)))
+
+    def test_unknown_arrival_process(self):
+        with self.assertRaises(exceptions.SystemSetupError):
+            driver.Arrivals(10, "gaussian")
+
+
+class OpenLoopTests(TestCase):
+    class SlowRunner:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+        def __enter__(self):
+            return self
+
+        def __call__(self, es, params):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.05)
+            with self.lock:
+                self.in_flight -= 1
+            return 1, "ops"
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            return False
+
+    def run_schedule(self, executor, open_loop):
+        runner = OpenLoopTests.SlowRunner()
+        op = track.Operation("search", track.OperationType.Search)
+        sampler = driver.Sampler(0, op, 0)
+        # one request every 10ms but each one takes 50ms
+        schedule = driver.iteration_count_based(100, 0, 10, runner, DriverTestParamSource())
+        executor(None, {0: [(schedule, sampler, open_loop, driver.Pacer())]})
+        return runner, sampler.samples
+
+    def assert_open_loop(self, executor):
+        runner, samples = self.run_schedule(executor, open_loop=True)
+        self.assertEqual(10, len(samples))
+        self.assertGreater(runner.max_in_flight, 1)
+        # latency is measured from the scheduled time so it can never be lower than service time
+        for sample in samples:
+            self.assertGreaterEqual(sample.latency_ms, sample.service_time_ms)
+
+    def test_closed_loop_issues_one_request_at_a_time(self):
+        runner, samples = self.run_schedule(driver.executor_for("thread"), open_loop=False)
+        self.assertEqual(10, len(samples))
+        self.assertEqual(1, runner.max_in_flight)
+        # as requests are late, later requests have a higher latency than service time
+        self.assertGreater(samples[9].latency_ms, samples[9].service_time_ms + 100)
+
+    def test_thread_executor_open_loop(self):
+        self.assert_open_loop(driver.executor_for("thread"))
+
+    def test_asyncio_executor_open_loop(self):
+        self.assert_open_loop(driver.executor_for("asyncio"))
+
+    def assert_in_flight_requests_capped(self, executor):
+        max_in_flight_requests = driver.OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS
+        driver.OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS = 2
+        try:
+            runner, samples = self.run_schedule(executor, open_loop=True)
+        finally:
+            driver.OPEN_LOOP_MAX_IN_FLIGHT_REQUESTS = max_in_flight_requests
+        self.assertEqual(10, len(samples))
+        self.assertEqual(2, runner.max_in_flight)
+
+    def test_thread_executor_caps_in_flight_requests(self):
+        self.assert_in_flight_requests_capped(driver.executor_for("thread"))
+
+    def test_asyncio_executor_caps_in_flight_requests(self):
+        self.assert_in_flight_requests_capped(driver.executor_for("asyncio"))
+
+
+class WaitTimeTests(TestCase):
+    class BackingOffRunner:
+        def __enter__(self):
+            return self
+
+        def __call__(self, es, params):
+            time.sleep(0.1)
+            return 1, "docs", {"bulk_retry_time": (100, "ms")}
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            return False
+
+    def test_determines_wait_time(self):
+        self.assertEqual(0, driver.wait_time(None))
+        self.assertEqual(0, driver.wait_time({"bulk_raw_bytes": (100, "byte")}))
+        self.assertEqual(0.25, driver.wait_time({"bulk_retry_time": (250, "ms"), "bulk_raw_bytes": (100, "byte")}))
+
+    def run_backing_off_schedule(self, executor):
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(0, op, 0)
+        schedule = driver.iteration_count_based(0, 0, 1, WaitTimeTests.BackingOffRunner(), DriverTestParamSource())
+        executor(None, {0: [(schedule, sampler, False, driver.Pacer())]})
+        samples = sampler.samples
+        self.assertEqual(1, len(samples))
+        # the backoff is not counted as service time
+        self.assertLess(samples[0].service_time_ms, 50)
+        self.assertEqual(samples[0].service_time_ms, samples[0].latency_ms)
+
+    def test_thread_executor_excludes_wait_time_from_service_time(self):
+        self.run_backing_off_schedule(driver.executor_for("thread"))
+
+    def test_asyncio_executor_excludes_wait_time_from_service_time(self):
+        self.run_backing_off_schedule(driver.executor_for("asyncio"))
+
+
+class PacerTests(TestCase):
+    def test_unbounded_catch_up_keeps_schedule(self):
+        pacer = driver.Pacer(catch_up="unbounded")
+        # the client is far behind but all overdue requests are issued immediately
+        self.assertEqual((1.0, 1.0), pacer.issue_time(1.0, now=10.0))
+        self.assertEqual((1.1, 1.1), pacer.issue_time(1.1, now=10.0))
+
+    def test_token_bucket_catch_up_limits_burst(self):
+        pacer = driver.Pacer(catch_up="token-bucket", catch_up_burst=2)
+        # two overdue requests consume all tokens
+        self.assertEqual((1.0, 1.0), pacer.issue_time(1.0, now=10.0))
+        self.assertEqual((2.0, 2.0), pacer.issue_time(2.0, now=10.0))
+        # the bucket is empty so the schedule is shifted but the scheduled time is kept
+        self.assertEqual((10.0, 3.0), pacer.issue_time(3.0, now=10.0))
+        self.assertEqual((11.0, 4.0), pacer.issue_time(4.0, now=10.5))
+        # on time requests put tokens back...
+        self.assertEqual((12.0, 5.0), pacer.issue_time(5.0, now=11.5))
+        # ... which allows to catch up again
+        self.assertEqual((13.0, 6.0), pacer.issue_time(6.0, now=14.0))
+
+    def test_reset_starts_over(self):
+        pacer = driver.Pacer(catch_up="token-bucket", catch_up_burst=0)
+        self.assertEqual((10.0, 1.0), pacer.issue_time(1.0, now=10.0))
+        pacer.reset()
+        self.assertEqual((2.0, 2.0), pacer.issue_time(2.0, now=1.0))
+
+    def test_wait_returns_schedule_lag(self):
+        pacer = driver.Pacer(spin_threshold=0.002)
+        target = time.perf_counter() + 0.01
+        lag = pacer.wait(target)
+        self.assertGreaterEqual(lag, 0)
+        self.assertGreaterEqual(time.perf_counter(), target)
+
+    def test_rejects_unknown_catch_up_policy(self):
+        with self.assertRaises(exceptions.SystemSetupError):
+            driver.Pacer(catch_up="leaky-bucket")
+
+    def test_rejects_negative_spin_threshold(self):
+        with self.assertRaises(exceptions.SystemSetupError):
+            driver.Pacer(spin_threshold=-1)
+
+    def run_throttled_schedule(self, executor):
+        runner = ExecutorTests.CountingRunner()
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(0, op, 0)
+        schedule = driver.iteration_count_based(1000, 0, 100, runner, DriverTestParamSource(params={"weight": 1}))
+        executor(None, {0: [(schedule, sampler, False, driver.Pacer())]})
+        self.assertEqual(100, runner.calls)
+        schedule_lag = sampler.schedule_lag.histograms[(op, metrics.SampleType.Normal)]
+        self.assertEqual(100, schedule_lag.total_count)
+        self.assertGreaterEqual(schedule_lag.min, 0)
+
+    def test_thread_executor_records_schedule_lag(self):
+        self.run_throttled_schedule(driver.executor_for("thread"))
+
+    def test_asyncio_executor_records_schedule_lag(self):
+        self.run_throttled_schedule(driver.executor_for("asyncio"))
+
+    def test_first_burst_counts_as_throttled(self):
+        runner = ExecutorTests.CountingRunner()
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(0, op, 0)
+        schedule = driver.iteration_count_based(1000, 0, 10, runner, DriverTestParamSource(params={"weight": 1}),
+                                                arrivals=driver.Arrivals(1000, "bursty", burst_size=5))
+        driver.execute_schedule(schedule, None, sampler, False, driver.Pacer())
+        self.assertEqual(10, runner.calls)
+        # requests of the first burst are scheduled at zero but still throttled
+        schedule_lag = sampler.schedule_lag.histograms[(op, metrics.SampleType.Normal)]
+        self.assertEqual(10, schedule_lag.total_count)
+
+    class StallingRunner:
+        def __init__(self):
+            self.calls = 0
+
+        def __enter__(self):
+            return self
+
+        def __call__(self, es, params):
+            self.calls += 1
+            if self.calls == 1:
+                time.sleep(0.2)
+            return 1, "ops"
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            return False
+
+    def run_stalled_schedule(self, executor):
+        runner = PacerTests.StallingRunner()
+        op = track.Operation("search", track.OperationType.Search)
+        sampler = driver.Sampler(0, op, 0)
+        # one request every 10ms, the first one stalls for 200ms
+        schedule = driver.iteration_count_based(100, 0, 10, runner, DriverTestParamSource())
+        executor(None, {0: [(schedule, sampler, False, driver.Pacer(catch_up="token-bucket", catch_up_burst=0))]})
+        samples = sampler.samples
+        self.assertEqual(10, len(samples))
+        # the schedule has been shifted but the stall is still reflected in the latency of the last request
+        self.assertGreater(samples[9].latency_ms, 150)
+        self.assertLess(samples[9].service_time_ms, 50)
+
+    def test_thread_executor_reports_stall_with_token_bucket(self):
+        self.run_stalled_schedule(driver.executor_for("thread"))
+
+    def test_asyncio_executor_reports_stall_with_token_bucket(self):
+        self.run_stalled_schedule(driver.executor_for("asyncio"))
+
+
+class BulkCacheScheduleTests(TestCase):
+    def test_stores_bulk_cache_when_schedule_completes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_file = os.path.join(tmp_dir, "documents.json")
+            with open(data_file, "wb") as f:
+                f.writelines(b'{"key": "value%d"}\n' % i for i in range(100))
+            cache_dir = os.path.join(tmp_dir, "bulk-cache")
+            index = track.Index(name="test_index", types=[
+                track.Type(name="test_type", mapping_file=None, document_file=data_file, number_of_documents=100,
+                           document_checksum="abc", bulk_cache_dir=cache_dir)
+            ])
+            source = params.PartitionBulkIndexParamSource([index], 0, 1, bulk_size=10)
+
+            schedule = list(driver.time_period_based(None, 0, None, source))
+
+            self.assertEqual(10, len(schedule))
+            cache_files = [f for f in os.listdir(cache_dir) if f.endswith(".bulks")]
+            self.assertEqual(1, len(cache_files))
+            self.assertTrue(params.BulkCacheReader.is_valid(os.path.join(cache_dir, cache_files[0])))
+
+
+class CompressingParamSourceTests(TestCase):
+    def test_compresses_serialized_bodies(self):
+        source = driver.CompressingParamSource(DriverTestParamSource(params={"body": b'{"index": {}}\n', "bulk-size": 1}),
+                                               client.Compressor())
+        p = source.params()
+        self.assertIsInstance(p["body"], client.CompressedBody)
+        self.assertEqual(b'{"index": {}}\n', gzip.decompress(p["body"]))
+        self.assertEqual(1, p["bulk-size"])
+
+    def test_leaves_other_bodies_alone(self):
+        source = driver.CompressingParamSource(DriverTestParamSource(params={"body": {"query": {"match_all": {}}}}), client.Compressor())
+        self.assertEqual({"query": {"match_all": {}}}, source.params()["body"])
+
+
+class PrefetchingParamSourceTests(TestCase):
+    class CountingParamSource:
+        def __init__(self, size, delay=0):
+            self._size = size
+            self.delay = delay
+            self.calls = 0
+
+        def partition(self, partition_index, total_partitions):
+            return self
+
+        def size(self):
+            return self._size
+
+        def params(self):
+            if self.calls >= self._size:
+                raise StopIteration()
+            time.sleep(self.delay)
+            self.calls += 1
+            return {"bulk": self.calls}
+
+    def test_returns_params_in_order(self):
+        delegate = PrefetchingParamSourceTests.CountingParamSource(size=10)
+        source = driver.PrefetchingParamSource(delegate, depth=3)
+        self.assertEqual(10, source.size())
+        self.assertEqual([{"bulk": i} for i in range(1, 11)], [source.params() for _ in range(10)])
+        # errors of the delegate are raised in the client
+        with self.assertRaises(StopIteration):
+            source.params()
+        with self.assertRaises(StopIteration):
+            source.params()
+
+    def test_prefetches_at_most_depth_params(self):
+        delegate = PrefetchingParamSourceTests.CountingParamSource(size=100)
+        source = driver.PrefetchingParamSource(delegate, depth=2)
+        source.params()
+        time.sleep(0.1)
+        # two parameters are queued and the background thread prepares the next one
+        self.assertEqual(4, delegate.calls)
+
+    def test_reports_waits(self):
+        waits = []
+        delegate = PrefetchingParamSourceTests.CountingParamSource(size=3, delay=0.01)
+        source = driver.PrefetchingParamSource(delegate, depth=3, wait_listener=waits.append)
+        source.params()
+        self.assertEqual(1, len(waits))
+        self.assertGreater(waits[0], 0)
+        time.sleep(0.1)
+        source.params()
+        source.params()
+        self.assertEqual(1, len(waits))
+
+    def test_stops_background_thread_if_params_are_not_consumed(self):
+        delegate = PrefetchingParamSourceTests.CountingParamSource(size=100)
+        source = driver.PrefetchingParamSource(delegate, depth=1)
+        source.params()
+        thread = source.thread
+        del source
+        thread.join(timeout=5 * driver.PrefetchingParamSource.POLL_INTERVAL)
+        self.assertFalse(thread.is_alive())
+
+    def test_prefetches_only_partitioned_param_sources(self):
+        test_track = track.Track(name="unittest", short_description="unittest track", description="unittest track",
+                                 source_root_url="http://example.org", indices=None, challenges=None)
+        params.register_param_source_for_name("driver-test-param-source", DriverTestParamSource)
+        task = track.Task(track.Operation("search", track.OperationType.Search.name, param_source="driver-test-param-source"),
+                          warmup_iterations=0, iterations=2, clients=1)
+        waits = []
+        self.assertEqual([{}, {}], [p for _, _, _, _, _, p in driver.schedule_for(test_track, task, 0, 4, waits.append)])
+        self.assertEqual([], waits)
+
+    def test_records_waits_per_operation(self):
+        op = track.Operation("index", track.OperationType.Index)
+        sampler = driver.Sampler(0, op, 0)
+        sampler.add_prefetch_wait(0.5)
+        sampler.add_prefetch_wait(0.25)
+        self.assertEqual(2, sampler.prefetch_waits)
+        self.assertEqual(0.75, sampler.prefetch_wait_time)
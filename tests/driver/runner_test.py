@@ -0,0 +1,337 @@
+import gzip
+import json
+import urllib.parse
+from unittest import TestCase, mock
+
+import elasticsearch
+import urllib3
+
+from esrally import client
+from esrally.driver import runner
+
+
+class BulkIndexTests(TestCase):
+    @staticmethod
+    def client(*responses):
+        es = mock.Mock()
+        es.lean_transport = None
+        es.compressor = None
+        es.transport.serializer.dumps.side_effect = json.dumps
+        es.transport.max_retries = 3
+        es.transport.retry_on_status = (503, 504)
+        connection = es.transport.get_connection.return_value
+        connection.url_prefix = ""
+        connection.pool.urlopen.side_effect = [mock.Mock(status=200, data=json.dumps(response).encode("utf-8"))
+                                               for response in responses]
+        return es, connection.pool
+
+    def test_requests_filtered_response(self):
+        es, pool = self.client({"errors": False, "items": [{"index": {"status": 201}}]})
+        body = b'{"index": {}}\n{"location": [-0.1, 51.5]}\n'
+
+        weight, unit, request_metrics = runner.BulkIndex()(es, {"body": body, "bulk-size": 1, "pipeline": "test-pipeline"})
+
+        self.assertEqual(1, weight)
+        self.assertEqual("docs", unit)
+        self.assertIn("bulk_response_parse_time", request_metrics)
+        method, url, sent_body = pool.urlopen.call_args[0]
+        self.assertEqual("POST", method)
+        path, query = url.split("?")
+        self.assertEqual("/_bulk", path)
+        self.assertEqual({"filter_path": [runner.BulkIndex.FILTER_PATH], "pipeline": ["test-pipeline"]}, urllib.parse.parse_qs(query))
+        self.assertIs(body, sent_body)
+
+    def test_serializes_bulk_lines(self):
+        es, pool = self.client({"errors": False})
+
+        weight, unit, _ = runner.BulkIndex()(es, {"body": [{"index": {}}, {"name": "rally"}]})
+
+        self.assertEqual(1, weight)
+        self.assertEqual(b'{"index": {}}\n{"name": "rally"}\n', pool.urlopen.call_args[0][2])
+
+    def test_counts_failed_items(self):
+        es, _ = self.client({"errors": True, "items": [{"index": {"status": 201}},
+                                                       {"index": {"status": 400, "error": {"type": "mapper_parsing_exception"}}}]})
+
+        weight, _, request_metrics = runner.BulkIndex()(es, {"body": b"", "bulk-size": 2})
+
+        self.assertEqual(1, weight)
+        self.assertEqual((1, "docs"), request_metrics["bulk_failed_docs"])
+        self.assertEqual((0, "docs"), request_metrics["bulk_rejected_docs"])
+
+    def test_counts_failed_items_of_response_without_positions(self):
+        es, pool = self.client({"errors": True, "items": [{"index": {"error": {"type": "mapper_parsing_exception"}}},
+                                                          {"index": {"error": {"type": "es_rejected_execution_exception"}}}]})
+
+        weight, _, request_metrics = runner.BulkIndex()(es, {"body": b"", "bulk-size": 5})
+
+        self.assertEqual(3, weight)
+        self.assertEqual((1, "docs"), request_metrics["bulk_rejected_docs"])
+        # without retries, rejected items count as failed
+        self.assertEqual((2, "docs"), request_metrics["bulk_failed_docs"])
+        query = urllib.parse.parse_qs(pool.urlopen.call_args[0][1].split("?")[1])
+        self.assertEqual(["errors,items.*.error"], query["filter_path"])
+
+    @mock.patch("time.sleep")
+    def test_requests_item_positions_if_retries_are_enabled(self, sleep):
+        es, pool = self.client({"errors": False})
+
+        runner.BulkIndex()(es, {"body": b"", "bulk-size": 1, "retries": 1})
+
+        query = urllib.parse.parse_qs(pool.urlopen.call_args[0][1].split("?")[1])
+        self.assertEqual([runner.BulkIndex.FILTER_PATH_WITH_POSITIONS], query["filter_path"])
+
+    @mock.patch("time.sleep")
+    def test_retries_rejected_items_with_backoff(self, sleep):
+        rejected = {"index": {"status": 429, "error": {"type": "es_rejected_execution_exception"}}}
+        es, pool = self.client({"errors": True, "items": [{"index": {"status": 201}}, rejected, rejected]},
+                                     {"errors": True, "items": [{"index": {"status": 201}}, rejected]},
+                                     {"errors": False, "items": [{"index": {"status": 201}}]})
+        body = b'{"index": {}}\n{"doc": 1}\n{"index": {}}\n{"doc": 2}\n{"index": {}}\n{"doc": 3}\n'
+
+        weight, _, request_metrics = runner.BulkIndex()(es, {"body": body, "bulk-size": 3, "retries": 2, "retry-backoff": 0.5})
+
+        self.assertEqual(3, weight)
+        self.assertEqual((3, "docs"), request_metrics["bulk_rejected_docs"])
+        self.assertEqual((3, "docs"), request_metrics["bulk_retried_docs"])
+        self.assertEqual((0, "docs"), request_metrics["bulk_failed_docs"])
+        sleep.assert_has_calls([mock.call(0.5), mock.call(1.0)])
+        bodies = [c[0][2] for c in pool.urlopen.call_args_list]
+        self.assertEqual(b'{"index": {}}\n{"doc": 2}\n{"index": {}}\n{"doc": 3}\n', bodies[1])
+        self.assertEqual(b'{"index": {}}\n{"doc": 3}\n', bodies[2])
+
+    @mock.patch("time.sleep")
+    def test_counts_rejected_items_as_failed_after_last_retry(self, sleep):
+        rejected = {"index": {"status": 429}}
+        es, pool = self.client({"errors": True, "items": [rejected, {"index": {"status": 201}}]},
+                                     {"errors": True, "items": [rejected]})
+
+        body = b'{"index": {}}\n{"doc": 1}\n{"index": {}}\n{"doc": 2}\n'
+
+        weight, _, request_metrics = runner.BulkIndex()(es, {"body": body, "bulk-size": 2, "retries": 1})
+
+        self.assertEqual(1, weight)
+        self.assertEqual((2, "docs"), request_metrics["bulk_rejected_docs"])
+        self.assertEqual((1, "docs"), request_metrics["bulk_retried_docs"])
+        self.assertEqual((1, "docs"), request_metrics["bulk_failed_docs"])
+        sleep.assert_called_once_with(runner.BulkIndex.DEFAULT_RETRY_BACKOFF)
+
+
+    @mock.patch("time.sleep")
+    def test_retries_rejected_bulk_request(self, sleep):
+        es, pool = self.client({"errors": False})
+        pool.urlopen.side_effect = [mock.Mock(status=429, data=b'{"error": "es_rejected_execution_exception"}')] + \
+                                   list(pool.urlopen.side_effect)
+        body = b'{"index": {}}\n{"doc": 1}\n{"index": {}}\n{"doc": 2}\n'
+
+        weight, _, request_metrics = runner.BulkIndex()(es, {"body": body, "bulk-size": 2, "retries": 1, "retry-backoff": 0.5})
+
+        self.assertEqual(2, weight)
+        self.assertEqual((2, "docs"), request_metrics["bulk_rejected_docs"])
+        self.assertEqual((2, "docs"), request_metrics["bulk_retried_docs"])
+        self.assertEqual((0, "docs"), request_metrics["bulk_failed_docs"])
+        sleep.assert_called_once_with(0.5)
+        self.assertIs(body, pool.urlopen.call_args_list[1][0][2])
+
+    def test_counts_rejected_bulk_request_as_failed_without_retries(self):
+        es, pool = self.client()
+        pool.urlopen.side_effect = [mock.Mock(status=429, data=b'{"error": "es_rejected_execution_exception"}')]
+
+        weight, _, request_metrics = runner.BulkIndex()(es, {"body": b"", "bulk-size": 3})
+
+        self.assertEqual(0, weight)
+        self.assertEqual((3, "docs"), request_metrics["bulk_failed_docs"])
+
+    def test_propagates_other_errors(self):
+        es, pool = self.client()
+        pool.urlopen.side_effect = [mock.Mock(status=400, data=b'{"error": "parse_exception"}')]
+
+        with self.assertRaises(elasticsearch.RequestError):
+            runner.BulkIndex()(es, {"body": b"", "bulk-size": 3, "retries": 1})
+
+    def test_reports_raw_and_wire_bytes(self):
+        es, pool = self.client({"errors": False})
+        es.compressor = client.Compressor(level=1)
+        body = b'{"index": {}}\n{"name": "rally"}\n' * 10
+
+        _, _, request_metrics = runner.BulkIndex()(es, {"body": body, "bulk-size": 10})
+
+        wire_body = pool.urlopen.call_args[0][2]
+        self.assertEqual(body, gzip.decompress(wire_body))
+        self.assertEqual((len(body), "byte"), request_metrics["bulk_raw_bytes"])
+        self.assertEqual((len(wire_body), "byte"), request_metrics["bulk_wire_bytes"])
+
+    @mock.patch("time.sleep")
+    def test_retries_rejected_items_of_precompressed_body(self, sleep):
+        es, pool = self.client({"errors": True, "items": [{"index": {"status": 429}}, {"index": {"status": 201}}]},
+                                     {"errors": False})
+        es.compressor = client.Compressor()
+        body = es.compressor.compress(b'{"index": {}}\n{"doc": 1}\n{"index": {}}\n{"doc": 2}\n')
+
+        runner.BulkIndex()(es, {"body": body, "bulk-size": 2, "retries": 1})
+
+        self.assertIs(body, pool.urlopen.call_args_list[0][0][2])
+        self.assertEqual(b'{"index": {}}\n{"doc": 1}\n', gzip.decompress(pool.urlopen.call_args_list[1][0][2]))
+
+
+class QueryTests(TestCase):
+    SCROLL_PAGE = b'{"_scroll_id":"%s","took":2,"timed_out":false,"_shards":{"total":1,"successful":1,"failed":0},' \
+                  b'"hits":{"total":3,"max_score":null,"hits":[%s]}}'
+
+    @staticmethod
+    def client(*responses):
+        es = mock.Mock()
+        es.lean_transport.perform_request.side_effect = [(200, response) for response in responses]
+        return es
+
+    def test_sends_serialized_query_as_is(self):
+        es = self.client(b'{"hits": {"total": 0, "hits": []}}')
+
+        weight, unit, request_metrics = runner.Query()(es, {"index": "logs-*", "type": None, "use_request_cache": False,
+                                                            "body": {"query": {}}, "serialized-body": b'{"query": {}}'})
+
+        self.assertEqual((1, "ops"), (weight, unit))
+        self.assertEqual({"search_response_bytes": (34, "byte")}, request_metrics)
+        es.lean_transport.perform_request.assert_called_once_with("GET", "/logs-*/_search?request_cache=false", b'{"query": {}}')
+
+    def test_serializes_query(self):
+        es = self.client(b'{"hits": {"total": 0, "hits": []}}')
+
+        runner.Query()(es, {"index": "logs", "type": "type", "use_request_cache": True, "body": {"query": {}}})
+
+        es.lean_transport.perform_request.assert_called_once_with("GET", "/logs/type/_search?request_cache=true", b'{"query":{}}')
+
+    def test_skips_parsing_response_with_minimal_response_parsing(self):
+        es = self.client(b'{"hits": ')
+
+        # the response is invalid JSON but it is not parsed
+        weight, _, _ = runner.Query()(es, {"index": "logs", "type": None, "use_request_cache": False, "body": None,
+                                           "response_parsing": "minimal"})
+
+        self.assertEqual(1, weight)
+
+    def run_scroll(self, response_parsing):
+        pages = [QueryTests.SCROLL_PAGE % (b"scroll-1", b'{"_id":"1","_source":{"hits":[]}},{"_id":"2"}'),
+                 QueryTests.SCROLL_PAGE % (b"scroll-2", b'{"_id":"3"}'),
+                 QueryTests.SCROLL_PAGE % (b"scroll-3", b"")]
+        es = self.client(*pages)
+
+        weight, unit, request_metrics = runner.Query()(es, {"index": "logs", "type": None, "use_request_cache": False,
+                                                            "body": b'{"query": {}}', "pages": 5, "items_per_page": 2,
+                                                            "response_parsing": response_parsing})
+
+        self.assertEqual((3, "ops"), (weight, unit))
+        self.assertEqual({"search_response_bytes": (sum(len(page) for page in pages), "byte")}, request_metrics)
+        calls = es.lean_transport.perform_request.call_args_list
+        self.assertEqual(mock.call("GET", "/_search/scroll?scroll=10s", b"scroll-1"), calls[1])
+        self.assertEqual(mock.call("GET", "/_search/scroll?scroll=10s", b"scroll-2"), calls[2])
+        es.clear_scroll.assert_called_once_with(scroll_id="scroll-3")
+
+    def test_scroll_with_full_response_parsing(self):
+        self.run_scroll("full")
+
+    def test_scroll_with_minimal_response_parsing(self):
+        self.run_scroll("minimal")
+
+    def test_reads_page_completely_if_structure_is_unexpected(self):
+        response = b'{"_scroll_id":"abc","hits":{"total":{"value":1,"relation":"eq"},"max_score":1.0,"hits":[{"_id":"1"}]}}'
+        self.assertEqual(("abc", True), runner.Query.read_page(response, minimal=True))
+        self.assertEqual(("abc", False), runner.Query.read_page(response.replace(b'{"_id":"1"}', b""), minimal=True))
+
+
+class RawRequestTests(TestCase):
+    def test_uses_lean_transport_if_available(self):
+        es = mock.Mock()
+        es.lean_transport.perform_request.return_value = (200, b'{"errors": false}')
+
+        status, data = runner.raw_request(es, "POST", "/_bulk", params={"filter_path": "errors"}, body=b"{}\n")
+
+        self.assertEqual(200, status)
+        self.assertEqual(b'{"errors": false}', data)
+        es.lean_transport.perform_request.assert_called_once_with("POST", "/_bulk?filter_path=errors", b"{}\n")
+        es.transport.get_connection.assert_not_called()
+
+    def test_raises_transport_error_on_error_status(self):
+        es = mock.Mock()
+        es.lean_transport.perform_request.return_value = (404, b'{"error": "index_not_found_exception"}')
+
+        with self.assertRaises(elasticsearch.NotFoundError):
+            runner.raw_request(es, "GET", "/test/_search")
+
+    @staticmethod
+    def transport(*connections, max_retries=3):
+        es = mock.Mock()
+        es.lean_transport = None
+        es.transport.max_retries = max_retries
+        es.transport.retry_on_timeout = False
+        es.transport.retry_on_status = (503, 504)
+        es.transport.get_connection.side_effect = connections
+        return es
+
+    @staticmethod
+    def connection(*responses):
+        connection = mock.Mock()
+        connection.url_prefix = "/es"
+        connection.pool.urlopen.side_effect = responses
+        return connection
+
+    def test_returns_raw_bytes_of_connection(self):
+        connection = self.connection(mock.Mock(status=200, data=b'{"errors": false}'))
+        es = self.transport(connection)
+
+        status, data = runner.raw_request(es, "POST", "/_bulk", params={"filter_path": "errors"}, body=b"{}\n")
+
+        self.assertEqual((200, b'{"errors": false}'), (status, data))
+        connection.pool.urlopen.assert_called_once_with("POST", "/es/_bulk?filter_path=errors", b"{}\n", retries=False,
+                                                        headers=connection.headers)
+        connection.perform_request.assert_not_called()
+        es.transport.connection_pool.mark_live.assert_called_once_with(connection)
+
+    def test_retries_on_another_connection_like_transport(self):
+        failing = self.connection(urllib3.exceptions.ProtocolError("connection reset"))
+        unavailable = self.connection(mock.Mock(status=503, data=b"unavailable"))
+        healthy = self.connection(mock.Mock(status=200, data=b"{}"))
+        es = self.transport(failing, unavailable, healthy)
+
+        self.assertEqual((200, b"{}"), runner.raw_request(es, "GET", "/_search"))
+
+        es.transport.mark_dead.assert_has_calls([mock.call(failing), mock.call(unavailable)])
+        es.transport.connection_pool.mark_live.assert_called_once_with(healthy)
+
+    def test_raises_after_last_retry(self):
+        es = self.transport(self.connection(urllib3.exceptions.ProtocolError("connection reset")),
+                            self.connection(urllib3.exceptions.ProtocolError("connection reset")), max_retries=1)
+
+        with self.assertRaises(elasticsearch.ConnectionError):
+            runner.raw_request(es, "GET", "/_search")
+        self.assertEqual(2, es.transport.mark_dead.call_count)
+
+    def test_does_not_retry_client_errors(self):
+        es = self.transport(self.connection(mock.Mock(status=429, data=b"rejected")))
+
+        with self.assertRaises(elasticsearch.TransportError) as ctx:
+            runner.raw_request(es, "POST", "/_bulk")
+        self.assertEqual(429, ctx.exception.status_code)
+        es.transport.mark_dead.assert_not_called()
+
+
+class RegistryTests(TestCase):
+    class StatefulRunner(runner.Runner):
+        def __init__(self):
+            self.calls = 0
+
+        def __call__(self, es, params):
+            self.calls += 1
+            return 1, "ops"
+
+    def test_each_client_gets_its_own_runner(self):
+        runner.register_runner("unittest-stateful", RegistryTests.StatefulRunner())
+        first = runner.runner_for("unittest-stateful")
+        second = runner.runner_for("unittest-stateful")
+
+        self.assertIsNot(first, second)
+        first(None, {})
+        first(None, {})
+        second(None, {})
+        self.assertEqual(2, first.calls)
+        self.assertEqual(1, second.calls)
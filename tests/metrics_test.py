@@ -3,6 +3,7 @@ from unittest import TestCase
 import unittest.mock as mock
 
 from esrally import config, metrics, track
+from esrally.utils import histogram
 
 
 class MockClientFactory:
@@ -318,3 +319,31 @@ class InMemoryMetricsStoreTests(TestCase):
         for percentile, actual_percentile_value in actual_percentiles.items():
             self.assertAlmostEqual(expected_percentiles[percentile], actual_percentile_value, places=1,
                                    msg=str(percentile) + "th percentile differs")
+
+    def test_get_histogram(self):
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults", create=True)
+        warmup = histogram.Histogram(1000)
+        warmup.record_value(900)
+        normal = histogram.Histogram(1000)
+        for i in range(1, 101):
+            normal.record_value(i)
+        # a second snapshot for the same operation is merged
+        more = histogram.Histogram(1000)
+        more.record_value(200)
+        self.metrics_store.put_histogram_cluster_level("latency_histogram", warmup, "ms", operation="index",
+                                                       operation_type=track.OperationType.Index, sample_type=metrics.SampleType.Warmup)
+        self.metrics_store.put_histogram_cluster_level("latency_histogram", normal, "ms", operation="index",
+                                                       operation_type=track.OperationType.Index)
+        self.metrics_store.put_histogram_cluster_level("latency_histogram", more, "ms", operation="index",
+                                                       operation_type=track.OperationType.Index)
+
+        self.metrics_store.close()
+
+        self.metrics_store.open(EsMetricsTests.TRIAL_TIMESTAMP, "test", "append-no-conflicts", "defaults")
+
+        h = self.metrics_store.get_histogram("latency_histogram", operation="index", sample_type=metrics.SampleType.Normal)
+        self.assertEqual(101, h.total_count)
+        self.assertEqual(1, h.min)
+        self.assertEqual(200, h.max)
+        self.assertEqual(1, self.metrics_store.get_histogram("latency_histogram", sample_type=metrics.SampleType.Warmup).total_count)
+        self.assertIsNone(self.metrics_store.get_histogram("service_time_histogram"))
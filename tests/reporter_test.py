@@ -3,6 +3,7 @@ import datetime
 from unittest import TestCase
 
 from esrally import reporter, metrics, config, track
+from esrally.utils import histogram
 
 
 class ReporterTests(TestCase):
@@ -37,3 +38,33 @@ class ReporterTests(TestCase):
         self.assertEqual((500, 1000, 2000, "docs/s"), stats.op_metrics["index"]["throughput"])
         self.assertEqual(collections.OrderedDict([(50.0, 220), (100, 225)]), stats.op_metrics["index"]["latency"])
         self.assertEqual(collections.OrderedDict([(50.0, 200), (100, 215)]), stats.op_metrics["index"]["service_time"])
+
+    def test_calculate_latency_from_histograms(self):
+        cfg = config.Config()
+        cfg.add(config.Scope.application, "system", "env.name", "unittest")
+
+        store = metrics.InMemoryMetricsStore(config=cfg, clear=True)
+        store.open(datetime.datetime.now(), "test", "unittest", "unittest_car")
+
+        latency = histogram.Histogram(1000)
+        service_time = histogram.Histogram(1000)
+        for i in range(1, 21):
+            latency.record_value(i * 10)
+            service_time.record_value(i * 5)
+        warmup_latency = histogram.Histogram(1000)
+        warmup_latency.record_value(999)
+
+        store.put_histogram_cluster_level("latency_histogram", warmup_latency, unit="ms", operation="index",
+                                          operation_type=track.OperationType.Index, sample_type=metrics.SampleType.Warmup)
+        store.put_histogram_cluster_level("latency_histogram", latency, unit="ms", operation="index",
+                                          operation_type=track.OperationType.Index)
+        store.put_histogram_cluster_level("service_time_histogram", service_time, unit="ms", operation="index",
+                                          operation_type=track.OperationType.Index)
+
+        index = track.Task(operation=track.Operation(name="index", operation_type=track.OperationType.Index, params=None))
+        challenge = track.Challenge(name="unittest", description="", index_settings=None, schedule=[index])
+
+        stats = reporter.Stats(store, challenge)
+
+        self.assertEqual(collections.OrderedDict([(50.0, 100), (90.0, 180), (100, 200)]), stats.op_metrics["index"]["latency"])
+        self.assertEqual(collections.OrderedDict([(50.0, 50), (90.0, 90), (100, 100)]), stats.op_metrics["index"]["service_time"])
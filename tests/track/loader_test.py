@@ -126,3 +126,61 @@ class TrackSpecificationReaderTests(TestCase):
         self.assertEqual("secondary", resulting_track.indices[0].types[1].name)
         self.assertEqual(1, len(resulting_track.challenges))
         self.assertEqual("default-challenge", resulting_track.challenges[0].name)
+
+    def track_specification_with_task(self, task):
+        return {
+            "meta": {
+                "short-description": "short description for unit test",
+                "description": "longer description of this track for unit test",
+                "data-url": "https://localhost/data"
+            },
+            "indices": [],
+            "operations": [
+                {
+                    "name": "search",
+                    "operation-type": "search",
+                    "index": "index-historical"
+                }
+            ],
+            "challenges": [
+                {
+                    "name": "default-challenge",
+                    "description": "Default challenge",
+                    "schedule": [task]
+                }
+            ]
+        }
+
+    def test_parse_arrival_process(self):
+        reader = loader.TrackSpecificationReader()
+        resulting_track = reader("unittest", self.track_specification_with_task({
+            "operation": "search",
+            "target-throughput": 100,
+            "arrival-process": "bursty",
+            "burst-size": 5,
+            "open-loop": True,
+            "catch-up": "token-bucket",
+            "catch-up-burst": 3
+        }), "/mappings", "/data")
+        task = resulting_track.challenges[0].schedule[0]
+        self.assertEqual("bursty", task.arrival_process)
+        self.assertEqual(5, task.burst_size)
+        self.assertTrue(task.open_loop)
+        self.assertEqual("token-bucket", task.catch_up)
+        self.assertEqual(3, task.catch_up_burst)
+
+    def test_defaults_to_fixed_closed_loop_arrivals(self):
+        reader = loader.TrackSpecificationReader()
+        resulting_track = reader("unittest", self.track_specification_with_task({"operation": "search"}), "/mappings", "/data")
+        task = resulting_track.challenges[0].schedule[0]
+        self.assertEqual("fixed", task.arrival_process)
+        self.assertEqual(1, task.burst_size)
+        self.assertFalse(task.open_loop)
+        self.assertEqual("unbounded", task.catch_up)
+
+    def test_open_loop_requires_target_throughput(self):
+        reader = loader.TrackSpecificationReader()
+        with self.assertRaises(loader.TrackSyntaxError) as ctx:
+            reader("unittest", self.track_specification_with_task({"operation": "search", "open-loop": True}), "/mappings", "/data")
+        self.assertEqual("Track 'unittest' is invalid. Operation 'search' in challenge 'default-challenge' defines an arrival process or "
+                         "open-loop scheduling but no 'target-throughput'.", ctx.exception.args[0])
@@ -1,6 +1,13 @@
+import bz2
+import gzip
+import os
+import random
+import tempfile
 from unittest import TestCase
 
-from esrally.track import params
+from esrally import exceptions
+from esrally.track import params, track
+from esrally.utils import io
 
 
 class StringAsFileSource:
@@ -18,7 +25,7 @@ class StringAsFileSource:
 
     def readline(self):
         if self.current_index >= len(self.contents):
-            return ""
+            return b""
         line = self.contents[self.current_index]
         self.current_index += 1
         return line
@@ -30,45 +37,47 @@ class StringAsFileSource:
 class IndexDataReaderTests(TestCase):
     def test_read_bulk_larger_than_number_of_docs(self):
         data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}'
+            b'{"key": "value1"}\n',
+            b'{"key": "value2"}\n',
+            b'{"key": "value3"}\n',
+            b'{"key": "value4"}\n',
+            b'{"key": "value5"}\n'
         ]
         bulk_size = 50
 
         reader = params.IndexDataReader(data, docs_to_index=len(data), conflicting_ids=None, index_name="test_index", type_name="test_type",
                                         bulk_size=bulk_size, file_source=StringAsFileSource)
         with reader:
-            for bulk in reader:
-                self.assertEqual(len(data) * 2, len(bulk))
+            for docs_in_bulk, bulk in reader:
+                self.assertEqual(len(data), docs_in_bulk)
+                self.assertEqual(len(data) * 2, len(bulk.splitlines()))
 
     def test_read_bulk_with_offset(self):
         data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}'
+            b'{"key": "value1"}\n',
+            b'{"key": "value2"}\n',
+            b'{"key": "value3"}\n',
+            b'{"key": "value4"}\n',
+            b'{"key": "value5"}\n'
         ]
         bulk_size = 50
 
         reader = params.IndexDataReader(data, docs_to_index=len(data), conflicting_ids=None, index_name="test_index", type_name="test_type",
                                         bulk_size=bulk_size, offset=3, file_source=StringAsFileSource)
         with reader:
-            for bulk in reader:
-                self.assertEqual((len(data) - 3) * 2, len(bulk))
+            for docs_in_bulk, bulk in reader:
+                self.assertEqual(len(data) - 3, docs_in_bulk)
+                self.assertEqual((len(data) - 3) * 2, len(bulk.splitlines()))
 
     def test_read_bulk_smaller_than_number_of_docs(self):
         data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
+            b'{"key": "value1"}\n',
+            b'{"key": "value2"}\n',
+            b'{"key": "value3"}\n',
+            b'{"key": "value4"}\n',
+            b'{"key": "value5"}\n',
+            b'{"key": "value6"}\n',
+            b'{"key": "value7"}\n',
         ]
         bulk_size = 3
 
@@ -79,19 +88,20 @@ class IndexDataReaderTests(TestCase):
         expected_bulk_lengths = [6, 6, 2]
         with reader:
             bulk_index = 0
-            for bulk in reader:
-                self.assertEqual(expected_bulk_lengths[bulk_index], len(bulk))
+            for docs_in_bulk, bulk in reader:
+                self.assertEqual(expected_bulk_lengths[bulk_index], len(bulk.splitlines()))
+                self.assertEqual(expected_bulk_lengths[bulk_index] // 2, docs_in_bulk)
                 bulk_index += 1
 
     def test_read_bulk_smaller_than_number_of_docs_and_multiple_clients(self):
         data = [
-            '{"key": "value1"}',
-            '{"key": "value2"}',
-            '{"key": "value3"}',
-            '{"key": "value4"}',
-            '{"key": "value5"}',
-            '{"key": "value6"}',
-            '{"key": "value7"}',
+            b'{"key": "value1"}\n',
+            b'{"key": "value2"}\n',
+            b'{"key": "value3"}\n',
+            b'{"key": "value4"}\n',
+            b'{"key": "value5"}\n',
+            b'{"key": "value6"}\n',
+            b'{"key": "value7"}\n',
         ]
         bulk_size = 3
 
@@ -102,11 +112,273 @@ class IndexDataReaderTests(TestCase):
         expected_bulk_lengths = [6, 4]
         with reader:
             bulk_index = 0
-            for bulk in reader:
-                self.assertEqual(expected_bulk_lengths[bulk_index], len(bulk))
+            for docs_in_bulk, bulk in reader:
+                self.assertEqual(expected_bulk_lengths[bulk_index], len(bulk.splitlines()))
+                self.assertEqual(expected_bulk_lengths[bulk_index] // 2, docs_in_bulk)
                 bulk_index += 1
 
 
+    def test_read_bulk_as_serialized_body(self):
+        data = [
+            b'{"key": "value1"}\n',
+            # the last line of a file may lack a newline
+            b'{"key": "value2"}'
+        ]
+        reader = params.IndexDataReader(data, docs_to_index=len(data), conflicting_ids=None, index_name="test_index", type_name="test_type",
+                                        bulk_size=50, file_source=StringAsFileSource)
+        with reader:
+            self.assertEqual([(2, b'{"index": {"_index": "test_index", "_type": "test_type"}}\n'
+                                 b'{"key": "value1"}\n'
+                                 b'{"index": {"_index": "test_index", "_type": "test_type"}}\n'
+                                 b'{"key": "value2"}\n')], list(reader))
+
+    def test_read_bulk_with_conflicting_ids(self):
+        data = [
+            b'{"key": "value1"}\n',
+            b'{"key": "value2"}\n'
+        ]
+        reader = params.IndexDataReader(data, docs_to_index=len(data), conflicting_ids=["         0", "         1"],
+                                        index_name="test_index", type_name="test_type", bulk_size=1, file_source=StringAsFileSource)
+        with reader:
+            docs_in_bulk, bulk = next(reader)
+            self.assertEqual(1, docs_in_bulk)
+            self.assertEqual(b'{"index": {"_index": "test_index", "_type": "test_type", "_id": "         0"}}\n{"key": "value1"}\n', bulk)
+
+
+class MmapSourceTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def data_file(self, contents):
+        file_name = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(file_name, "wb") as f:
+            f.write(contents)
+        return file_name
+
+    def test_read_lines_one_by_one(self):
+        source = params.MmapSource.open(self.data_file(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}'), "rb")
+        source.seek(18)
+        self.assertEqual(b'{"key": "value2"}\n', source.readline())
+        self.assertEqual(b'{"key": "value3"}', source.readline())
+        self.assertEqual(b"", source.readline())
+        source.close()
+
+    def test_read_multiple_lines_at_once(self):
+        source = params.MmapSource.open(self.data_file(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}'), "rb")
+        lines, view = source.read_lines(2)
+        self.assertEqual(2, lines)
+        self.assertEqual(b'{"key": "value1"}\n{"key": "value2"}\n', view)
+        # the last line is not terminated
+        lines, view = source.read_lines(2)
+        self.assertEqual(1, lines)
+        self.assertEqual(b'{"key": "value3"}', view)
+        lines, view = source.read_lines(2)
+        self.assertEqual(0, lines)
+        del view
+        source.close()
+
+    def test_read_long_lines(self):
+        line = b'{"key": "' + b"x" * 8192 + b'"}\n'
+        source = params.MmapSource.open(self.data_file(line * 5), "rb")
+        lines, view = source.read_lines(3)
+        self.assertEqual(3, lines)
+        self.assertEqual(line * 3, view)
+        del view
+        source.close()
+
+    def test_read_empty_file(self):
+        source = params.MmapSource.open(self.data_file(b""), "rb")
+        self.assertEqual(b"", source.readline())
+        self.assertEqual(0, source.read_lines(10)[0])
+        source.close()
+
+    def test_create_bulks_from_mapped_file(self):
+        data_file = self.data_file(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}\n{"key": "value4"}')
+        bulks = {}
+        for file_source in [StringAsFileSource, params.MmapSource]:
+            contents = data_file
+            if file_source == StringAsFileSource:
+                with open(data_file, "rb") as f:
+                    contents = f.readlines()
+            reader = params.IndexDataReader(contents, docs_to_index=3, conflicting_ids=None, index_name="test_index",
+                                            type_name="test_type", bulk_size=2, offset=1, file_source=file_source)
+            with reader:
+                bulks[file_source] = list(reader)
+        self.assertEqual([2, 1], [docs for docs, _ in bulks[params.MmapSource]])
+        # reading line by line and reading blocks of lines produce identical bulks
+        self.assertEqual(bulks[StringAsFileSource], bulks[params.MmapSource])
+
+    def test_sends_documents_as_stored(self):
+        data_file = self.data_file(b'{"key": "value1"} \r\n{"key": "value2"}')
+        reader = params.IndexDataReader(data_file, docs_to_index=2, conflicting_ids=None, index_name="test_index", type_name="test_type",
+                                        bulk_size=2, file_source=params.MmapSource)
+        with reader:
+            docs_in_bulk, bulk = next(reader)
+        self.assertEqual(2, docs_in_bulk)
+        self.assertEqual(b'{"index": {"_index": "test_index", "_type": "test_type"}}\n{"key": "value1"} \r\n'
+                         b'{"index": {"_index": "test_index", "_type": "test_type"}}\n{"key": "value2"}\n', bulk)
+
+
+class CompressedSourceTests(TestCase):
+    LINES = [b'{"key": "value%d"}\n' % i for i in range(10)]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def archive(self, contents, member_size, extension=".bz2", compress=bz2.compress):
+        archive_path = os.path.join(self.tmp_dir.name, "documents.json%s" % extension)
+        with open(archive_path, "wb") as f:
+            # members end in the middle of lines
+            for i in range(0, len(contents), member_size):
+                f.write(compress(contents[i:i + member_size]))
+        io.prepare_block_index(archive_path, min_block_size=1)
+        return archive_path
+
+    def test_skip_to_each_line(self):
+        for extension, compress in [(".bz2", bz2.compress), (".gz", gzip.compress)]:
+            for member_size in [7, 19, 1000]:
+                archive_path = self.archive(b"".join(CompressedSourceTests.LINES), member_size, extension, compress)
+                for number_of_lines_to_skip in range(len(CompressedSourceTests.LINES) + 1):
+                    source = params.CompressedSource.open(archive_path, "rb")
+                    io.skip_lines(archive_path, source, number_of_lines_to_skip)
+                    lines, data = source.read_lines(len(CompressedSourceTests.LINES))
+                    self.assertEqual(len(CompressedSourceTests.LINES) - number_of_lines_to_skip, lines)
+                    self.assertEqual(b"".join(CompressedSourceTests.LINES[number_of_lines_to_skip:]), data)
+                    source.close()
+
+    def test_read_lines_one_by_one(self):
+        source = params.CompressedSource.open(self.archive(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}', 10), "rb")
+        source.seek(18)
+        self.assertEqual(b'{"key": "value2"}\n', source.readline())
+        self.assertEqual(b'{"key": "value3"}', source.readline())
+        self.assertEqual(b"", source.readline())
+        source.close()
+
+    def test_read_multiple_lines_at_once(self):
+        source = params.CompressedSource.open(self.archive(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}', 10), "rb")
+        self.assertEqual((2, b'{"key": "value1"}\n{"key": "value2"}\n'), source.read_lines(2))
+        # the last line is not terminated
+        self.assertEqual((1, b'{"key": "value3"}'), source.read_lines(2))
+        self.assertEqual((0, b""), source.read_lines(2))
+        source.close()
+
+    def test_requires_block_index(self):
+        archive_path = os.path.join(self.tmp_dir.name, "documents.json.bz2")
+        with open(archive_path, "wb") as f:
+            f.write(bz2.compress(b"".join(CompressedSourceTests.LINES)))
+        with self.assertRaisesRegex(exceptions.DataError, "No valid block index found"):
+            params.CompressedSource.open(archive_path, "rb")
+
+    def test_create_bulks_from_archive(self):
+        archive_path = self.archive(b'{"key": "value1"}\n{"key": "value2"}\n{"key": "value3"}\n{"key": "value4"}', 10)
+        reader = params.IndexDataReader(archive_path, docs_to_index=3, conflicting_ids=None, index_name="test_index",
+                                        type_name="test_type", bulk_size=2, offset=1, file_source=params.CompressedSource)
+        with reader:
+            bulks = list(reader)
+        self.assertEqual([
+            (2, b'{"index": {"_index": "test_index", "_type": "test_type"}}\n{"key": "value2"}\n'
+                b'{"index": {"_index": "test_index", "_type": "test_type"}}\n{"key": "value3"}\n'),
+            (1, b'{"index": {"_index": "test_index", "_type": "test_type"}}\n{"key": "value4"}\n')
+        ], bulks)
+
+
+class BulkCacheTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_file = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(self.data_file, "wb") as f:
+            f.writelines(b'{"key": "value%d"}\n' % i for i in range(10))
+        self.cache_dir = os.path.join(self.tmp_dir.name, "bulk-cache")
+        self.index = track.Index(name="test_index", types=[
+            track.Type(name="test_type", mapping_file=None, document_file=self.data_file, number_of_documents=10,
+                       document_checksum="abc", bulk_cache_dir=self.cache_dir)
+        ])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def bulks(self, client_index=0, id_conflicts=None, seed=None):
+        return [p["body"] for p in params.bulk_data_based(2, client_index, [self.index], 2, id_conflicts, None, seed)]
+
+    def test_reads_cached_bulks_in_subsequent_benchmarks(self):
+        bulks = self.bulks()
+        self.assertEqual(3, len(bulks))
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+        # the corpus is not needed anymore
+        os.remove(self.data_file)
+        self.assertEqual(bulks, self.bulks())
+
+    def test_caches_bulks_per_client(self):
+        self.bulks(client_index=0)
+        self.bulks(client_index=1)
+        self.assertEqual(4, len(os.listdir(self.cache_dir)))
+
+    def test_caches_conflicting_ids_only_with_seed(self):
+        self.bulks(id_conflicts=params.IndexIdConflict.RandomConflicts)
+        self.assertFalse(os.path.exists(self.cache_dir))
+        bulks = self.bulks(id_conflicts=params.IndexIdConflict.RandomConflicts, seed=42)
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+        os.remove(self.data_file)
+        self.assertEqual(bulks, self.bulks(id_conflicts=params.IndexIdConflict.RandomConflicts, seed=42))
+
+    def test_discards_incomplete_cache(self):
+        cache_file = os.path.join(self.cache_dir, "test.bulks")
+        reader = params.IndexDataReader([b'{"key": "value1"}\n', b'{"key": "value2"}\n'], docs_to_index=2, conflicting_ids=None,
+                                        index_name="test_index", type_name="test_type", bulk_size=1, file_source=StringAsFileSource)
+        with params.BulkCacheWriter(cache_file, reader, docs_to_index=2) as writer:
+            next(writer)
+        self.assertEqual([], os.listdir(self.cache_dir))
+        self.assertFalse(params.BulkCacheReader.is_valid(cache_file))
+
+
+class BulkIndexParamSourceTests(TestCase):
+    def test_passes_retry_settings_to_runner(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_file = os.path.join(tmp_dir, "documents.json")
+            with open(data_file, "wb") as f:
+                f.writelines(b'{"key": "value%d"}\n' % i for i in range(2))
+            index = track.Index(name="test_index", types=[track.Type(name="test_type", mapping_file=None, document_file=data_file,
+                                                                      number_of_documents=2)])
+            source = params.BulkIndexParamSource([index], {"bulk-size": 2, "retries": 3, "retry-backoff": 0.5})
+
+            bulk_params = source.partition(0, 1).params()
+
+        self.assertEqual(3, bulk_params["retries"])
+        self.assertEqual(0.5, bulk_params["retry-backoff"])
+
+    def test_rejects_negative_retries(self):
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, "'retries' must be non-negative but was -1"):
+            params.BulkIndexParamSource([], {"bulk-size": 2, "retries": -1})
+
+
+class SearchParamSourceTests(TestCase):
+    def test_serializes_query_once_per_partition(self):
+        index = track.Index(name="test_index", types=[track.Type(name="test_type", mapping_file=None)])
+        source = params.SearchParamSource([index], {"body": {"query": {"term": {"name": "rally"}}}, "cache": True})
+
+        partition = source.partition(0, 1)
+
+        p = partition.params()
+        self.assertEqual("test_index", p["index"])
+        self.assertEqual("test_type", p["type"])
+        self.assertTrue(p["use_request_cache"])
+        self.assertEqual({"query": {"term": {"name": "rally"}}}, p["body"])
+        self.assertEqual(b'{"query":{"term":{"name":"rally"}}}', p["serialized-body"])
+        self.assertIs(p["serialized-body"], partition.params()["serialized-body"])
+        self.assertEqual("full", p["response_parsing"])
+
+    def test_rejects_unknown_response_parsing(self):
+        index = track.Index(name="test_index", types=[track.Type(name="test_type", mapping_file=None)])
+        with self.assertRaisesRegex(exceptions.InvalidSyntax, r"Unknown response parsing \[streaming\]"):
+            params.SearchParamSource([index], {"response-parsing": "streaming"})
+
+
 class InvocationGeneratorTests(TestCase):
     class TestIndexReader:
         def __init__(self, data):
@@ -204,10 +476,40 @@ class InvocationGeneratorTests(TestCase):
     def test_build_conflicting_ids(self):
         self.assertIsNone(params.build_conflicting_ids(params.IndexIdConflict.NoConflicts, 3, 0))
         self.assertEqual(["         0", "         1", "         2"],
-                         params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 3, 0))
+                         list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 3, 0)))
         # we cannot tell anything specific about the contents...
         self.assertEqual(3, len(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 3, 0)))
 
+    def test_build_conflicting_ids_with_offset(self):
+        self.assertEqual(["       100", "       101"],
+                         list(params.build_conflicting_ids(params.IndexIdConflict.SequentialConflicts, 2, 100)))
+
+    def test_random_conflicting_ids_are_reproducible(self):
+        ids = params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 1000, 500, random.Random(42))
+        same_ids = params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 1000, 500, random.Random(42))
+        self.assertEqual(list(ids), list(same_ids))
+        # accessing ids in a different order yields the same ids
+        self.assertEqual([ids[i] for i in reversed(range(1000))], list(reversed(list(ids))))
+        self.assertNotEqual(list(ids), list(params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 1000, 500,
+                                                                         random.Random(43))))
+
+    def test_random_conflicting_ids_are_uniformly_distributed(self):
+        docs = 10000
+        ids = [int(i) for i in params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, docs, 500, random.Random(42))]
+        self.assertGreaterEqual(min(ids), 500)
+        self.assertLessEqual(max(ids), 500 + docs)
+        # each tenth of the range gets roughly a tenth of all ids
+        for tenth in range(10):
+            count = sum(1 for i in ids if 500 + tenth * docs // 10 <= i < 500 + (tenth + 1) * docs // 10)
+            self.assertAlmostEqual(docs // 10, count, delta=docs // 50)
+
+    def test_conflicting_ids_do_not_materialize_all_ids(self):
+        ids = params.build_conflicting_ids(params.IndexIdConflict.RandomConflicts, 10 ** 9, 0)
+        self.assertEqual(10 ** 9, len(ids))
+        self.assertEqual(10, len(ids[10 ** 9 - 1]))
+        with self.assertRaises(IndexError):
+            ids[10 ** 9]
+
 
 class ParamsRegistrationTests(TestCase):
     @staticmethod
@@ -0,0 +1,56 @@
+import datetime
+import decimal
+from unittest import TestCase
+
+from esrally.utils import codec
+
+
+class CodecTests(TestCase):
+    DOC = {"name": "latency", "value": 12.5, "unit": "ms", "sample-type": "normal", "relative-time": 1200000,
+           "meta": {"tag_env": "nightly", "distribution_version": "5.0.0"}, "success": True, "error": None, "text": "Grüße"}
+
+    def test_codecs_produce_equal_output(self):
+        outputs = {c.name: c.dumps(CodecTests.DOC) for c in codec.available_codecs()}
+        self.assertEqual(1, len(set(outputs.values())), outputs)
+        for c in codec.available_codecs():
+            self.assertEqual(CodecTests.DOC, c.loads(outputs[c.name]))
+
+    def test_encodes_compact_utf8(self):
+        for c in codec.available_codecs():
+            self.assertEqual('{"text":"Grüße","items":[1,2]}'.encode("utf-8"), c.dumps({"text": "Grüße", "items": [1, 2]}))
+
+    def test_encodes_additional_types(self):
+        for c in codec.available_codecs():
+            self.assertEqual(b'{"d":"2016-08-10","n":1.5}', c.dumps({"d": datetime.date(2016, 8, 10), "n": decimal.Decimal("1.5")}))
+            with self.assertRaises(TypeError):
+                c.dumps({"o": object()})
+
+    def test_decodes_str_and_bytes(self):
+        for c in codec.available_codecs():
+            self.assertEqual({"errors": False}, c.loads('{"errors": false}'))
+            self.assertEqual({"errors": False}, c.loads(b'{"errors": false}'))
+
+    def test_decodes_64_bit_integers(self):
+        for c in codec.available_codecs():
+            for value in [2 ** 64 - 1, 2 ** 63, -2 ** 63]:
+                decoded = c.loads(b'{"count": %d}' % value)["count"]
+                self.assertIsInstance(decoded, int)
+                self.assertEqual(value, decoded)
+                self.assertEqual({"count": value}, c.loads('{"count": %d}' % value))
+
+    def test_decodes_large_integers(self):
+        self.assertEqual({"count": 2 ** 70 + 1}, codec.StdlibCodec().loads(b'{"count": %d}' % (2 ** 70 + 1)))
+
+    def test_decodes_out_of_range_numbers(self):
+        for c in codec.available_codecs():
+            self.assertEqual([float("inf")], c.loads(b"[1e400]"))
+
+    def test_encodes_large_integers(self):
+        for c in codec.available_codecs():
+            self.assertEqual(b'{"count":1180591620717411303425}', c.dumps({"count": 2 ** 70 + 1}))
+            self.assertEqual(b'[-9223372036854775809]', c.dumps([-2 ** 63 - 1]))
+
+    def test_rejects_invalid_json(self):
+        for c in codec.available_codecs():
+            with self.assertRaises(ValueError):
+                c.loads(b'{"errors": ')
@@ -0,0 +1,104 @@
+from unittest import TestCase
+
+from esrally.utils import histogram
+
+
+class HistogramTests(TestCase):
+    def test_rejects_invalid_precision(self):
+        with self.assertRaises(ValueError):
+            histogram.Histogram(1000, significant_digits=0)
+        with self.assertRaises(ValueError):
+            histogram.Histogram(1000, significant_digits=6)
+
+    def test_empty_histogram(self):
+        h = histogram.Histogram(1000)
+        self.assertEqual(0, h.total_count)
+        self.assertIsNone(h.mean)
+        self.assertEqual({}, h.values_at_percentiles([50, 100]))
+
+    def test_values_below_sub_bucket_count_are_exact(self):
+        h = histogram.Histogram(3600 * 1000, significant_digits=3)
+        for i in range(1, 1001):
+            h.record_value(i)
+
+        self.assertEqual(1000, h.total_count)
+        self.assertEqual(1, h.min)
+        self.assertEqual(1000, h.max)
+        self.assertEqual(500.5, h.mean)
+        self.assertEqual(500, h.value_at_percentile(50))
+        self.assertEqual(990, h.value_at_percentile(99))
+        self.assertEqual(1000, h.value_at_percentile(100))
+
+    def test_values_are_within_precision(self):
+        h = histogram.Histogram(3600 * 1000, significant_digits=3, resolution=0.001)
+        for i in range(1, 100001):
+            h.record_value(i * 1.5)
+
+        percentiles = h.values_at_percentiles([50, 90, 99, 99.9, 100])
+        self.assertEqual([50, 90, 99, 99.9, 100], list(percentiles.keys()))
+        self.assertAlmostEqual(75000, percentiles[50], delta=75)
+        self.assertAlmostEqual(135000, percentiles[90], delta=135)
+        self.assertAlmostEqual(148500, percentiles[99], delta=148)
+        self.assertAlmostEqual(149850, percentiles[99.9], delta=149)
+        self.assertEqual(150000, percentiles[100])
+
+    def test_values_above_highest_trackable_value_are_clamped(self):
+        h = histogram.Histogram(1000)
+        h.record_value(10)
+        h.record_value(5000)
+
+        self.assertEqual(2, h.total_count)
+        self.assertEqual(10, h.value_at_percentile(50))
+        self.assertEqual(5000, h.value_at_percentile(100))
+
+    def test_merge_histograms(self):
+        h1 = histogram.Histogram(1000)
+        h2 = histogram.Histogram(1000)
+        for i in range(1, 51):
+            h1.record_value(i)
+        for i in range(51, 101):
+            h2.record_value(i)
+
+        h1.add(h2)
+
+        self.assertEqual(100, h1.total_count)
+        self.assertEqual(1, h1.min)
+        self.assertEqual(100, h1.max)
+        self.assertEqual(50, h1.value_at_percentile(50))
+        self.assertEqual(90, h1.value_at_percentile(90))
+
+    def test_cannot_merge_histograms_with_different_layout(self):
+        with self.assertRaises(ValueError):
+            histogram.Histogram(1000, significant_digits=2).add(histogram.Histogram(1000, significant_digits=3))
+
+    def test_snapshot_roundtrip(self):
+        h = histogram.Histogram(3600 * 1000, significant_digits=2, resolution=0.001)
+        for v in [0.5, 1.25, 17.3, 17.3, 2500.0]:
+            h.record_value(v)
+
+        snapshot = h.to_snapshot()
+        # sparse representation
+        self.assertEqual(4, len(snapshot["counts"]))
+
+        restored = histogram.Histogram.from_snapshot(snapshot)
+        self.assertEqual(h.total_count, restored.total_count)
+        self.assertEqual(h.min, restored.min)
+        self.assertEqual(h.max, restored.max)
+        self.assertEqual(h.values_at_percentiles([25, 50, 75, 100]), restored.values_at_percentiles([25, 50, 75, 100]))
+
+    def test_merge_and_lookup_visit_only_recorded_range(self):
+        h1 = histogram.Histogram(3600 * 1000, significant_digits=3, resolution=0.001)
+        h2 = histogram.Histogram(3600 * 1000, significant_digits=3, resolution=0.001)
+        h1.record_value(1.5)
+        h2.record_value(20.0)
+        h2.record_value(7.0)
+
+        h1.add(h2)
+        h1.add(histogram.Histogram(3600 * 1000, significant_digits=3, resolution=0.001))
+
+        non_zero_counts = list(h1._non_zero_counts())
+        self.assertEqual(3, len(non_zero_counts))
+        self.assertEqual((h1._min_index, h1._max_index), (non_zero_counts[0][0], non_zero_counts[-1][0]))
+        self.assertEqual(3, h1.total_count)
+        self.assertAlmostEqual(7.0, h1.value_at_percentile(50), delta=0.01)
+        self.assertEqual(20.0, h1.value_at_percentile(100))
@@ -1,4 +1,10 @@
+import bz2
+import concurrent.futures
+import gzip
 import os
+import struct
+import tempfile
+import zlib
 from unittest import TestCase
 
 from esrally.utils import io
@@ -43,3 +49,248 @@ class IoTests(TestCase):
         self.assertEqual("/already/a/normalized/path", io.normalize_path("/already/a/normalized/path"))
         self.assertEqual("/not/normalized", io.normalize_path("/not/normalized/path/../"))
         self.assertEqual(os.getenv("HOME"), io.normalize_path("~/Documents/.."))
+
+
+class ChecksumTests(TestCase):
+    def test_stores_checksum_next_to_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "documents.json")
+            with open(file_path, "wb") as f:
+                f.write(b'{"key": "value"}\n')
+            self.assertEqual("6418064de426ecf8f0e508c751e60a0079ba044d", io.checksum(file_path))
+            with open("%s.sha1" % file_path, "rt") as f:
+                self.assertEqual("6418064de426ecf8f0e508c751e60a0079ba044d", f.read())
+            # the stored checksum is reused
+            with open("%s.sha1" % file_path, "wt") as f:
+                f.write("0" * 40)
+            self.assertEqual("0" * 40, io.checksum(file_path))
+
+
+class FileOffsetTableTests(TestCase):
+    LINES = [b'{"key": "value%d"}\n' % i for i in range(10)]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_file_path = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(self.data_file_path, "wb") as f:
+            f.writelines(FileOffsetTableTests.LINES)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_skips_to_each_line(self):
+        for number_of_lines_to_skip in range(len(FileOffsetTableTests.LINES) + 1):
+            with open(self.data_file_path, "rb") as data_file:
+                io.skip_lines(self.data_file_path, data_file, number_of_lines_to_skip)
+                self.assertEqual(b"".join(FileOffsetTableTests.LINES[number_of_lines_to_skip:]), data_file.read())
+
+    def test_skip_lines_without_offset_table(self):
+        self.assert_skips_to_each_line()
+
+    def test_skip_lines_with_offset_for_each_line(self):
+        io.prepare_file_offset_table(self.data_file_path, granularity=1)
+        self.assertEqual(io.OFFSET_TABLE_HEADER.size + 10 * io.OFFSET_TABLE_ENTRY.size,
+                         os.path.getsize(io.offset_table_path(self.data_file_path)))
+        self.assert_skips_to_each_line()
+
+    def test_skip_lines_with_coarse_offset_table(self):
+        io.prepare_file_offset_table(self.data_file_path, granularity=3)
+        # offsets of the lines 0, 3, 6 and 9
+        self.assertEqual(io.OFFSET_TABLE_HEADER.size + 4 * io.OFFSET_TABLE_ENTRY.size,
+                         os.path.getsize(io.offset_table_path(self.data_file_path)))
+        self.assert_skips_to_each_line()
+
+    def test_recreates_offset_table_if_granularity_changes(self):
+        io.prepare_file_offset_table(self.data_file_path, granularity=5)
+        io.prepare_file_offset_table(self.data_file_path, granularity=2)
+        self.assertEqual(io.OFFSET_TABLE_HEADER.size + 5 * io.OFFSET_TABLE_ENTRY.size,
+                         os.path.getsize(io.offset_table_path(self.data_file_path)))
+        self.assert_skips_to_each_line()
+
+    def test_ignores_invalid_offset_table(self):
+        with open(io.offset_table_path(self.data_file_path), "wb") as f:
+            f.write(b"50000;123456\n")
+        self.assert_skips_to_each_line()
+
+    def expected_offsets(self, granularity):
+        offsets = []
+        offset = 0
+        for line_number, line in enumerate(FileOffsetTableTests.LINES):
+            if line_number % granularity == 0:
+                offsets.append(offset)
+            offset += len(line)
+        return offsets
+
+    def offset_table(self):
+        with open(io.offset_table_path(self.data_file_path), "rb") as f:
+            magic, granularity, number_of_lines = io.OFFSET_TABLE_HEADER.unpack(f.read(io.OFFSET_TABLE_HEADER.size))
+            entries = f.read()
+        return granularity, number_of_lines, [io.OFFSET_TABLE_ENTRY.unpack_from(entries, i)[0]
+                                              for i in range(0, len(entries), io.OFFSET_TABLE_ENTRY.size)]
+
+    def assert_parallel_offset_table(self):
+        for granularity in [1, 2, 3, 10, 11]:
+            # ranges end in the middle of lines
+            io.prepare_file_offset_table(self.data_file_path, granularity=granularity, max_workers=2, range_size=7)
+            self.assertEqual((granularity, 10, self.expected_offsets(granularity)), self.offset_table())
+            self.assert_skips_to_each_line()
+
+    def test_prepare_offset_table_in_parallel(self):
+        self.assert_parallel_offset_table()
+
+    def test_prepare_offset_table_in_parallel_without_numpy(self):
+        np = io.np
+        io.np = None
+        try:
+            self.assert_parallel_offset_table()
+        finally:
+            io.np = np
+
+    def test_prepare_offset_table_for_unterminated_last_line(self):
+        with open(self.data_file_path, "ab") as f:
+            f.write(b'{"key": "value10"}')
+        io.prepare_file_offset_table(self.data_file_path, granularity=1, range_size=16)
+        granularity, number_of_lines, offsets = self.offset_table()
+        self.assertEqual(11, number_of_lines)
+        self.assertEqual(self.expected_offsets(1) + [sum(len(line) for line in FileOffsetTableTests.LINES)], offsets)
+
+
+    def test_bounds_pending_ranges(self):
+        submitted = []
+        consumed = []
+
+        def square(x):
+            return x * x
+
+        class RecordingPool(concurrent.futures.ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                submitted.append(args[0])
+                return super().submit(fn, *args)
+
+        with RecordingPool(max_workers=2) as pool:
+            for result in io._map_ordered(pool, square, [(x,) for x in range(10)], max_pending=3):
+                # never more than max_pending results are computed ahead of the consumer
+                self.assertLessEqual(len(submitted) - len(consumed), 3)
+                consumed.append(result)
+        self.assertEqual([x * x for x in range(10)], consumed)
+
+class BlockIndexTests(TestCase):
+    DATA = b"".join(b'{"key": "value%d"}\n' % i for i in range(10))
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def archive(self, extension, compress, members):
+        archive_path = os.path.join(self.tmp_dir.name, "documents.json%s" % extension)
+        with open(archive_path, "wb") as f:
+            for member in members:
+                f.write(compress(member))
+        return archive_path
+
+    def members(self, member_size):
+        # members end in the middle of lines
+        return [BlockIndexTests.DATA[i:i + member_size] for i in range(0, len(BlockIndexTests.DATA), member_size)]
+
+    def expected_uncompressed_offsets_and_newlines(self, member_size):
+        offsets = range(0, len(BlockIndexTests.DATA), member_size)
+        return [(offset, BlockIndexTests.DATA[:offset].count(b"\n")) for offset in offsets]
+
+    def assert_block_index(self, extension, compress):
+        members = self.members(25)
+        archive_path = self.archive(extension, compress, members)
+        self.assertEqual((len(BlockIndexTests.DATA), 8), io.prepare_block_index(archive_path, min_block_size=1))
+        blocks = io.read_block_index(archive_path)
+        self.assertEqual(self.expected_uncompressed_offsets_and_newlines(25), [b[1:] for b in blocks])
+        compressed_offsets = [0]
+        for member in members[:-1]:
+            compressed_offsets.append(compressed_offsets[-1] + len(compress(member)))
+        self.assertEqual(compressed_offsets, [b[0] for b in blocks])
+
+    def test_prepare_block_index_for_multi_member_bz2_archive(self):
+        self.assert_block_index(".bz2", bz2.compress)
+
+    def test_prepare_block_index_for_multi_member_gzip_archive(self):
+        self.assert_block_index(".gz", gzip.compress)
+
+    def test_merges_small_members(self):
+        archive_path = self.archive(".bz2", bz2.compress, self.members(25))
+        self.assertEqual((len(BlockIndexTests.DATA), 4), io.prepare_block_index(archive_path, min_block_size=50))
+        self.assertEqual([0, 50, 100, 150], [b[1] for b in io.read_block_index(archive_path)])
+
+    def test_prepare_block_index_for_single_member_archive(self):
+        archive_path = self.archive(".gz", gzip.compress, [BlockIndexTests.DATA])
+        self.assertEqual((len(BlockIndexTests.DATA), 1), io.prepare_block_index(archive_path))
+        self.assertEqual([(0, 0, 0)], io.read_block_index(archive_path))
+
+    def test_rejects_truncated_archive(self):
+        archive_path = os.path.join(self.tmp_dir.name, "documents.json.bz2")
+        with open(archive_path, "wb") as f:
+            f.write(bz2.compress(BlockIndexTests.DATA)[:-10])
+        with self.assertRaisesRegex(RuntimeError, "is truncated"):
+            io.prepare_block_index(archive_path)
+        self.assertFalse(os.path.exists(io.block_index_path(archive_path)))
+        self.assertIsNone(io.read_block_index(archive_path))
+
+    def test_streamable_archives(self):
+        self.assertTrue(io.is_streamable("documents.json.bz2"))
+        self.assertTrue(io.is_streamable("documents.json.gz"))
+        self.assertFalse(io.is_streamable("documents.json.zip"))
+        self.assertFalse(io.is_streamable("documents.tar.gz"))
+
+
+def bgzf_member(data):
+    # a gzip member with the "BC" extra subfield that contains the total member size minus one (see the BGZF specification)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    member_size = 18 + len(deflated) + 8
+    header = struct.pack("<4sIBBH2sHH", b"\x1f\x8b\x08\x04", 0, 0, 255, 6, b"BC", 2, member_size - 1)
+    return header + deflated + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+class DecompressTests(TestCase):
+    DATA = b"".join(b'{"key": "value%d"}\n' % i for i in range(1000))
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_file_path = os.path.join(self.tmp_dir.name, "documents.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def archive(self, extension, compress, member_size):
+        archive_path = "%s%s" % (self.data_file_path, extension)
+        with open(archive_path, "wb") as f:
+            for i in range(0, len(DecompressTests.DATA), member_size):
+                f.write(compress(DecompressTests.DATA[i:i + member_size]))
+        return archive_path
+
+    def assert_decompressed(self, archive_path, expected_ranges):
+        self.assertEqual(expected_ranges, len(io._member_ranges(archive_path, range_size=1)))
+        io._decompress_file(archive_path, self.data_file_path, max_workers=2, range_size=1)
+        with open(self.data_file_path, "rb") as f:
+            self.assertEqual(DecompressTests.DATA, f.read())
+        # no temporary parts are left behind
+        self.assertEqual(sorted([os.path.basename(archive_path), "documents.json"]), sorted(os.listdir(self.tmp_dir.name)))
+
+    def test_decompress_multi_member_bz2_archive_in_parallel(self):
+        self.assert_decompressed(self.archive(".bz2", bz2.compress, member_size=1000), expected_ranges=20)
+
+    def test_decompress_bgzf_archive_in_parallel(self):
+        self.assert_decompressed(self.archive(".gz", bgzf_member, member_size=1000), expected_ranges=20)
+
+    def test_decompress_plain_gzip_archive_sequentially(self):
+        # member boundaries of regular gzip archives cannot be determined without decompressing them
+        self.assert_decompressed(self.archive(".gz", gzip.compress, member_size=1000), expected_ranges=1)
+
+    def test_decompress_single_member_bz2_archive(self):
+        io.decompress(self.archive(".bz2", bz2.compress, member_size=len(DecompressTests.DATA)), self.tmp_dir.name)
+        with open(self.data_file_path, "rb") as f:
+            self.assertEqual(DecompressTests.DATA, f.read())
+
+    def test_rejects_range_that_ends_within_a_member(self):
+        archive_path = self.archive(".bz2", bz2.compress, member_size=len(DecompressTests.DATA))
+        self.assertFalse(io._decompress_range(archive_path, 0, os.path.getsize(archive_path) // 2,
+                                              os.path.join(self.tmp_dir.name, "0.part")))